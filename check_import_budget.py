@@ -0,0 +1,57 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Cumulative import time budget per module, in milliseconds, checked against the
+# median of RUNS fresh interpreters. Budgets leave about half again the typical
+# median as headroom; json and logging alone take most of config_loader's. Imports
+# must also succeed without DATABASE_URL, i.e. without touching the database.
+BUDGETS_MS = {
+    "config_loader": 40,
+    "traffic_recorder": 50,
+    "logging_setup": 60,
+    "shared_state": 120,  # mostly asyncio, which main imports anyway
+    "models": 400,
+    "migrations": 450,
+    "main": 900,  # discord.py and httpx are most of it
+}
+RUNS = 5
+
+
+def measure_import_ms(module):
+    """Cumulative import time of module in a fresh interpreter, via -X importtime"""
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import timing found for {module}")
+
+
+def main():
+    over_budget = False
+    for module, budget in BUDGETS_MS.items():
+        try:
+            elapsed = statistics.median(measure_import_ms(module) for _ in range(RUNS))
+        except RuntimeError as e:
+            print(f"{module:<20} FAILED   {e}")
+            over_budget = True
+            continue
+        status = "ok" if elapsed <= budget else "OVER"
+        over_budget |= elapsed > budget
+        print(f"{module:<20} {elapsed:8.1f}ms / {budget}ms  {status}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import discord
+
+# Discord client profiles, picked with settings["discord_client_profile"] (read at startup).
+#   "default"  discord.py defaults plus message content: every non-privileged event,
+#              a 1000-message cache and the usual user/emoji/sticker caches
+#   "lean"     only what Yuno reads: guild and DM messages (with content), guild
+#              channels/roles for clean_content, no message cache and no member cache.
+#              Replies are recognised from the referenced message Discord sends along
+#              with the event, so no cache is needed for them either.
+PROFILES = ("default", "lean")
+
+
+def client_options(profile="default", typing_prefetch=False):
+    """Keyword arguments for commands.Bot / AutoShardedBot for a profile"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown discord_client_profile {profile!r} (expected one of {', '.join(PROFILES)})")
+
+    if profile == "lean":
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.message_content = True
+        # on_typing only does anything with typing prefetch enabled
+        intents.guild_typing = intents.dm_typing = typing_prefetch
+        return {
+            "intents": intents,
+            "max_messages": None,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False
+        }
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.messages = True
+    return {"intents": intents}
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import gc
+import json
+import subprocess
+import sys
+import time
+
+# RSS and startup time of the Discord client profiles (client_profile.py) across many guilds.
+#
+#   python client_profile_benchmark.py --guilds 2000 --messages 20000
+#
+# Each profile runs in a fresh interpreter. Synthetic GUILD_CREATE payloads (channels,
+# roles, emojis, stickers, the bot's own member) are fed through discord.py's gateway
+# parsers, followed by MESSAGE_CREATE events from many authors, without connecting
+# to Discord. "startup" is the time to take in every GUILD_CREATE, the part of
+# startup that grows with the guild count. Uses discord.py 2.x internals
+# (Client._connection and its parsers).
+
+BOT_ID = 1000000000000000001
+
+
+def snowflake(kind, guild, index=0):
+    return str(1100000000000000000 + kind * 10 ** 16 + guild * 10 ** 4 + index)
+
+
+def user_payload(user_id, name):
+    return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": name, "avatar": None}
+
+
+def guild_payload(guild, channels, roles, emojis):
+    guild_id = snowflake(0, guild)
+    return {
+        "id": guild_id, "name": f"guild {guild}", "owner_id": snowflake(9, guild), "member_count": 500,
+        "features": [], "unavailable": False, "large": False,
+        "roles": [{"id": guild_id if i == 0 else snowflake(1, guild, i), "name": "@everyone" if i == 0 else f"role {i}",
+                   "permissions": "1024", "position": i, "color": 0, "hoist": False, "managed": False,
+                   "mentionable": False} for i in range(roles)],
+        "channels": [{"id": snowflake(2, guild, i), "type": 0, "name": f"channel-{i}", "position": i,
+                      "permission_overwrites": [], "nsfw": False, "guild_id": guild_id} for i in range(channels)],
+        "emojis": [{"id": snowflake(3, guild, i), "name": f"emoji{i}", "roles": [], "require_colons": True,
+                    "managed": False, "animated": False, "available": True} for i in range(emojis)],
+        "stickers": [{"id": snowflake(4, guild, i), "name": f"sticker{i}", "description": "", "tags": "smile",
+                      "type": 2, "format_type": 1, "available": True, "guild_id": guild_id}
+                     for i in range(emojis // 4)],
+        "members": [{"user": user_payload(BOT_ID, "Yuno"), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+                     "deaf": False, "mute": False, "flags": 0}],
+        "voice_states": [], "presences": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+    }
+
+
+def message_payload(index, guilds, channels):
+    guild = index % guilds
+    author = user_payload(1200000000000000000 + index % 50000, f"user{index % 50000}")
+    return {
+        "id": str(1300000000000000000 + index), "channel_id": snowflake(2, guild, index % channels),
+        "guild_id": snowflake(0, guild), "author": author,
+        "member": {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0},
+        "content": f"<@{BOT_ID}> hey yuno, how was your day? message {index}",
+        "timestamp": "2025-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [user_payload(BOT_ID, "Yuno")], "mention_roles": [],
+        "attachments": [], "embeds": [], "pinned": False, "type": 0, "flags": 0,
+    }
+
+
+def rss_kib():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_profile(profile, args):
+    import discord
+    import client_profile
+
+    client = discord.Client(**client_profile.client_options(profile))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user_payload(BOT_ID, "Yuno"))
+
+    gc.collect()
+    baseline = rss_kib()
+    started = time.perf_counter()
+    for guild in range(args.guilds):
+        state._add_guild_from_data(guild_payload(guild, args.channels, args.roles, args.emojis))
+    startup_ms = (time.perf_counter() - started) * 1000
+    gc.collect()
+    after_guilds = rss_kib()
+
+    started = time.perf_counter()
+    for index in range(args.messages):
+        state.parse_message_create(message_payload(index, args.guilds, args.channels))
+    messages_ms = (time.perf_counter() - started) * 1000
+    gc.collect()
+    after_messages = rss_kib()
+    await client.close()
+
+    return {
+        "profile": profile,
+        "startup_ms": round(startup_ms, 1),
+        "guild_cache_mib": round((after_guilds - baseline) / 1024, 1),
+        "rss_mib": round(after_messages / 1024, 1),
+        "rss_growth_mib": round((after_messages - baseline) / 1024, 1),
+        "message_events_per_s": round(args.messages / (messages_ms / 1000)) if messages_ms else None,
+        "cached_messages": len(state._messages) if state._messages is not None else 0,
+        "cached_emojis": len(state._emojis),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory and startup time of the Discord client profiles")
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=20, help="text channels per guild")
+    parser.add_argument("--roles", type=int, default=15, help="roles per guild")
+    parser.add_argument("--emojis", type=int, default=40, help="emojis per guild (a quarter as many stickers)")
+    parser.add_argument("--messages", type=int, default=20000, help="MESSAGE_CREATE events after startup")
+    parser.add_argument("--profile", help=argparse.SUPPRESS)  # set for the child processes
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(asyncio.run(run_profile(args.profile, args))))
+        return
+
+    import client_profile
+    for profile in client_profile.PROFILES:
+        child = subprocess.run([sys.executable, __file__, "--profile", profile, "--guilds", str(args.guilds),
+                                "--channels", str(args.channels), "--roles", str(args.roles),
+                                "--emojis", str(args.emojis), "--messages", str(args.messages)],
+                               capture_output=True, text=True, check=True)
+        print(child.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import struct
+import sys
+import zlib
+
+# Compact per-user conversation history.
+#
+# memory[user_id] used to be a list of {"role", "content"} dicts: ~200 bytes of dict
+# overhead per turn before counting the text. A History keeps one role byte per turn
+# and the text itself (short texts interned), and can zlib older turns into a single
+# block. It still reads like the list of dicts: len(), slicing, indexing and
+# iteration return {"role", "content"} dicts, decoded only when asked for.
+
+ROLE_NAMES = ("user", "assistant", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLE_NAMES)}
+INTERN_MAX_CHARS = 32  # greetings and short replies repeat a lot across users
+
+_LENGTH = struct.Struct("<I")
+
+# Set from settings by configure()
+compress_older_turns = False
+hot_turns = 8  # most recent turns kept uncompressed
+
+
+def _encode(texts):
+    parts = []
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+    return zlib.compress(b"".join(parts), 6)
+
+
+def _decode(blob):
+    data = zlib.decompress(blob)
+    texts, offset = [], 0
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        texts.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return texts
+
+
+class History:
+    """One user's turns: role codes, hot texts and an optional compressed cold block"""
+
+    __slots__ = ("_roles", "_texts", "_cold_roles", "_cold_blob")
+
+    def __init__(self, messages=()):
+        self._roles = bytearray()
+        self._texts = []
+        self._cold_roles = b""
+        self._cold_blob = None
+        for message in messages:
+            self._push(message["role"], message["content"])
+        self._compress_if_due()
+
+    def _push(self, role, content):
+        self._roles.append(ROLE_CODES[role])
+        if len(content) <= INTERN_MAX_CHARS:
+            content = sys.intern(content)
+        self._texts.append(content)
+
+    def _compress_if_due(self):
+        # Move turns to the cold block in batches so each append doesn't recompress it
+        if not compress_older_turns or len(self._texts) <= 2 * hot_turns:
+            return
+        move = len(self._texts) - hot_turns
+        cold_texts = (_decode(self._cold_blob) if self._cold_blob else []) + self._texts[:move]
+        self._cold_roles = bytes(self._cold_roles) + bytes(self._roles[:move])
+        self._cold_blob = _encode(cold_texts)
+        del self._roles[:move]
+        del self._texts[:move]
+
+    def append(self, message):
+        self._push(message["role"], message["content"])
+        self._compress_if_due()
+
+    def __len__(self):
+        return len(self._cold_roles) + len(self._roles)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _turns(self, start):
+        """(roles, texts) from absolute position `start`, decoding the cold block only if needed"""
+        cold = len(self._cold_roles)
+        if start >= cold:
+            return self._roles[start - cold:], self._texts[start - cold:]
+        cold_texts = _decode(self._cold_blob)
+        return (self._cold_roles[start:] + bytes(self._roles),
+                cold_texts[start:] + self._texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= stop and step > 0:
+                return []
+            first = min(start, stop + 1) if step < 0 else start
+            first = max(first, 0)
+            roles, texts = self._turns(first)
+            return [{"role": ROLE_NAMES[roles[i - first]], "content": texts[i - first]}
+                    for i in range(start, stop, step)]
+        position = range(len(self))[index]
+        roles, texts = self._turns(position)
+        return {"role": ROLE_NAMES[roles[0]], "content": texts[0]}
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __repr__(self):
+        return f"History({len(self)} turns, {len(self._cold_roles)} compressed)"
+
+
+class HistoryStore(dict):
+    """user_id -> History; lists of message dicts are converted when assigned"""
+
+    def __setitem__(self, user_id, messages):
+        if not isinstance(messages, History):
+            messages = History(messages)
+        super().__setitem__(user_id, messages)
+
+
+def configure(settings):
+    """Apply the compact_memory_* settings (existing histories adapt on their next append)"""
+    global compress_older_turns, hot_turns
+    compress_older_turns = settings.get("compact_memory_compress_older", False)
+    hot_turns = max(1, settings.get("compact_memory_hot_turns", 8))
+
+
+def new_store(settings):
+    """Container for main.memory: a HistoryStore, or a plain dict when compact memory is off"""
+    configure(settings)
+    return HistoryStore() if settings.get("compact_memory_enabled", True) else {}
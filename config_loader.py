@@ -1,19 +1,47 @@
+import itertools
 import json
+import logging
 import os
+from types import MappingProxyType
+
+import topic_stats
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = 'yuno_config.json'
+
+def read_config_file(path=CONFIG_PATH):
+    """Read and parse the config file, raising OSError or ValueError on failure"""
+    with open(path, 'r') as f:
+        return json.load(f)
 
 def load_yuno_config():
     """Load Yuno's configuration from JSON file"""
     try:
-        with open('yuno_config.json', 'r') as f:
-            config = json.load(f)
-        return config
+        return read_config_file()
     except FileNotFoundError:
-        print("Warning: yuno_config.json not found, using default configuration")
+        logger.warning("yuno_config.json not found, using default configuration")
         return get_default_config()
     except json.JSONDecodeError:
-        print("Error: Invalid JSON in yuno_config.json, using default configuration")
+        logger.error("Invalid JSON in yuno_config.json, using default configuration")
         return get_default_config()
 
+def save_config_file(config, path=CONFIG_PATH):
+    """Atomically write the config file; returns its new file_signature"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return file_signature(path)
+
+def file_signature(path=CONFIG_PATH):
+    """(mtime, size) of the config file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
 def get_default_config():
     """Default configuration if file is missing"""
     return {
@@ -41,8 +69,30 @@ def get_default_config():
         }
     }
 
-def build_system_prompt(config, user_id=None):
-    """Build the system prompt from configuration"""
+# Built prompt blocks, reused until the config objects they came from change.
+# Entries hold references to those objects, so identity checks can't be fooled by id reuse.
+_static_prompt_cache = None
+_user_context_cache = {}
+USER_CONTEXT_CACHE_SIZE = 5000
+
+def build_static_system_prompt(config):
+    """Build the part of the system prompt that only changes when the config file does
+    
+    Kept byte-identical across messages and users so providers can cache the prefix.
+    """
+    global _static_prompt_cache
+    personality = config["personality"]
+    memories = config.get("permanent_memories")
+    if _static_prompt_cache is not None:
+        cached_personality, cached_memories, cached_prompt = _static_prompt_cache
+        if cached_personality is personality and cached_memories is memories:
+            return cached_prompt
+    
+    prompt = _render_static_system_prompt(config)
+    _static_prompt_cache = (personality, memories, prompt)
+    return prompt
+
+def _render_static_system_prompt(config):
     personality = config["personality"]
     
     # Base personality
@@ -65,67 +115,166 @@ def build_system_prompt(config, user_id=None):
         for memory in config["permanent_memories"]:
             prompt += f"\n- {memory}"
     
-    # Add user-specific memories if applicable
+    return prompt
+
+def build_user_memories_prompt(config, user_id=None):
+    """Build the user-specific memories section (parents only), or an empty string"""
     user_memories = config.get("user_specific_memories", {})
     mother_id = user_memories.get("mother_user_id")
     father_id = user_memories.get("father_user_id")
     
+    prompt = ""
     if user_id and str(user_id) == str(mother_id):
         mother_memories = user_memories.get("mother_memories", [])
         if mother_memories:
-            prompt += "\n\nSpecial memories about this user:"
+            prompt += "Special memories about this user:"
             for memory in mother_memories:
                 prompt += f"\n- {memory}"
     elif user_id and str(user_id) == str(father_id):
         father_memories = user_memories.get("father_memories", [])
         if father_memories:
-            prompt += "\n\nSpecial memories about this user:"
+            prompt += "Special memories about this user:"
             for memory in father_memories:
                 prompt += f"\n- {memory}"
     
     return prompt
 
-def build_enhanced_system_prompt(config, user_id=None, relationship_type="friend", emotional_tone="neutral"):
-    """Build enhanced system prompt with personality and mood for Upgrade 1.5"""
-    base_prompt = build_system_prompt(config, user_id)
+def build_system_prompt(config, user_id=None):
+    """Build the system prompt from configuration"""
+    prompt = build_static_system_prompt(config)
+    
+    # Add user-specific memories if applicable
+    user_prompt = build_user_memories_prompt(config, user_id)
+    if user_prompt:
+        prompt += "\n\n" + user_prompt
     
-    # Add personality system enhancements
+    return prompt
+
+def build_user_context_prompt(config, user_id=None, relationship_type="friend"):
+    """Build the slowly-changing per-user part of the prompt
+    
+    Relationship, special memories, learned traits and interests change rarely,
+    so this block stays stable between consecutive messages from the same user.
+    """
     personality = config.get("personality_system", {})
-    current_mood = personality.get("current_mood", "cheerful")
-    learned_traits = personality.get("learned_traits", [])
-    interests = personality.get("interests", [])
+    sources = (config.get("user_specific_memories"), config.get("family_tree"), personality)
+    user_patterns = personality.get("conversation_patterns", {}).get(str(user_id), {})
+    sizes = (len(personality.get("learned_traits", [])), tuple(topic_stats.top_interests(personality)),
+             tuple(topic_stats.user_top_topics(user_patterns, str(user_id))))
+    key = (user_id, relationship_type)
+    cached = _user_context_cache.get(key)
+    if (cached is not None and cached[1] == sizes
+            and all(old is new for old, new in zip(cached[0], sources))):
+        return cached[2]
     
-    # Add mood information
-    base_prompt += f"\n\nCurrent mood: You're feeling {current_mood} today."
+    prompt = _render_user_context_prompt(config, user_id, relationship_type)
+    if len(_user_context_cache) >= USER_CONTEXT_CACHE_SIZE:
+        _user_context_cache.clear()
+    _user_context_cache[key] = (sources, sizes, prompt)
+    return prompt
+
+def _render_user_context_prompt(config, user_id, relationship_type):
+    sections = []
+    
+    user_prompt = build_user_memories_prompt(config, user_id)
+    if user_prompt:
+        sections.append(user_prompt)
     
     # Add relationship context
     relationship_styles = config.get("family_tree", {}).get("relationship_styles", {})
     if relationship_type in relationship_styles:
         style = relationship_styles[relationship_type]
-        base_prompt += f"\nInteraction style: With this {relationship_type}, be {style}."
+        sections.append(f"Interaction style: With this {relationship_type}, be {style}.")
+    
+    personality = config.get("personality_system", {})
+    learned_traits = personality.get("learned_traits", [])
+    interests = topic_stats.top_interests(personality)
+    user_patterns = personality.get("conversation_patterns", {}).get(str(user_id), {})
+    user_topics = topic_stats.user_top_topics(user_patterns, str(user_id))
     
     # Add learned traits
     if learned_traits:
-        base_prompt += "\nPersonality growth: You've developed these traits from conversations:"
+        section = "Personality growth: You've developed these traits from conversations:"
         for trait in learned_traits[-5:]:  # Last 5 learned traits
-            base_prompt += f"\n- {trait}"
+            section += f"\n- {trait}"
+        sections.append(section)
     
-    # Add interests
+    # Add interests (top interests first)
     if interests:
-        base_prompt += "\nYour current interests (things you've learned to enjoy from family conversations):"
-        for interest in interests[-10:]:  # Last 10 interests
-            base_prompt += f"\n- {interest}"
+        section = "Your current interests (things you've learned to enjoy from family conversations):"
+        for interest in interests[:10]:
+            section += f"\n- {interest}"
+        sections.append(section)
+    
+    if user_topics:
+        sections.append("Things this user likes to talk about: " + ", ".join(user_topics[:5]))
+    
+    return "\n".join(sections)
+
+def build_volatile_hints(config, emotional_tone="neutral"):
+    """Build the per-message mood and tone hints"""
+    personality = config.get("personality_system", {})
+    current_mood = personality.get("current_mood", "cheerful")
+    
+    # Add mood information
+    hints = f"Current mood: You're feeling {current_mood} today."
     
     # Add emotional context
-    if emotional_tone != "neutral":
-        if emotional_tone == "negative":
-            base_prompt += "\nThe user seems to be having a tough time. Be extra supportive and caring."
-        elif emotional_tone == "positive":
-            base_prompt += "\nThe user seems happy! Share in their positive energy."
-        elif emotional_tone == "achievement":
-            base_prompt += "\nThe user is sharing an achievement! Be celebratory and proud of them."
+    if emotional_tone == "negative":
+        hints += "\nThe user seems to be having a tough time. Be extra supportive and caring."
+    elif emotional_tone == "positive":
+        hints += "\nThe user seems happy! Share in their positive energy."
+    elif emotional_tone == "achievement":
+        hints += "\nThe user is sharing an achievement! Be celebratory and proud of them."
+    
+    return hints
+
+def build_enhanced_system_prompt(config, user_id=None, relationship_type="friend", emotional_tone="neutral"):
+    """Build enhanced system prompt with personality and mood for Upgrade 1.5"""
+    base_prompt = build_static_system_prompt(config)
+    
+    user_context = build_user_context_prompt(config, user_id, relationship_type)
+    if user_context:
+        base_prompt += "\n\n" + user_context
+    
+    return base_prompt + "\n\n" + build_volatile_hints(config, emotional_tone)
+
+def supports_cache_control(config, model):
+    """Whether a model gets explicit cache_control markers (e.g. Anthropic, Gemini via OpenRouter)"""
+    prefixes = config.get("settings", {}).get("prompt_cache_control_models", [])
+    return any(model.startswith(prefix) for prefix in prefixes)
+
+def _system_block(text, cache_control=False):
+    if not cache_control:
+        return {"role": "system", "content": text}
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+    }
+
+def build_prompt_messages(config, user_id, summaries, history, relationship_type="friend",
+                          emotional_tone="neutral", model="", recalled=None):
+    """Lay out the chat payload so its prefix stays stable between messages
+    
+    Order: static system block, per-user context, summaries, earlier turns, then the
+    recalled older turns (if any) and the volatile mood/tone hints right before the
+    latest turn. Everything up to there only changes when the config, the user's
+    context or the history does.
+    """
+    cache_control = supports_cache_control(config, model)
+    messages = [_system_block(build_static_system_prompt(config), cache_control)]
+    
+    user_context = build_user_context_prompt(config, user_id, relationship_type)
+    if user_context:
+        messages.append(_system_block(user_context, cache_control))
     
-    return base_prompt
+    messages.extend(summaries)
+    messages.extend(history[:-1])
+    if recalled:
+        messages.append(recalled)
+    messages.append({"role": "system", "content": build_volatile_hints(config, emotional_tone)})
+    messages.extend(history[-1:])
+    return messages
 
 def get_ai_settings(config):
     """Get AI model settings from config"""
@@ -137,4 +286,102 @@ def get_ai_settings(config):
         "parent_memory_limit": settings.get("parent_memory_limit", 50),
         "compression_threshold": settings.get("compression_threshold", 20),
         "summary_model": settings.get("summary_model", "mistralai/mistral-small-3.1")
-    }
\ No newline at end of file
+    }
+
+# Version handed to each compiled config, so a reload can be told apart from the last
+_config_versions = itertools.count(1)
+
+def _parse_user_id(value, where, problems):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        problems.append(f"{where} is not a Discord user ID: {value!r}")
+        return None
+
+class YunoConfig:
+    """Validated, read-only view of yuno_config with the hot-path lookups precomputed
+    
+    `data` is still the JSON document (runtime state keeps being written into it);
+    everything else is derived once per load instead of on every message.
+    """
+    __slots__ = ("data", "version", "max_tokens", "temperature", "memory_limit", "parent_memory_limit",
+                 "compression_threshold", "summary_model", "mother_id", "father_id", "parent_ids", "extended_family")
+    
+    def __init__(self, data, version, **fields):
+        object.__setattr__(self, "data", data)
+        object.__setattr__(self, "version", version)
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("YunoConfig is read-only; load a new one instead")
+    
+    def is_parent(self, user_id):
+        return _as_id(user_id) in self.parent_ids
+    
+    def relationship_for(self, user_id):
+        user_id = _as_id(user_id)
+        if user_id in self.parent_ids:
+            return "parent"
+        return self.extended_family.get(user_id, "friend")
+    
+    def memory_limit_for(self, user_id):
+        return self.parent_memory_limit if self.is_parent(user_id) else self.memory_limit
+
+def _as_id(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+def compile_config(config):
+    """Validate a loaded config and build its YunoConfig; raises ValueError listing every problem"""
+    problems = []
+    ai_settings = get_ai_settings(config)
+    for key in ("memory_limit", "parent_memory_limit", "compression_threshold", "max_tokens"):
+        value = ai_settings[key]
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            problems.append(f"settings: {key} must be a positive integer, got {value!r}")
+    if not isinstance(ai_settings["temperature"], (int, float)):
+        problems.append(f"settings: temperature must be a number, got {ai_settings['temperature']!r}")
+    if "personality" not in config:
+        problems.append("missing the personality section")
+    
+    # Parents come from the family tree, falling back to the older user_specific_memories IDs
+    family_tree = config.get("family_tree", {})
+    user_memories = config.get("user_specific_memories", {})
+    parents = {}
+    for role in ("mother", "father"):
+        key = f"{role}_user_id"
+        tree_id = _parse_user_id(family_tree.get(key), f"family_tree.{key}", problems)
+        memories_id = _parse_user_id(user_memories.get(key), f"user_specific_memories.{key}", problems)
+        if tree_id and memories_id and tree_id != memories_id:
+            problems.append(f"family_tree.{key} and user_specific_memories.{key} disagree")
+        parents[role] = tree_id or memories_id
+    
+    extended_family = {}
+    for member_id, member in family_tree.get("extended_family", {}).items():
+        parsed = _parse_user_id(member_id, "family_tree.extended_family key", problems)
+        if not isinstance(member, dict) or not isinstance(member.get("relationship"), str):
+            problems.append(f"family_tree.extended_family[{member_id}] needs a relationship")
+        elif parsed is not None:
+            extended_family[parsed] = member["relationship"]
+    
+    if problems:
+        raise ValueError("Invalid configuration: " + "; ".join(problems))
+    
+    return YunoConfig(
+        config, next(_config_versions),
+        max_tokens=ai_settings["max_tokens"],
+        temperature=ai_settings["temperature"],
+        memory_limit=ai_settings["memory_limit"],
+        parent_memory_limit=ai_settings["parent_memory_limit"],
+        compression_threshold=ai_settings["compression_threshold"],
+        summary_model=ai_settings["summary_model"],
+        mother_id=parents["mother"],
+        father_id=parents["father"],
+        parent_ids=frozenset(pid for pid in parents.values() if pid),
+        extended_family=MappingProxyType(extended_family)
+    )
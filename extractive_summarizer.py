@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Local extractive summaries for memory compression: no network, no model, a few
+# milliseconds per conversation. Sentences are scored by how many of the
+# conversation's frequent content words they contain; statements about the user's
+# preferences and feelings are picked before anything else because they matter
+# most later on.
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+_WORD_RE = re.compile(r"[a-z][a-z']+")
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can could
+did do does doing don't for from get got had has have having he her here hers him his how i i'm if in
+into is it it's its just like me more most my no not now of off on once only or other our out over own
+really same she should so some such than that that's the their them then there these they this those
+through to too under until up very was we were what when where which while who why will with would yes
+you your yours yourself yeah okay ok oh um uh lol haha hey hi hello yuno
+""".split())
+
+PREFERENCE_PATTERNS = [re.compile(pattern) for pattern in (
+    r"\bi (?:really |also |just |do(?:n't| not) )?(?:like|love|enjoy|hate|prefer|dislike|want|need)\b",
+    r"\bmy (?:favou?rite|name|birthday|job|work|school|family|mom|dad|sister|brother|pet|dog|cat)\b",
+    r"\bi(?:'m| am) (?:a |an |from |into |working|studying|learning|going)\b",
+    r"\bi (?:work|study|live|play|have)\b",
+)]
+
+EMOTION_PATTERNS = [re.compile(pattern) for pattern in (
+    r"\bi(?:'m| am)? ?(?:feel|feeling|felt)\b",
+    r"\b(?:sad|happy|excited|angry|upset|worried|anxious|stressed|lonely|tired|scared|proud|grateful|depressed)\b",
+    r"\b(?:miss|missed|love you|thank you|sorry)\b",
+)]
+
+_executor = None
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if len(sentence.strip()) > 2]
+
+
+def content_words(text):
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def summarize(messages, max_sentences=4, max_chars=600):
+    """Pick the most informative sentences of a conversation, kept in their original order
+
+    The user's preference and feeling statements take the first of the
+    `max_sentences` slots, then the best-scoring other sentences, as long as they
+    fit in `max_chars`; when none fits, the best one is cut to `max_chars`. messages
+    are {"role", "content"} dicts. Returns "" when there is nothing to keep.
+    """
+    candidates = []  # (position, speaker, sentence, words)
+    for message in messages:
+        speaker = "User" if message["role"] == "user" else "Yuno"
+        for sentence in split_sentences(message.get("content") or ""):
+            candidates.append((len(candidates), speaker, sentence, content_words(sentence)))
+    if not candidates:
+        return ""
+
+    frequencies = Counter(word for *_, words in candidates for word in words)
+    scored = []  # (key statement, score, position)
+    for position, speaker, sentence, words in candidates:
+        score = sum(frequencies[word] for word in set(words)) / (len(words) + 4) if words else 0.0
+        lowered = sentence.lower()
+        key = False
+        if speaker == "User":
+            score *= 1.5  # what the user said matters more than Yuno's replies
+            if any(pattern.search(lowered) for pattern in PREFERENCE_PATTERNS):
+                score += 100
+                key = True
+            if any(pattern.search(lowered) for pattern in EMOTION_PATTERNS):
+                score += 50
+                key = True
+        scored.append((key, score, position))
+
+    ranked = [(score, position) for _, score, position in sorted(
+        scored, key=lambda item: (not item[0], -item[1], item[2])) if score > 0]
+    chosen, length = {}, 0  # position -> sentence as kept
+    for score, position in ranked:
+        if len(chosen) >= max_sentences:
+            break
+        sentence = candidates[position][2]
+        if length + len(sentence) <= max_chars:
+            chosen[position] = sentence
+            length += len(sentence)
+    if ranked and not chosen:
+        position = ranked[0][1]
+        chosen[position] = candidates[position][2][:max_chars - 1].rstrip() + "…"
+
+    topics = [word for word, _ in frequencies.most_common(5) if frequencies[word] > 1]
+    parts = [f"{candidates[position][1]}: {chosen[position]}" for position in sorted(chosen)]
+    summary = " ".join(parts)
+    if topics:
+        summary = f"Topics: {', '.join(topics)}. {summary}"
+    return summary
+
+
+async def summarize_async(messages, max_sentences=4, max_chars=600):
+    """summarize() in a worker thread so large conversations never stall the event loop"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarizer")
+    return await asyncio.get_running_loop().run_in_executor(_executor, summarize, messages, max_sentences, max_chars)
@@ -0,0 +1,89 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+import compact_history
+
+# Memory per user and prompt-assembly time of conversation histories:
+# plain lists of dicts vs. compact_history.History, with and without compression.
+#
+#   python history_benchmark.py --users 20000 --turns 30
+
+WORDS = ("the and you i to a it that is was my so what like just about do have really think "
+         "school game music today love happy sad tired friend family weekend movie cat dog "
+         "homework dinner sleep work remember favorite yuno thanks okay haha sure maybe").split()
+SHORT_REPLIES = ("Hello!", "lol", "ok", "thanks!", "good night", "haha yes", "What about you?")
+
+
+def make_conversation(rng, turns):
+    messages = []
+    for turn in range(turns):
+        role = "user" if turn % 2 == 0 else "assistant"
+        if rng.random() < 0.2:
+            content = rng.choice(SHORT_REPLIES)
+        else:
+            # Build fresh strings like messages arriving from Discord would be
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 40) if role == "user" else rng.randint(15, 80)))
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+def measure(label, args, build):
+    # Conversations are generated inside the traced window (same seed every run), so
+    # the text itself is counted too, not just the per-turn structure around it
+    rng = random.Random(7)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = {900000000000000000 + i: build(make_conversation(rng, args.turns)) for i in range(args.users)}
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Prompt assembly: recent turns as message dicts, the way get_ai_response takes them
+    started = time.perf_counter()
+    for history in store.values():
+        recent = history[-args.context:]
+        prompt = [{"role": "system", "content": "..."}] + recent
+    elapsed = time.perf_counter() - started
+    return {
+        "label": label,
+        "bytes_per_user": used / len(store),
+        "assembly_us": elapsed / len(store) * 1e6,
+        "_check": prompt
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact conversation histories")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=30, help="turns kept per user")
+    parser.add_argument("--context", type=int, default=30, help="turns put into each prompt")
+    parser.add_argument("--hot-turns", type=int, default=8)
+    args = parser.parse_args()
+
+    def compact(compress):
+        def build(messages):
+            compact_history.compress_older_turns = compress
+            compact_history.hot_turns = args.hot_turns
+            return compact_history.History(messages)
+        return build
+
+    results = [
+        measure("list of dicts", args, lambda messages: messages),
+        measure("History", args, compact(False)),
+        measure("History+zlib", args, compact(True)),
+    ]
+    assert results[0]["_check"] == results[1]["_check"] == results[2]["_check"]
+
+    baseline = results[0]["bytes_per_user"]
+    print(f"{args.users} users x {args.turns} turns, {args.context} turns per prompt")
+    for result in results:
+        print(f"{result['label']:<15} {result['bytes_per_user']:>9.0f} bytes/user "
+              f"({result['bytes_per_user'] / baseline * 100:5.1f}%)  {result['assembly_us']:7.2f}us/prompt")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,16 @@ from flask import Flask
 import threading
 import time
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Create Flask app
 app = Flask(__name__)
 
+# Extra /health sections: name -> callable returning a JSON-serializable dict
+health_providers = {}
+
 @app.route('/')
 def home():
     """Home route to keep the server alive"""
@@ -14,11 +20,17 @@ def home():
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return {
+    health = {
         "status": "healthy",
         "message": "Discord bot keep-alive server is running",
         "timestamp": time.time()
     }
+    for name, provider in list(health_providers.items()):
+        try:
+            health[name] = provider()
+        except Exception as e:
+            health[name] = {"error": str(e)}
+    return health
 
 @app.route('/ping')
 def ping():
@@ -33,13 +45,13 @@ def run():
 
 def keep_alive():
     """Start the keep-alive server in a separate thread"""
-    print("Starting keep-alive server...")
+    logger.info("Starting keep-alive server...")
 
     server_thread = threading.Thread(target=run)
     server_thread.daemon = True  # dies when main thread dies
     server_thread.start()
 
-    print(f"Keep-alive server started on port {os.getenv('PORT', 5000)}")
+    logger.info("Keep-alive server started on port %s", os.getenv('PORT', 5000))
 
     # Give the server a moment to start
     time.sleep(1)
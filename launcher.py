@@ -0,0 +1,129 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+MAX_BACKOFF_SECONDS = 60
+STABLE_RUN_FACTOR = 10  # a worker alive this many times its next backoff counts as stable
+
+
+def recommended_shard_count(token):
+    """Ask Discord how many shards this bot should run"""
+    response = httpx.get(GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}, timeout=10.0)
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def shard_ranges(shard_count, workers):
+    """Split shard IDs 0..shard_count-1 into contiguous ranges, one per worker"""
+    workers = max(1, min(workers, shard_count))
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        size = base + (1 if worker < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def restart_delay(restarts):
+    """Backoff before restarting a worker that has crashed `restarts` times in a row"""
+    return min(MAX_BACKOFF_SECONDS, 2 ** restarts)
+
+
+def spawn_worker(worker_id, shard_count, shard_ids):
+    env = dict(os.environ)
+    env["YUNO_WORKER_ID"] = str(worker_id)
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = ",".join(str(shard) for shard in shard_ids)
+    # Workers share users across shards, so state must live in Postgres
+    env["SHARED_STATE"] = "1"
+    print(f"Starting worker {worker_id} with shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+    return subprocess.Popen([sys.executable, "main.py"], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Yuno as several sharded worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="total shard count (default: Discord's recommendation)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL is required for multi-process deployments!")
+        sys.exit(1)
+
+    shard_count = args.shards
+    if not shard_count:
+        token = os.getenv("DISCORD_TOKEN")
+        if not token:
+            print("ERROR: DISCORD_TOKEN not found in environment variables!")
+            sys.exit(1)
+        shard_count = recommended_shard_count(token)
+
+    ranges = shard_ranges(shard_count, args.workers)
+    workers = {worker_id: spawn_worker(worker_id, shard_count, shard_ids)
+               for worker_id, shard_ids in enumerate(ranges)}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Restart crashed workers (non-zero exit code, or killed by a signal) until asked
+    # to stop; a clean exit is taken as intentional. A crashed worker waits out its
+    # backoff as None in `workers`, so stopping is noticed during the wait; the
+    # backoff starts over once a worker has run stably
+    restarts = {worker_id: 0 for worker_id in workers}
+    started = {worker_id: time.monotonic() for worker_id in workers}
+    restart_at = {}
+    while workers:
+        time.sleep(1)
+        now = time.monotonic()
+        for worker_id, process in list(workers.items()):
+            if process is None:
+                if stopping:
+                    del workers[worker_id]
+                elif now >= restart_at[worker_id]:
+                    process = workers[worker_id] = spawn_worker(worker_id, shard_count, ranges[worker_id])
+                    started[worker_id] = now
+                    if stopping:  # the signal came in while spawning
+                        process.send_signal(signal.SIGTERM)
+                continue
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping:
+                del workers[worker_id]
+                continue
+            if code == 0:
+                print(f"Worker {worker_id} exited cleanly, not restarting it")
+                del workers[worker_id]
+                continue
+            if now - started[worker_id] >= STABLE_RUN_FACTOR * restart_delay(restarts[worker_id] + 1):
+                restarts[worker_id] = 0
+            restarts[worker_id] += 1
+            delay = restart_delay(restarts[worker_id])
+            print(f"Worker {worker_id} exited with code {code}, restarting in {delay}s")
+            workers[worker_id] = None
+            restart_at[worker_id] = now + delay
+
+
+if __name__ == "__main__":
+    main()
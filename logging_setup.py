@@ -0,0 +1,128 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Structured fields callers can pass with extra={...}
+STRUCTURED_FIELDS = ("user", "stage", "latency_ms", "status", "model", "count")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields that were provided"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for field in STRUCTURED_FIELDS + ("suppressed",):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DuplicateFilter(logging.Filter):
+    """Let through at most `burst` identical records per `window` seconds
+
+    Only records at `min_level` and above are limited, so the per-request INFO and
+    DEBUG records always get through. Records are identical when they share logger,
+    level and message template, so an OpenRouter outage logs a handful of errors
+    and then a suppressed count instead of one line per failed request.
+    """
+
+    def __init__(self, burst=5, window=10.0, min_level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.min_level = min_level
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - window_start >= self.window:
+                if suppressed:
+                    record.suppressed = suppressed
+                window_start, count, suppressed = now, 0, 0
+            count += 1
+            if count > self.burst:
+                self._seen[key] = (window_start, count, suppressed + 1)
+                return False
+            self._seen[key] = (window_start, count, suppressed)
+            if len(self._seen) > 1000:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def setup_logging(level=None, json_output=None):
+    """Route all logging through a bounded queue drained by a background thread
+
+    Callers only render the message and enqueue it; the listener thread serializes
+    records and does the blocking writes to stdout. LOG_LEVEL and LOG_FORMAT
+    (json|text) set the defaults.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    if json_output is None:
+        json_output = os.getenv("LOG_FORMAT", "json").lower() == "json"
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if json_output:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.Queue(maxsize=10000)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(DuplicateFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    # Library chatter (httpx logs every request at INFO) stays at WARNING
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,32 +1,74 @@
+import time
+_import_started = time.perf_counter()
+
 import os
+import logging
 import discord
 from discord.ext import commands
 import httpx
-import json
 import asyncio
+import contextvars
 import re
 import random
+import signal
+from collections import deque
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from keep_alive import keep_alive
-from config_loader import load_yuno_config, build_system_prompt, build_enhanced_system_prompt, get_ai_settings
+from keep_alive import keep_alive, health_providers
+from logging_setup import setup_logging
+from config_loader import (load_yuno_config, build_system_prompt, build_prompt_messages,
+                           build_static_system_prompt, build_user_context_prompt, compile_config, read_config_file,
+                           save_config_file, file_signature)
+import traffic_recorder
+import shared_state
+import snapshot
+import reply_cache
+import model_router
+import storage
+import extractive_summarizer
+import overload
+import message_dedupe
+import compact_history
+import memory_recall
+import client_profile
+import summary_batcher
+import usage_ledger
+import topic_stats
 
 
 # Load environment variables
 load_dotenv()
 
-# Load Yuno's configuration
-yuno_config = load_yuno_config()
-ai_settings = get_ai_settings(yuno_config)
+# Structured logging through a background thread (never blocks the event loop)
+setup_logging()
+logger = logging.getLogger("yuno")
+
+# Load Yuno's configuration; active_config is the validated view, yuno_config its document
+active_config = compile_config(load_yuno_config())
+yuno_config = active_config.data
+config_file_seen = file_signature()  # what the config watcher last loaded or wrote
+
+# Bot configuration: intents and caches come from the client profile (see client_profile.py)
+client_options = client_profile.client_options(
+    yuno_config.get("settings", {}).get("discord_client_profile", "default"),
+    typing_prefetch=yuno_config.get("settings", {}).get("typing_prefetch_enabled", False)
+)
 
-# Bot configuration
-intents = discord.Intents.default()
-intents.message_content = True
-intents.messages = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Sharding: SHARD_COUNT (or SHARDED=1 for Discord's recommended count) switches to
+# AutoShardedBot; SHARD_IDS restricts this process to a shard range (see launcher.py)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()] or None
+WORKER_ID = int(os.getenv("YUNO_WORKER_ID", "0"))
+
+if SHARD_COUNT or SHARD_IDS or os.getenv("SHARDED", "").lower() in ("1", "true", "yes"):
+    bot = commands.AutoShardedBot(command_prefix='!', shard_count=SHARD_COUNT, shard_ids=SHARD_IDS,
+                                  **client_options)
+else:
+    bot = commands.Bot(command_prefix='!', **client_options)
 
 # OpenRouter configuration
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/"
 MODEL = "mistralai/mistral-medium-3.1"
 
 # Get secrets from environment variables
@@ -34,22 +76,164 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
 # Per-user conversation memory with compression support
-memory = {}
+memory = compact_history.new_store(yuno_config.get("settings", {}))  # user id -> History (see compact_history.py)
 compressed_memory = {}  # Stores compressed summaries for users
 
-# Memory limits from config
-MAX_MEMORY_SIZE = ai_settings["memory_limit"]
-PARENT_MEMORY_SIZE = ai_settings.get("parent_memory_limit", 50)
-COMPRESSION_THRESHOLD = ai_settings.get("compression_threshold", 20)
-SUMMARY_MODEL = ai_settings.get("summary_model", "mistralai/mistral-small-3.1")
-
 # Upgrade 1.5 - Advanced systems
 user_emotional_states = {}  # Track user emotional states
 conversation_contexts = {}  # Track conversation contexts for learning
 last_interactions = {}  # Track last interaction times for mood system
+compressing_users = set()  # Users with a memory compression in flight
 
-async def compress_old_memories(user_id, messages_to_compress):
-    """Compress old messages into a summary using AI"""
+# Reply pipeline timings: time until the LLM request is dispatched, and end to end
+pipeline_timings = deque(maxlen=1000)
+
+# Speculative prefetch on typing (opt-in, see on_typing)
+active_channels = {}  # channel id -> time.monotonic() Yuno last replied there
+prefetched_users = {}  # user id -> time.monotonic() their context was last made hot
+prefetches_in_flight = set()
+
+# Rapid mentions from one user in one channel waiting to be answered together
+pending_bursts = {}  # (user id, channel id) -> {"parts", "send_reply", "deadline", "full"}
+
+# Fire-and-forget tasks (kept referenced so they aren't garbage collected)
+background_tasks = set()
+
+def spawn_background(coro):
+    """Run a coroutine without waiting for it"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Opt-in traffic recording for offline replay (see replay_traffic.py)
+traffic_recorder.configure(yuno_config.get("settings", {}))
+
+# Opt-in cache of replies to context-free openers like "hello"
+reply_cache.configure(yuno_config.get("settings", {}))
+
+# Opt-in per-request model choice (see "model_routing" in yuno_config.json)
+model_router.configure(yuno_config, MODEL)
+health_providers["routing"] = model_router.health
+
+# Where conversation state is written through to (see storage.py)
+storage.configure(yuno_config.get("settings", {}))
+
+# Opt-in load shedding (see "overload" in yuno_config.json); its level is part of /health
+overload.configure(yuno_config)
+health_providers["overload"] = overload.health
+
+# Each message is handled once, even when replayed by the gateway or seen by two instances
+message_dedupe.configure(yuno_config.get("settings", {}), getattr(storage.backend, "name", None) == "postgres")
+health_providers["dedupe"] = message_dedupe.health
+memory_recall.configure(yuno_config.get("settings", {}))
+health_providers["recall"] = memory_recall.health
+usage_ledger.configure(yuno_config.get("settings", {}), getattr(storage.backend, "name", None) == "postgres")
+topic_stats.configure(yuno_config.get("settings", {}))
+topic_stats.seed_interests(yuno_config.setdefault("personality_system", {}))
+
+# Shared OpenRouter client so connections are pooled across requests.
+# replay_traffic.py swaps HTTP_TRANSPORT for recorded responses.
+HTTP_TRANSPORT = None
+_http_client = None
+last_openrouter_request = 0.0  # time.monotonic() of the last request on the pool
+
+# Kind ("chat" or "summary") of the OpenRouter request being made in this task
+request_kind = contextvars.ContextVar("request_kind", default=None)
+
+# Idle connections are kept for a minute so a warmed connection survives until the mention
+HTTP_KEEPALIVE_SECONDS = 60.0
+
+def get_http_client():
+    """Get the shared OpenRouter HTTP client"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=30.0,
+            transport=HTTP_TRANSPORT,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+        )
+    return _http_client
+
+async def warm_http_connection():
+    """Make sure a pooled, TLS-established connection to OpenRouter is available"""
+    global last_openrouter_request
+    if time.monotonic() - last_openrouter_request < HTTP_KEEPALIVE_SECONDS / 2:
+        return
+    last_openrouter_request = time.monotonic()
+    try:
+        await get_http_client().head(OPENROUTER_BASE_URL)
+    except httpx.HTTPError:
+        pass
+
+async def post_openrouter(payload, user_id=None, kind="chat"):
+    """POST a chat completion payload to OpenRouter and record the exchange
+
+    The parsed body of a 200 response is attached as response.data (None otherwise),
+    so callers don't parse it again.
+    """
+    global last_openrouter_request
+    last_openrouter_request = time.monotonic()
+    request_kind.set(kind)
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    if usage_ledger.ledger is not None:
+        payload.setdefault("usage", {"include": True})  # ask OpenRouter to report the cost too
+    started = time.perf_counter()
+    overload.request_started()
+    try:
+        response = await get_http_client().post(
+            OPENROUTER_API_URL,
+            headers=headers,
+            json=payload
+        )
+    except httpx.TimeoutException:
+        latency_ms = (time.perf_counter() - started) * 1000
+        overload.request_finished(latency_ms, kind)
+        model_router.record_outcome(payload.get("model"), latency_ms, False, kind)
+        traffic_recorder.record_llm(user_id, kind, payload, "timeout", latency_ms)
+        logger.warning("OpenRouter request timed out", extra={
+            "user": user_id, "stage": kind, "latency_ms": round(latency_ms, 1), "model": payload.get("model")})
+        raise
+    except Exception:
+        # Connection errors and other transport failures count against the model
+        latency_ms = (time.perf_counter() - started) * 1000
+        overload.request_finished(latency_ms, kind)
+        model_router.record_outcome(payload.get("model"), latency_ms, False, kind)
+        raise
+    except BaseException:
+        overload.request_finished((time.perf_counter() - started) * 1000, kind)
+        raise
+    latency_ms = (time.perf_counter() - started) * 1000
+    overload.request_finished(latency_ms, kind)
+    model_router.record_outcome(payload.get("model"), latency_ms, response.status_code == 200, kind)
+    logger.debug("OpenRouter request finished", extra={
+        "user": user_id, "stage": kind, "latency_ms": round(latency_ms, 1),
+        "status": response.status_code, "model": payload.get("model")})
+
+    # httpx parses the body again on every .json() call, so it's parsed once here
+    data = response.data = response.json() if response.status_code == 200 else None
+    if data is not None and usage_ledger.ledger is not None:
+        usage_ledger.record(user_id, payload.get("model"), kind, data, latency_ms)
+    if traffic_recorder.recorder is not None:
+        traffic_recorder.record_llm(user_id, kind, payload, response.status_code, latency_ms,
+                                    len(response.content), data)
+    return response
+
+def store_summary(user_id, summary):
+    """Add a compressed summary to the user's memory and persist it"""
+    if user_id not in compressed_memory:
+        compressed_memory[user_id] = []
+    compressed_memory[user_id].append({
+        "role": "system",
+        "content": f"Earlier conversation summary: {summary}"
+    })
+    shared_state.persist("add_summary", user_id, summary)
+
+async def summarize_with_llm(user_id, messages_to_compress):
+    """Summarize messages with SUMMARY_MODEL; returns the summary or None"""
     try:
         # Prepare messages for compression
         conversation_text = ""
@@ -57,11 +241,6 @@ async def compress_old_memories(user_id, messages_to_compress):
             role_label = "User" if msg["role"] == "user" else "Yuno"
             conversation_text += f"{role_label}: {msg['content']}\n"
         
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         compression_prompt = f"""Please summarize this conversation into 2-3 concise sentences, focusing on:
 1. Key topics discussed
 2. Important user preferences or information revealed
@@ -73,7 +252,7 @@ Conversation to summarize:
 Summary:"""
 
         payload = {
-            "model": SUMMARY_MODEL,
+            "model": active_config.summary_model,
             "messages": [
                 {
                     "role": "user", 
@@ -84,62 +263,74 @@ Summary:"""
             "temperature": 0.3
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                OPENROUTER_API_URL,
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                summary = data["choices"][0]["message"]["content"]
-                
-                # Store compressed summary
-                if user_id not in compressed_memory:
-                    compressed_memory[user_id] = []
-                compressed_memory[user_id].append({
-                    "role": "system",
-                    "content": f"Earlier conversation summary: {summary}"
-                })
-                
-                print(f"Compressed {len(messages_to_compress)} messages for user {user_id}")
-                return True
-            else:
-                print(f"Compression API error: {response.status_code}")
-                return False
+        response = await post_openrouter(payload, user_id, kind="summary")
+        
+        if response.status_code == 200:
+            return response.data["choices"][0]["message"]["content"]
+        else:
+            logger.error("Compression API error", extra={
+                "user": user_id, "stage": "compression", "status": response.status_code})
+            return None
                 
     except Exception as e:
-        print(f"Error compressing memories: {str(e)}")
+        logger.error("Error compressing memories: %s", e, extra={"user": user_id, "stage": "compression"})
+        return None
+
+async def compress_old_memories(user_id, messages_to_compress):
+    """Compress old messages into a summary
+    
+    settings.compression_mode picks the LLM ("llm") or the local extractive
+    summarizer ("extractive"); with compression_extractive_fallback the extractive
+    summarizer also covers failed LLM calls.
+    """
+    settings = yuno_config.get("settings", {})
+    mode = settings.get("compression_mode", "llm")
+    summary = None
+    if mode == "llm" and summary_batcher.batcher is not None:
+        summary = await summary_batcher.batcher.summarize(user_id, messages_to_compress)
+    elif mode == "llm":
+        summary = await summarize_with_llm(user_id, messages_to_compress)
+    
+    if summary is None and (mode == "extractive" or settings.get("compression_extractive_fallback", True)):
+        started = time.perf_counter()
+        summary = await extractive_summarizer.summarize_async(messages_to_compress) or None
+        logger.info("Summarized %d messages locally", len(messages_to_compress), extra={
+            "user": user_id, "stage": "compression", "count": len(messages_to_compress),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+    
+    if summary is None:
         return False
+    
+    store_summary(user_id, summary)
+    logger.info("Compressed %d messages", len(messages_to_compress),
+                extra={"user": user_id, "stage": "compression"})
+    return True
+
+# Batches compression jobs of several users into one request (off unless enabled)
+summary_batcher.configure(yuno_config.get("settings", {}), active_config.summary_model,
+                          post_openrouter, summarize_with_llm)
+health_providers["summary_batching"] = summary_batcher.health
 
 def get_memory_limit_for_user(user_id):
     """Get appropriate memory limit based on user type"""
-    # Check if user is a parent
-    mother_id = str(yuno_config.get("user_specific_memories", {}).get("mother_user_id", ""))
-    father_id = str(yuno_config.get("user_specific_memories", {}).get("father_user_id", ""))
-    
-    if str(user_id) in [mother_id, father_id]:
-        return PARENT_MEMORY_SIZE
-    else:
-        return MAX_MEMORY_SIZE
+    return active_config.memory_limit_for(user_id)
+
+# Patterns that indicate asking about parents
+PARENT_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\b(?:who\s+(?:is|are|were|was)|tell\s+me\s+about)\s+your\s+(?:parent|parents|creator|creators|mom|mother|dad|father|family)\b',
+    r'\b(?:your\s+)?(?:parent|parents|creator|creators|mom|mother|dad|father|family)(?:\s+(?:is|are|were|was))?\b',
+    r'\bwho\s+(?:created|made|built|coded|programmed)\s+you\b',
+    r'\bwho\s+(?:is|are)\s+your\s+(?:maker|builder|developer)\b',
+    r'\btell\s+me\s+about\s+your\s+(?:origin|background|creation)\b'
+)]
 
 def should_ping_parents(message_content):
     """Analyze if message asks about parents and determine who to ping"""
     # Convert to lowercase for pattern matching
     content_lower = message_content.lower()
     
-    # Patterns that indicate asking about parents
-    parent_patterns = [
-        r'\b(?:who\s+(?:is|are|were|was)|tell\s+me\s+about)\s+your\s+(?:parent|parents|creator|creators|mom|mother|dad|father|family)\b',
-        r'\b(?:your\s+)?(?:parent|parents|creator|creators|mom|mother|dad|father|family)(?:\s+(?:is|are|were|was))?\b',
-        r'\bwho\s+(?:created|made|built|coded|programmed)\s+you\b',
-        r'\bwho\s+(?:is|are)\s+your\s+(?:maker|builder|developer)\b',
-        r'\btell\s+me\s+about\s+your\s+(?:origin|background|creation)\b'
-    ]
-    
     # Check if any parent pattern matches
-    asks_about_parents = any(re.search(pattern, content_lower) for pattern in parent_patterns)
+    asks_about_parents = any(pattern.search(content_lower) for pattern in PARENT_PATTERNS)
     
     if not asks_about_parents:
         return None, None
@@ -152,8 +343,8 @@ def should_ping_parents(message_content):
     mentions_father = any(keyword in content_lower for keyword in father_keywords)
     
     # Get parent IDs
-    mother_id = yuno_config.get("user_specific_memories", {}).get("mother_user_id")
-    father_id = yuno_config.get("user_specific_memories", {}).get("father_user_id")
+    mother_id = active_config.mother_id
+    father_id = active_config.father_id
     
     # Decision logic
     if mentions_mother and not mentions_father:
@@ -168,17 +359,7 @@ def should_ping_parents(message_content):
 
 def get_relationship_type(user_id):
     """Determine relationship type for a user"""
-    family_tree = yuno_config.get("family_tree", {})
-    mother_id = str(family_tree.get("mother_user_id", ""))
-    father_id = str(family_tree.get("father_user_id", ""))
-    extended_family = family_tree.get("extended_family", {})
-    
-    if str(user_id) == mother_id or str(user_id) == father_id:
-        return "parent"
-    elif str(user_id) in extended_family:
-        return extended_family[str(user_id)]["relationship"]
-    else:
-        return "friend"
+    return active_config.relationship_for(user_id)
 
 def analyze_emotional_tone(message_content):
     """Analyze emotional tone of message"""
@@ -228,27 +409,15 @@ def update_personality_from_conversation(user_id, message_content, emotional_ton
         "tone": emotional_tone,
         "timestamp": datetime.now().isoformat()
     })
+    shared_state.persist("add_emotional_record", user_key, emotional_tone)
     
     # Keep only last 50 emotional records per user
     if len(personality["conversation_patterns"][user_key]["emotional_history"]) > 50:
         personality["conversation_patterns"][user_key]["emotional_history"] = \
             personality["conversation_patterns"][user_key]["emotional_history"][-50:]
     
-    # Extract topics/interests
-    content_lower = message_content.lower()
-    interest_keywords = ['love', 'enjoy', 'like', 'interested in', 'fascinated by', 
-                        'hobby', 'passion', 'favorite']
-    
-    for keyword in interest_keywords:
-        if keyword in content_lower:
-            # Simple topic extraction (could be enhanced with NLP)
-            words_after_keyword = content_lower.split(keyword, 1)
-            if len(words_after_keyword) > 1:
-                potential_interest = words_after_keyword[1].strip().split()[0:3]
-                interest_phrase = ' '.join(potential_interest)
-                if interest_phrase and len(interest_phrase) > 2:
-                    if interest_phrase not in personality.get("interests", []):
-                        personality.setdefault("interests", []).append(interest_phrase)
+    # Count topics/interests (decayed, bounded per user and globally; see topic_stats.py)
+    topic_stats.record(personality, personality["conversation_patterns"][user_key], user_key, message_content)
 
 def determine_current_mood():
     """Determine Yuno's current mood based on recent interactions"""
@@ -302,12 +471,17 @@ def check_for_celebrations():
     
     return celebrations
 
-def should_check_in_on_user(user_id):
-    """Determine if should check in on user based on emotional history"""
+def should_check_in_on_user(user_id, pending_tone=None):
+    """Determine if should check in on user based on emotional history
+    
+    pending_tone is the tone of a message not yet recorded in the history.
+    """
     personality = yuno_config.get("personality_system", {})
     user_patterns = personality.get("conversation_patterns", {}).get(str(user_id), {})
     
     recent_emotions = user_patterns.get("emotional_history", [])[-5:]  # Last 5 interactions
+    if pending_tone is not None:
+        recent_emotions = recent_emotions[-4:] + [{"tone": pending_tone}]
     if not recent_emotions:
         return False
     
@@ -333,6 +507,7 @@ def save_memory_highlight(user_id, message_content, highlight_type):
         highlights[category_key] = []
     
     highlights[category_key].append(highlight_entry)
+    shared_state.persist("add_highlight", user_id, category_key, highlight_type, message_content)
     
     # Keep only last 100 highlights per category
     if len(highlights[category_key]) > 100:
@@ -340,14 +515,20 @@ def save_memory_highlight(user_id, message_content, highlight_type):
 
 async def manage_user_memory(user_id):
     """Manage memory for a user with compression and selective limits"""
-    if user_id not in memory:
+    if user_id not in memory or user_id in compressing_users:
         return
     
     current_limit = get_memory_limit_for_user(user_id)
     current_memory = memory[user_id]
     
+    # Under load, compression waits; let memory run to twice the limit meanwhile
+    if overload.level() >= overload.SKIP_COMPRESSION:
+        if len(current_memory) > 2 * current_limit:
+            memory[user_id] = current_memory[-2 * current_limit:]
+        return
+    
     # If we're over the compression threshold and have room to compress
-    if len(current_memory) > COMPRESSION_THRESHOLD:
+    if len(current_memory) > active_config.compression_threshold:
         # Calculate how many messages to compress
         excess_messages = len(current_memory) - current_limit
         
@@ -355,21 +536,41 @@ async def manage_user_memory(user_id):
             # Take oldest messages for compression (keep newer ones)
             messages_to_compress = current_memory[:excess_messages]
             
-            # Attempt compression
-            if await compress_old_memories(user_id, messages_to_compress):
+            # Attempt compression (new messages may arrive while it runs)
+            compressing_users.add(user_id)
+            try:
+                compressed = await compress_old_memories(user_id, messages_to_compress)
+            finally:
+                compressing_users.discard(user_id)
+            
+            if user_id not in memory:
+                return  # Cleared while compressing
+            if compressed:
                 # Remove compressed messages from active memory
-                memory[user_id] = current_memory[excess_messages:]
-                print(f"Successfully compressed {len(messages_to_compress)} messages for user {user_id}")
+                memory[user_id] = memory[user_id][excess_messages:]
+                logger.info("Successfully compressed %d messages", len(messages_to_compress),
+                            extra={"user": user_id, "stage": "compression"})
             else:
                 # Fallback: simple truncation if compression fails
-                memory[user_id] = current_memory[-current_limit:]
-                print(f"Compression failed, truncated to {current_limit} messages for user {user_id}")
+                memory[user_id] = memory[user_id][-current_limit:]
+                logger.warning("Compression failed, truncated to %d messages", current_limit,
+                               extra={"user": user_id, "stage": "compression"})
     
     # Final safety check - ensure we don't exceed limit
     if len(memory[user_id]) > current_limit:
         memory[user_id] = memory[user_id][-current_limit:]
 
-async def get_ai_response(user_id, message_content, relationship_type="friend", emotional_tone="neutral"):
+def remember_reply(user_id, ai_response):
+    """Add an assistant reply to the user's memory"""
+    memory[user_id].append({
+        "role": "assistant",
+        "content": ai_response
+    })
+    shared_state.persist("add_message", user_id, "assistant", ai_response,
+                         memory_recall.storage_limit(get_memory_limit_for_user(user_id)))
+
+async def get_ai_response(user_id, message_content, relationship_type="friend", emotional_tone="neutral",
+                          load_level=overload.NORMAL):
     """Get AI response from OpenRouter API"""
     try:
         # Initialize user memory if it doesn't exist
@@ -381,75 +582,384 @@ async def get_ai_response(user_id, message_content, relationship_type="friend",
             "role": "user",
             "content": message_content
         })
+        shared_state.persist("add_message", user_id, "user", message_content,
+                             memory_recall.storage_limit(get_memory_limit_for_user(user_id)))
         
-        # Manage memory with compression and selective limits
-        await manage_user_memory(user_id)
-        
-        # Prepare the API request
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        # Compression runs after the reply is sent (see after_reply);
+        # until then only the most recent messages go into the prompt
+        context_limit = get_memory_limit_for_user(user_id)
+        if load_level >= overload.SHRINK_CONTEXT and overload.controller is not None:
+            context_limit = max(2, int(context_limit * overload.controller.context_fraction))
+        recent_memory = memory[user_id][-context_limit:]
         
-        # Build dynamic system prompt based on config (Enhanced for Upgrade 1.5)
-        system_prompt = build_enhanced_system_prompt(yuno_config, user_id, relationship_type, emotional_tone)
+        # Serve repeated openers from the reply cache before any recall or routing work;
+        # the reply still goes into memory. The key covers only the stable prompt parts
+        # and the tone, not the mood hints that change from message to message
+        cache_key = intent = None
+        if reply_cache.cache is not None:
+            prompt_key = "\n\n".join((build_static_system_prompt(yuno_config),
+                                      build_user_context_prompt(yuno_config, user_id, relationship_type),
+                                      emotional_tone))
+            context = compressed_memory.get(user_id, []) + recent_memory[:-1]
+            cache_key, intent = reply_cache.cache.lookup_key(message_content, prompt_key, context)
+            if cache_key is not None:
+                cached_reply = reply_cache.cache.get(cache_key, intent)
+                if cached_reply is not None:
+                    remember_reply(user_id, cached_reply)
+                    return cached_reply
         
-        # Build message list with compressed memories + recent memories
-        messages_for_ai = [
-            {
-                "role": "system",
-                "content": system_prompt
-            }
-        ]
+        # Older turns relevant to this message, from the full history in Postgres
+        recalled = None
+        if load_level < overload.SHRINK_CONTEXT:
+            recalled = await memory_recall.recall(user_id, message_content, len(recent_memory))
         
-        # Add compressed memories if they exist
-        if user_id in compressed_memory:
-            messages_for_ai.extend(compressed_memory[user_id])
+        # Pick the model for this request (length, tone, relationship, live latency)
+        model = MODEL
+        if load_level >= overload.FASTEST_MODEL and overload.controller is not None:
+            model = overload.controller.fastest_model
+        elif model_router.router is not None:
+            model, _ = model_router.router.choose(len(message_content), emotional_tone, relationship_type)
         
-        # Add recent conversation memory
-        messages_for_ai.extend(memory[user_id])
+        # Build message list with a stable prefix for provider-side prompt caching:
+        # static prompt, user context, compressed memories and earlier turns first,
+        # then the per-message mood/tone hints right before the latest turn
+        messages_for_ai = build_prompt_messages(
+            yuno_config, user_id, compressed_memory.get(user_id, []), recent_memory,
+            relationship_type, emotional_tone, model, recalled
+        )
         
         payload = {
-            "model": MODEL,
+            "model": model,
             "messages": messages_for_ai,
-            "max_tokens": ai_settings["max_tokens"],
-            "temperature": ai_settings["temperature"]
+            # Short casual turns get a limit fitted to what replies to them really use
+            "max_tokens": usage_ledger.max_tokens_for(message_content, active_config.max_tokens),
+            "temperature": active_config.temperature
         }
         
         # Make the API call
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                OPENROUTER_API_URL,
-                headers=headers,
-                json=payload
-            )
+        response = await post_openrouter(payload, user_id, kind="chat")
+        
+        if response.status_code == 200:
+            data = response.data
+            ai_response = data["choices"][0]["message"]["content"]
+            usage_ledger.observe_reply(message_content, data)
             
-            if response.status_code == 200:
-                data = response.json()
-                ai_response = data["choices"][0]["message"]["content"]
-                
-                # Add AI response to memory
-                memory[user_id].append({
-                    "role": "assistant",
-                    "content": ai_response
-                })
-                
-                return ai_response
-            else:
-                print(f"OpenRouter API error: {response.status_code} - {response.text}")
-                return "Sorry, I'm having trouble connecting to my AI service right now. Please try again later."
+            # Add AI response to memory
+            remember_reply(user_id, ai_response)
+            
+            if cache_key is not None and reply_cache.cache is not None:
+                reply_cache.cache.put(cache_key, ai_response)
+            
+            return ai_response
+        else:
+            logger.error("OpenRouter API error: %s", response.text[:500], extra={
+                "user": user_id, "stage": "chat", "status": response.status_code})
+            return "Sorry, I'm having trouble connecting to my AI service right now. Please try again later."
                 
     except httpx.TimeoutException:
         return "Sorry, my response timed out. Please try again."
-    except Exception as e:
-        print(f"Error getting AI response: {str(e)}")
+    except Exception:
+        logger.exception("Error getting AI response", extra={"user": user_id, "stage": "chat"})
         return "Sorry, I encountered an error while processing your request. Please try again."
 
+def collect_runtime_state():
+    """Per-user runtime state for the warm-restart snapshot
+    
+    Only shallow copies are taken here; encoding happens off the event loop.
+    """
+    patterns = yuno_config.get("personality_system", {}).get("conversation_patterns", {})
+    user_ids = set(memory) | set(compressed_memory) | set(user_emotional_states) | set(last_interactions)
+    user_ids.update(int(key) for key in patterns if key.isdigit())
+    
+    states = {}
+    for user_id in user_ids:
+        if not isinstance(user_id, int):
+            continue
+        user_patterns = patterns.get(str(user_id))
+        states[user_id] = {
+            "memory": list(memory.get(user_id, [])),
+            "summaries": list(compressed_memory.get(user_id, [])),
+            "emotional_state": user_emotional_states.get(user_id),
+            "last_interaction": last_interactions.get(user_id),
+            "patterns": {
+                "topics": dict(user_patterns.get("topics", {})),
+                "emotional_history": list(user_patterns.get("emotional_history", []))
+            } if user_patterns else None
+        }
+    return states
+
+def restore_user_state(user_id):
+    """Restore a user's state from the warm-restart snapshot the first time they're seen"""
+    state = snapshot.take_user(user_id)
+    if not state:
+        return
+    
+    # Anything gathered since startup is newer than the snapshot
+    if state["memory"] and user_id not in memory:
+        memory[user_id] = state["memory"]
+    if state["summaries"] and user_id not in compressed_memory:
+        compressed_memory[user_id] = state["summaries"]
+    if state["emotional_state"] is not None:
+        user_emotional_states.setdefault(user_id, state["emotional_state"])
+    if state["last_interaction"] is not None:
+        last_interactions.setdefault(user_id, state["last_interaction"])
+    if state["patterns"]:
+        patterns = yuno_config.setdefault("personality_system", {}).setdefault("conversation_patterns", {})
+        patterns.setdefault(str(user_id), state["patterns"])
+
+async def save_snapshot():
+    """Write the warm-restart snapshot if enabled"""
+    settings = yuno_config.get("settings", {})
+    if not settings.get("snapshot_enabled", False):
+        return
+    try:
+        await snapshot.save(settings.get("snapshot_path", "yuno_state.snap"), collect_runtime_state())
+    except Exception as e:
+        logger.error("Error saving state snapshot: %s", e, extra={"stage": "snapshot"})
+
+async def snapshot_loop():
+    """Periodically snapshot runtime state"""
+    while True:
+        await asyncio.sleep(yuno_config.get("settings", {}).get("snapshot_interval_seconds", 300))
+        await save_snapshot()
+
+async def after_reply(user_id, clean_content, emotional_tone):
+    """Bookkeeping that doesn't affect the reply; runs once it has been sent"""
+    # Update personality and learning systems
+    if yuno_config.get("settings", {}).get("emotional_intelligence_enabled", True):
+        update_personality_from_conversation(user_id, clean_content, emotional_tone)
+        
+        # Save highlights for special moments
+        if emotional_tone == "achievement":
+            save_memory_highlight(user_id, clean_content, "achievement")
+        elif emotional_tone == "positive" and len(clean_content) > 50:
+            save_memory_highlight(user_id, clean_content, "favorite")
+    
+    # Manage memory with compression and selective limits
+    await manage_user_memory(user_id)
+
+async def generate_reply(user_id, clean_content, send_reply=None):
+    """Run the full reply pipeline for a cleaned message and return the text to send
+    
+    Only the inputs of the prompt are computed before the OpenRouter request is
+    dispatched. Appendices are worked out while it is in flight, and learning and
+    compression run in the background after send_reply(text) has been awaited.
+    Under overload the pipeline is trimmed down (see overload.py).
+    """
+    load_level = overload.reply_started()
+    try:
+        if load_level >= overload.BUSY_REPLY:
+            overload.controller.shed += 1
+            busy_reply = overload.controller.busy_reply
+            if send_reply is not None:
+                await send_reply(busy_reply)
+            return busy_reply
+        return await run_reply_pipeline(user_id, clean_content, send_reply, load_level)
+    finally:
+        overload.reply_finished()
+
+async def run_reply_pipeline(user_id, clean_content, send_reply, load_level):
+    """generate_reply's pipeline at a given overload level"""
+    started = time.perf_counter()
+    settings = yuno_config.get("settings", {})
+    prefetched = is_prefetched(user_id)
+    restore_user_state(user_id)
+    
+    # Another worker may have talked to this user since we last did (unless a typing
+    # prefetch just loaded them)
+    if not prefetched:
+        await shared_state.hydrate_user(user_id, memory, compressed_memory,
+                                        yuno_config.setdefault("personality_system", {}).setdefault("conversation_patterns", {}),
+                                        get_memory_limit_for_user(user_id))
+    
+    # Upgrade 1.5 - Enhanced message processing
+    relationship_type = get_relationship_type(user_id)
+    traffic_recorder.record_input(user_id, clean_content, relationship_type)
+    emotional_tone = analyze_emotional_tone(clean_content)
+    
+    # Update current mood (part of the system prompt); not worth the churn under load
+    if settings.get("mood_system_enabled", True) and load_level == overload.NORMAL:
+        current_mood = determine_current_mood()
+        yuno_config["personality_system"]["current_mood"] = current_mood
+    
+    # Get AI response with enhanced context; yield once so the request goes out now
+    response_task = asyncio.create_task(get_ai_response(user_id, clean_content, relationship_type, emotional_tone,
+                                                        load_level))
+    await asyncio.sleep(0)
+    dispatched = time.perf_counter()
+    
+    # Check for celebrations
+    celebrations = []
+    if settings.get("celebration_enabled", True):
+        celebrations = check_for_celebrations()
+    
+    # Check if should ping parents (Upgrade 1.3)
+    parent_ping_enabled = settings.get("parent_ping_enabled", True)
+    parent_type, parent_id = should_ping_parents(clean_content) if parent_ping_enabled else (None, None)
+    
+    # Check-in for emotional support (Upgrade 1.5)
+    check_in = (emotional_tone == "negative" and relationship_type == "parent"
+                and should_check_in_on_user(user_id, pending_tone=emotional_tone))
+    
+    ai_response = await response_task
+    
+    # Add celebrations if any (Upgrade 1.5)
+    if celebrations:
+        celebration_text = "\n\n" + "\n".join(celebrations)
+        ai_response += celebration_text
+    
+    # Add parent ping if appropriate (Upgrade 1.3)
+    if parent_type and parent_id:
+        try:
+            parent_user = bot.get_user(int(parent_id))
+            if parent_user:
+                ai_response += f"\n\n*waves at <@{parent_id}>* Hi {parent_type}! Someone's asking about you! 💕"
+            else:
+                # Fallback if user not in cache
+                ai_response += f"\n\n*waves at <@{parent_id}>* Hi {parent_type}! Someone's asking about you! 💕"
+        except (ValueError, TypeError):
+            # Invalid parent ID, skip ping
+            pass
+    
+    if check_in:
+        ai_response += f"\n\n*gives a gentle virtual hug* I've noticed you've been having a tough time lately. I'm here for you! 💙"
+    
+    if send_reply is not None:
+        await send_reply(ai_response)
+    
+    pipeline_timings.append({
+        "pre_dispatch_ms": (dispatched - started) * 1000,
+        "total_ms": (time.perf_counter() - started) * 1000,
+        "prefetched": prefetched,
+        "overload_level": load_level
+    })
+    
+    spawn_background(after_reply(user_id, clean_content, emotional_tone))
+    return ai_response
+
+async def reply_to_burst(user_id, channel_id, clean_content, send_reply):
+    """Answer rapid consecutive messages from a user with one request and one reply
+    
+    Messages arriving within the debounce window of the previous one are merged into
+    a single user turn, until burst_max_messages are collected, which sends the burst
+    at once. The reply goes to the latest message. Returns None for messages that
+    were folded into a burst that is already waiting.
+    """
+    settings = yuno_config.get("settings", {})
+    if not settings.get("burst_coalescing_enabled", False):
+        return await generate_reply(user_id, clean_content, send_reply=send_reply)
+    
+    window = settings.get("burst_window_ms", 1500) / 1000
+    key = (user_id, channel_id)
+    burst = pending_bursts.get(key)
+    if burst is not None:
+        burst["parts"].append(clean_content)
+        burst["send_reply"] = send_reply
+        burst["deadline"] = time.monotonic() + window
+        if len(burst["parts"]) >= settings.get("burst_max_messages", 5):
+            # Full: wake the waiting message now; the next one starts a new burst
+            del pending_bursts[key]
+            burst["full"].set()
+        return None
+    
+    burst = {"parts": [clean_content], "send_reply": send_reply, "deadline": time.monotonic() + window,
+             "full": asyncio.Event()}
+    pending_bursts[key] = burst
+    try:
+        while not burst["full"].is_set() and (remaining := burst["deadline"] - time.monotonic()) > 0:
+            try:
+                await asyncio.wait_for(burst["full"].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if pending_bursts.get(key) is burst:
+            del pending_bursts[key]
+    
+    if len(burst["parts"]) > 1:
+        logger.info("Coalesced %d messages into one reply", len(burst["parts"]),
+                    extra={"user": user_id, "stage": "coalesce", "count": len(burst["parts"])})
+    return await generate_reply(user_id, "\n".join(burst["parts"]), send_reply=burst["send_reply"])
+
+def is_prefetched(user_id):
+    """Whether a typing prefetch made this user's context hot recently"""
+    prefetched_at = prefetched_users.get(user_id)
+    ttl = yuno_config.get("settings", {}).get("typing_prefetch_ttl_seconds", 20)
+    return prefetched_at is not None and time.monotonic() - prefetched_at < ttl
+
+async def prefetch_user_context(user_id):
+    """Load a user's state, build their prompt blocks and warm the HTTP pool"""
+    prefetches_in_flight.add(user_id)
+    started = time.perf_counter()
+    try:
+        restore_user_state(user_id)
+        await shared_state.hydrate_user(user_id, memory, compressed_memory,
+                                        yuno_config.setdefault("personality_system", {}).setdefault("conversation_patterns", {}),
+                                        get_memory_limit_for_user(user_id))
+        build_static_system_prompt(yuno_config)
+        build_user_context_prompt(yuno_config, user_id, get_relationship_type(user_id))
+        await warm_http_connection()
+        prefetched_users[user_id] = time.monotonic()
+        logger.debug("Prefetched user context", extra={
+            "user": user_id, "stage": "prefetch", "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+    except Exception as e:
+        logger.warning("Prefetch failed: %s", e, extra={"user": user_id, "stage": "prefetch"})
+    finally:
+        prefetches_in_flight.discard(user_id)
+
+async def send_reply_chunks(message, text):
+    """Reply to a message, splitting text over Discord's 2000 character limit"""
+    if len(text) > 2000:
+        # Split at sentence boundaries when possible
+        sentences = text.split('. ')
+        current_message = ""
+        
+        for sentence in sentences:
+            if len(current_message + sentence + '. ') > 2000:
+                if current_message:
+                    await message.reply(current_message.strip())
+                current_message = sentence + '. '
+            else:
+                current_message += sentence + '. '
+        
+        if current_message:
+            await message.reply(current_message.strip())
+    else:
+        # Send the response as a reply
+        await message.reply(text)
+
+async def warm_up_database():
+    """Migrate, warm the pool and load shared config while the gateway logs in"""
+    started = time.perf_counter()
+    try:
+        import migrations
+        await asyncio.to_thread(migrations.bootstrap)
+        await shared_state.start(yuno_config, apply_shared_config)
+        logger.info("Database ready", extra={
+            "stage": "startup", "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+        if migrations.memory_partitions.PARTITIONING_ENABLED and WORKER_ID == 0:
+            spawn_background(partition_maintenance_loop())
+        if message_dedupe.claims_enabled and WORKER_ID == 0:
+            spawn_background(message_dedupe.purge_loop())
+        if usage_ledger.ledger is not None:
+            spawn_background(usage_ledger.flush_loop())
+    except Exception as e:
+        logger.error("Database warm-up failed: %s", e, extra={"stage": "startup"})
+
+async def partition_maintenance_loop():
+    """Create upcoming user_memory partitions and drop expired ones on a schedule"""
+    import memory_partitions
+    while True:
+        await asyncio.sleep(memory_partitions.MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(memory_partitions.maintain)
+        except Exception as e:
+            logger.error("Partition maintenance failed: %s", e, extra={"stage": "partitions"})
+
 @bot.event
 async def on_ready():
     """Event fired when bot is ready"""
-    print(f'{bot.user} has logged in to Discord!')
-    print(f'Bot is in {len(bot.guilds)} servers')
+    logger.info("%s has logged in to Discord!", bot.user)
+    logger.info("Bot is in %d servers", len(bot.guilds), extra={"count": len(bot.guilds)})
 
 @bot.event
 async def on_message(message):
@@ -461,20 +971,27 @@ async def on_message(message):
     # Check if bot was mentioned
     bot_mentioned = bot.user in message.mentions
     
-    # Check if this is a reply to one of our messages
+    # Check if this is a reply to one of our messages. Discord sends the replied-to
+    # message along with the event; only fetch it when it isn't there
     is_reply_to_bot = False
     if message.reference and message.reference.message_id:
-        try:
-            referenced_message = await message.channel.fetch_message(message.reference.message_id)
-            is_reply_to_bot = referenced_message.author == bot.user
-        except discord.NotFound:
-            is_reply_to_bot = False
-        except discord.HTTPException:
-            is_reply_to_bot = False
+        referenced_message = message.reference.resolved or message.reference.cached_message
+        if referenced_message is None:
+            try:
+                referenced_message = await message.channel.fetch_message(message.reference.message_id)
+            except discord.HTTPException:
+                referenced_message = None
+        # A deleted original comes through as DeletedReferencedMessage
+        is_reply_to_bot = isinstance(referenced_message, discord.Message) and referenced_message.author == bot.user
+    
+    # Gateway RESUMEs and overlapping deploys can deliver a message twice
+    acts_on_message = bot_mentioned or is_reply_to_bot or message.content.startswith(bot.command_prefix)
+    if acts_on_message and not await message_dedupe.first_time(message.id):
+        return
     
     # Respond if mentioned or replied to
     if bot_mentioned or is_reply_to_bot:
-        # Show typing indicator
+        # Show typing indicator (also while a burst of messages is being collected)
         async with message.channel.typing():
             # Clean the message content (remove mentions)
             clean_content = message.clean_content
@@ -486,94 +1003,49 @@ async def on_message(message):
             if not clean_content:
                 clean_content = "Hello!"
             
-            # Upgrade 1.5 - Enhanced message processing
-            user_id = message.author.id
-            relationship_type = get_relationship_type(user_id)
-            emotional_tone = analyze_emotional_tone(clean_content)
-            
-            # Update personality and learning systems
-            if yuno_config.get("settings", {}).get("emotional_intelligence_enabled", True):
-                update_personality_from_conversation(user_id, clean_content, emotional_tone)
-                
-                # Save highlights for special moments
-                if emotional_tone == "achievement":
-                    save_memory_highlight(user_id, clean_content, "achievement")
-                elif emotional_tone == "positive" and len(clean_content) > 50:
-                    save_memory_highlight(user_id, clean_content, "favorite")
-            
-            # Check for celebrations
-            celebrations = []
-            if yuno_config.get("settings", {}).get("celebration_enabled", True):
-                celebrations = check_for_celebrations()
-            
-            # Check if should ping parents (Upgrade 1.3)
-            parent_ping_enabled = yuno_config.get("settings", {}).get("parent_ping_enabled", True)
-            parent_type, parent_id = should_ping_parents(clean_content) if parent_ping_enabled else (None, None)
-            
-            # Update current mood
-            if yuno_config.get("settings", {}).get("mood_system_enabled", True):
-                current_mood = determine_current_mood()
-                yuno_config["personality_system"]["current_mood"] = current_mood
-            
-            # Get AI response with enhanced context
-            ai_response = await get_ai_response(user_id, clean_content, relationship_type, emotional_tone)
-            
-            # Add celebrations if any (Upgrade 1.5)
-            if celebrations:
-                celebration_text = "\n\n" + "\n".join(celebrations)
-                ai_response += celebration_text
-            
-            # Add parent ping if appropriate (Upgrade 1.3)
-            if parent_type and parent_id:
-                try:
-                    parent_user = bot.get_user(int(parent_id))
-                    if parent_user:
-                        ai_response += f"\n\n*waves at <@{parent_id}>* Hi {parent_type}! Someone's asking about you! 💕"
-                    else:
-                        # Fallback if user not in cache
-                        ai_response += f"\n\n*waves at <@{parent_id}>* Hi {parent_type}! Someone's asking about you! 💕"
-                except (ValueError, TypeError):
-                    # Invalid parent ID, skip ping
-                    pass
-            
-            # Check-in for emotional support (Upgrade 1.5)
-            if emotional_tone == "negative" and relationship_type == "parent":
-                if should_check_in_on_user(user_id):
-                    ai_response += f"\n\n*gives a gentle virtual hug* I've noticed you've been having a tough time lately. I'm here for you! 💙"
-            
-            # Split long responses into multiple messages if needed
-            if len(ai_response) > 2000:
-                # Split at sentence boundaries when possible
-                sentences = ai_response.split('. ')
-                current_message = ""
-                
-                for sentence in sentences:
-                    if len(current_message + sentence + '. ') > 2000:
-                        if current_message:
-                            await message.reply(current_message.strip())
-                        current_message = sentence + '. '
-                    else:
-                        current_message += sentence + '. '
-                
-                if current_message:
-                    await message.reply(current_message.strip())
-            else:
-                # Send the response as a reply
-                await message.reply(ai_response)
+            ai_response = await reply_to_burst(message.author.id, message.channel.id, clean_content,
+                                               send_reply=lambda text: send_reply_chunks(message, text))
+            if ai_response is not None:
+                active_channels[message.channel.id] = time.monotonic()
     
     # Process commands (if any are added later)
     await bot.process_commands(message)
 
+@bot.event
+async def on_typing(channel, user, when):
+    """Speculatively make a user's context hot while they type in an active channel"""
+    settings = yuno_config.get("settings", {})
+    if not settings.get("typing_prefetch_enabled", False) or user.bot:
+        return
+    
+    now = time.monotonic()
+    replied_at = active_channels.get(channel.id)
+    if replied_at is None or now - replied_at > settings.get("typing_prefetch_channel_ttl_seconds", 900):
+        return
+    if is_prefetched(user.id) or user.id in prefetches_in_flight:
+        return
+    # Prefetch budget: never more than a few at once
+    if len(prefetches_in_flight) >= settings.get("typing_prefetch_max_concurrent", 4):
+        return
+    
+    if len(prefetched_users) > 10000:
+        ttl = settings.get("typing_prefetch_ttl_seconds", 20)
+        for stale_user in [u for u, t in prefetched_users.items() if now - t >= ttl]:
+            del prefetched_users[stale_user]
+    
+    spawn_background(prefetch_user_context(user.id))
+
 @bot.event
 async def on_error(event, *args, **kwargs):
     """Handle bot errors"""
-    print(f'Bot error in {event}: {args}')
+    logger.exception("Bot error in %s: %s", event, args, extra={"stage": event})
 
 # Clear memory command (enhanced for Upgrade 1.2)
 @bot.command(name='clear_memory')
 async def clear_memory_command(ctx):
     """Clear all conversation memory for the user"""
     user_id = ctx.author.id
+    restore_user_state(user_id)
     cleared_items = []
     
     if user_id in memory:
@@ -584,6 +1056,9 @@ async def clear_memory_command(ctx):
         del compressed_memory[user_id]
         cleared_items.append("compressed summaries")
     
+    shared_state.persist("clear_user_memory", user_id)
+    shared_state.persist("clear_summaries", user_id)
+    
     if cleared_items:
         items_text = " and ".join(cleared_items)
         await ctx.send(f"Your conversation memory has been cleared! ({items_text})")
@@ -595,10 +1070,11 @@ async def clear_memory_command(ctx):
 async def memory_status_command(ctx):
     """Show enhanced memory status for the user"""
     user_id = ctx.author.id
+    restore_user_state(user_id)
     
     # Get user type and limits
     memory_limit = get_memory_limit_for_user(user_id)
-    is_parent = memory_limit == PARENT_MEMORY_SIZE
+    is_parent = active_config.is_parent(user_id)
     user_type = "Parent 👑" if is_parent else "User"
     
     # Count memories
@@ -621,37 +1097,90 @@ async def memory_status_command(ctx):
     
     await ctx.send(status_msg)
 
+def apply_config(new_config):
+    """Validate new_config and swap it in as the active configuration
+    
+    Raises ValueError (leaving the current config in place) if it is invalid.
+    """
+    global active_config, yuno_config
+    
+    compiled = compile_config(new_config)
+    active_config, yuno_config = compiled, compiled.data
+    traffic_recorder.configure(yuno_config.get("settings", {}))
+    reply_cache.configure(yuno_config.get("settings", {}))
+    model_router.configure(yuno_config, MODEL)
+    storage.configure(yuno_config.get("settings", {}))
+    overload.configure(yuno_config)
+    message_dedupe.configure(yuno_config.get("settings", {}), getattr(storage.backend, "name", None) == "postgres")
+    memory_recall.configure(yuno_config.get("settings", {}))
+    usage_ledger.configure(yuno_config.get("settings", {}), getattr(storage.backend, "name", None) == "postgres")
+    topic_stats.configure(yuno_config.get("settings", {}))
+    topic_stats.seed_interests(yuno_config.setdefault("personality_system", {}))
+    summary_batcher.configure(yuno_config.get("settings", {}), active_config.summary_model,
+                              post_openrouter, summarize_with_llm)
+    compact_history.configure(yuno_config.get("settings", {}))
+    logger.info("Applied config version %d", compiled.version, extra={"stage": "config"})
+
+def apply_shared_config(shared_config):
+    """Apply a config published by another worker, keeping our runtime state"""
+    try:
+        apply_config(shared_state.merge_runtime_state(shared_config, yuno_config))
+    except ValueError as e:
+        logger.error("Ignoring shared config: %s", e, extra={"stage": "config"})
+
+def save_config():
+    """Write the active config back to yuno_config.json and re-derive lookups from it"""
+    global config_file_seen
+    apply_config(yuno_config)
+    config_file_seen = save_config_file(yuno_config)
+
+async def reload_config_from_file(keep_runtime_state):
+    """Load yuno_config.json, apply it and share it with the other workers"""
+    global config_file_seen
+    config_file_seen = file_signature()
+    new_config = read_config_file()
+    if keep_runtime_state:
+        new_config = shared_state.merge_runtime_state(new_config, yuno_config)
+    apply_config(new_config)
+    await shared_state.publish_config(yuno_config)
+
+async def watch_config_file():
+    """Hot-reload yuno_config.json whenever it changes on disk"""
+    while True:
+        await asyncio.sleep(yuno_config.get("settings", {}).get("config_watch_interval_seconds", 5))
+        if file_signature() == config_file_seen:
+            continue
+        try:
+            # The file is edited by hand, so memories learned since it was written win
+            await reload_config_from_file(keep_runtime_state=True)
+        except (OSError, ValueError) as e:
+            logger.error("Not reloading changed config file: %s", e, extra={"stage": "config"})
+
 # Reload configuration command (enhanced for Upgrade 1.2)
 @bot.command(name='reload_config')
 async def reload_config_command(ctx):
     """Reload Yuno's configuration from file"""
-    global yuno_config, ai_settings, MAX_MEMORY_SIZE, PARENT_MEMORY_SIZE, COMPRESSION_THRESHOLD, SUMMARY_MODEL
-    
     try:
-        yuno_config = load_yuno_config()
-        ai_settings = get_ai_settings(yuno_config)
-        MAX_MEMORY_SIZE = ai_settings["memory_limit"]
-        PARENT_MEMORY_SIZE = ai_settings.get("parent_memory_limit", 50)
-        COMPRESSION_THRESHOLD = ai_settings.get("compression_threshold", 20)
-        SUMMARY_MODEL = ai_settings.get("summary_model", "mistralai/mistral-small-3.1")
+        await reload_config_from_file(keep_runtime_state=shared_state.enabled())
         
         personality_name = yuno_config["personality"].get("name", "Yuno")
-        await ctx.send(f"✅ Configuration reloaded! {personality_name} is ready with Upgrade 1.5 features:\n" +
-                      f"• Base memory: {MAX_MEMORY_SIZE} messages\n" +
-                      f"• Parent memory: {PARENT_MEMORY_SIZE} messages\n" +
-                      f"• Compression at: {COMPRESSION_THRESHOLD} messages\n" +
+        await ctx.send(f"✅ Configuration reloaded (version {active_config.version})! {personality_name} is ready with Upgrade 1.5 features:\n" +
+                      f"• Base memory: {active_config.memory_limit} messages\n" +
+                      f"• Parent memory: {active_config.parent_memory_limit} messages\n" +
+                      f"• Compression at: {active_config.compression_threshold} messages\n" +
                       f"• Mood system: {yuno_config.get('settings', {}).get('mood_system_enabled', True)}\n" +
                       f"• Emotional intelligence: {yuno_config.get('settings', {}).get('emotional_intelligence_enabled', True)}\n" +
                       f"• Current mood: {yuno_config.get('personality_system', {}).get('current_mood', 'cheerful')}")
     except Exception as e:
         await ctx.send(f"❌ Error reloading configuration: {str(e)}")
-        print(f"Config reload error: {e}")
+        logger.error("Config reload error: %s", e, extra={"stage": "config"})
 
 # View compressed memories command (new in Upgrade 1.2)
 @bot.command(name='view_summaries')
 async def view_summaries_command(ctx):
     """View compressed conversation summaries for the user"""
     user_id = ctx.author.id
+    restore_user_state(user_id)
     
     if user_id not in compressed_memory or not compressed_memory[user_id]:
         await ctx.send("You don't have any compressed conversation summaries yet.")
@@ -674,6 +1203,117 @@ async def view_summaries_command(ctx):
     else:
         await ctx.send(summary_text)
 
+@bot.command(name='cache_stats')
+async def cache_stats_command(ctx):
+    """Show reply cache hit rates"""
+    if reply_cache.cache is None:
+        await ctx.send("The reply cache is disabled. Set `reply_cache_enabled` in the settings to turn it on.")
+        return
+    
+    stats = reply_cache.cache.stats()
+    stats_msg = f"**🗃️ Reply Cache**\n"
+    stats_msg += f"Entries: {stats['entries']}/{reply_cache.cache.max_entries}\n"
+    stats_msg += f"Hit rate: {stats['hit_rate']*100:.1f}% ({stats['hits']} hits, {stats['misses']} misses)\n"
+    stats_msg += f"Evictions: {stats['evictions']} • Expirations: {stats['expirations']}\n"
+    
+    for intent, counts in stats["by_intent"].items():
+        stats_msg += f"• {intent}: {counts['hits']} hits, {counts['misses']} misses\n"
+    
+    await ctx.send(stats_msg)
+
+@bot.command(name='prefetch_stats')
+async def prefetch_stats_command(ctx):
+    """Compare reply latency for prefetched and cold users"""
+    prefetched = [t for t in pipeline_timings if t.get("prefetched")]
+    cold = [t for t in pipeline_timings if not t.get("prefetched")]
+    
+    if not prefetched or not cold:
+        await ctx.send("📊 Not enough replies yet to compare prefetched and cold users.")
+        return
+    
+    def mean(timings, key):
+        return sum(t[key] for t in timings) / len(timings)
+    
+    cold_dispatch = mean(cold, "pre_dispatch_ms")
+    hot_dispatch = mean(prefetched, "pre_dispatch_ms")
+    saved = (cold_dispatch - hot_dispatch) / cold_dispatch * 100 if cold_dispatch else 0.0
+    
+    stats_msg = f"**⚡ Typing Prefetch**\n"
+    stats_msg += f"Prefetched replies: {len(prefetched)} • Cold replies: {len(cold)}\n"
+    stats_msg += f"Time to dispatch: {hot_dispatch:.1f}ms prefetched vs {cold_dispatch:.1f}ms cold ({saved:.0f}% less)\n"
+    stats_msg += f"End to end: {mean(prefetched, 'total_ms'):.0f}ms prefetched vs {mean(cold, 'total_ms'):.0f}ms cold"
+    
+    await ctx.send(stats_msg)
+
+@bot.command(name='overload_status')
+async def overload_status_command(ctx):
+    """Show the current load-shedding level and the signals behind it"""
+    status = overload.health()
+    if not status["enabled"]:
+        await ctx.send("Load shedding is disabled. Set `overload.enabled` in the config to turn it on.")
+        return
+    
+    stats_msg = f"**🚦 Load: {status['level_name']} (level {status['level']})**\n"
+    stats_msg += f"Replies in progress: {status['pending']} • OpenRouter in flight: {status['in_flight']}\n"
+    stats_msg += f"Recent p95 latency: {status['p95_ms']:.0f}ms • Busy replies sent: {status['shed_replies']}\n"
+    stats_msg += "Time at level: " + ", ".join(f"{name} {seconds:.0f}s" for name, seconds in status["seconds_at_level"].items())
+    await ctx.send(stats_msg)
+
+@bot.command(name='routing_stats')
+async def routing_stats_command(ctx):
+    """Show model routing decisions and live per-model latency"""
+    if model_router.router is None:
+        await ctx.send("Model routing is disabled. Set `model_routing.enabled` in the config to turn it on.")
+        return
+    
+    exported = model_router.router.export()
+    stats_msg = f"**🧭 Model Routing**\n"
+    for model, stats in exported["models"].items():
+        health = "✅" if stats["healthy"] else "⚠️"
+        stats_msg += (f"{health} `{model}`: {stats['requests']} requests, {stats['errors']} errors, "
+                      f"p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms\n")
+    
+    if exported["decisions"]:
+        stats_msg += "\n**Decisions by rule:**\n"
+        for rule, counts in exported["decisions"].items():
+            picks = ", ".join(f"{model} ×{count}" for model, count in counts.items())
+            stats_msg += f"• {rule}: {picks}\n"
+    
+    await ctx.send(stats_msg)
+
+@bot.command(name='usage')
+async def usage_command(ctx, days: int = 0):
+    """Show LLM token usage, latency and spend per model and for the heaviest users (parents only)"""
+    if not active_config.is_parent(ctx.author.id):
+        await ctx.send("❌ Only my parents can see usage!")
+        return
+    if usage_ledger.ledger is None:
+        await ctx.send("The usage ledger is disabled. Set `usage_ledger_enabled` in the config to turn it on.")
+        return
+    
+    report = await usage_ledger.summary(days or None)
+    period = f"last {report['days']} days" if report["days"] else "since this worker started"
+    stats_msg = f"**📊 LLM Usage ({period})**\n"
+    for row in sorted(report["models"], key=lambda row: row["requests"], reverse=True):
+        requests = row["requests"] or 1
+        stats_msg += (f"`{row['model']}`: {row['requests']} requests, {row['prompt_tokens']:,} in / "
+                      f"{row['completion_tokens']:,} out tokens, avg {row['latency_ms'] / requests:.0f}ms")
+        stats_msg += f", cost {row['cost']:.4f}\n" if row["cost"] else "\n"
+    if not report["models"]:
+        stats_msg += "No requests recorded yet.\n"
+    
+    if report["users"]:
+        stats_msg += "\n**Heaviest users:**\n"
+        for row in report["users"]:
+            stats_msg += (f"<@{row['user_id']}>: {row['requests']} requests, "
+                          f"{row['prompt_tokens'] + row['completion_tokens']:,} tokens\n")
+    
+    if usage_ledger.limits is not None:
+        stats_msg += "\n**Adaptive max_tokens:** " + ", ".join(
+            f"{bucket} {limit['max_tokens']} ({limit['samples']} samples, {limit['truncated']} cut off)"
+            for bucket, limit in usage_ledger.limits.export(active_config.max_tokens).items())
+    await ctx.send(stats_msg[:2000], allowed_mentions=discord.AllowedMentions.none())
+
 # Test parent ping command (new in Upgrade 1.3)
 @bot.command(name='test_ping')
 async def test_ping_command(ctx, *, test_message: str = "Who are your parents?"):
@@ -697,10 +1337,7 @@ async def toggle_ping_command(ctx):
     """Toggle parent ping feature on/off"""
     # Only allow parents to toggle this
     user_id = ctx.author.id
-    mother_id = str(yuno_config.get("user_specific_memories", {}).get("mother_user_id", ""))
-    father_id = str(yuno_config.get("user_specific_memories", {}).get("father_user_id", ""))
-    
-    if str(user_id) not in [mother_id, father_id]:
+    if not active_config.is_parent(user_id):
         await ctx.send("❌ Only my parents can toggle this feature!")
         return
     
@@ -710,9 +1347,9 @@ async def toggle_ping_command(ctx):
     
     # Save to file
     try:
-        with open('yuno_config.json', 'w') as f:
-            json.dump(yuno_config, f, indent=2)
+        save_config()
         
+        await shared_state.publish_config(yuno_config)
         status = "ENABLED" if not current_setting else "DISABLED"
         await ctx.send(f"✅ Parent ping feature is now **{status}**!")
     except Exception as e:
@@ -725,11 +1362,7 @@ async def add_birthday_command(ctx, person_name: str, *, date: str):
     """Add a birthday to remember (MM-DD format)"""
     # Only allow parents to add birthdays
     user_id = ctx.author.id
-    family_tree = yuno_config.get("family_tree", {})
-    mother_id = str(family_tree.get("mother_user_id", ""))
-    father_id = str(family_tree.get("father_user_id", ""))
-    
-    if str(user_id) not in [mother_id, father_id]:
+    if not active_config.is_parent(user_id):
         await ctx.send("❌ Only my parents can manage important dates!")
         return
     
@@ -739,8 +1372,8 @@ async def add_birthday_command(ctx, person_name: str, *, date: str):
         yuno_config.setdefault("important_dates", {}).setdefault("birthdays", {})[person_name] = date
         
         # Save to file
-        with open('yuno_config.json', 'w') as f:
-            json.dump(yuno_config, f, indent=2)
+        save_config()
+        await shared_state.publish_config(yuno_config)
         
         await ctx.send(f"🎂 Added {person_name}'s birthday on {date}! I'll celebrate with them!")
     except ValueError:
@@ -755,7 +1388,7 @@ async def personality_status_command(ctx):
     current_mood = personality.get("current_mood", "cheerful")
     base_traits = personality.get("base_traits", [])
     learned_traits = personality.get("learned_traits", [])
-    interests = personality.get("interests", [])
+    interests = topic_stats.top_interests(personality)
     
     status_msg = f"**🎭 Yuno's Personality Status**\n"
     status_msg += f"Current mood: {current_mood}\n\n"
@@ -768,7 +1401,7 @@ async def personality_status_command(ctx):
         status_msg += "**Learned traits:** Still developing!\n"
     
     if interests:
-        status_msg += f"**Current interests:** {', '.join(interests[-5:])}\n"
+        status_msg += f"**Current interests:** {', '.join(interests[:5])}\n"
     else:
         status_msg += "**Current interests:** Learning what the family enjoys!\n"
     
@@ -787,10 +1420,13 @@ async def family_highlights_command(ctx):
     
     # Get highlights for this user
     user_highlights = []
-    for category in ["favorite_memories", "achievement_moments", "emotional_peaks"]:
-        for highlight in highlights.get(category, []):
-            if highlight.get("user_id") == str(user_id):
-                user_highlights.append(highlight)
+    if shared_state.persistent():
+        user_highlights = await shared_state.load_highlights(user_id)
+    else:
+        for category in ["favorite_memories", "achievement_moments", "emotional_peaks"]:
+            for highlight in highlights.get(category, []):
+                if highlight.get("user_id") == str(user_id):
+                    user_highlights.append(highlight)
     
     if not user_highlights:
         await ctx.send("✨ We haven't created any special memories together yet! Chat with me more to build our highlights!")
@@ -818,11 +1454,7 @@ async def add_family_command(ctx, user_mention: str, relationship: str):
     """Add extended family member (parents only)"""
     # Only allow parents to manage family
     user_id = ctx.author.id
-    family_tree = yuno_config.get("family_tree", {})
-    mother_id = str(family_tree.get("mother_user_id", ""))
-    father_id = str(family_tree.get("father_user_id", ""))
-    
-    if str(user_id) not in [mother_id, father_id]:
+    if not active_config.is_parent(user_id):
         await ctx.send("❌ Only my parents can manage the family tree!")
         return
     
@@ -841,14 +1473,15 @@ async def add_family_command(ctx, user_mention: str, relationship: str):
         return
     
     # Add to family tree
+    family_tree = yuno_config.setdefault("family_tree", {})
     family_tree.setdefault("extended_family", {})[mentioned_user_id] = {
         "relationship": relationship.lower(),
         "added_by": str(user_id)
     }
     
     try:
-        with open('yuno_config.json', 'w') as f:
-            json.dump(yuno_config, f, indent=2)
+        save_config()
+        await shared_state.publish_config(yuno_config)
         
         await ctx.send(f"👨‍👩‍👧‍👦 Added {user_mention} as my {relationship}! Nice to meet you, family! 💕")
     except Exception as e:
@@ -906,7 +1539,7 @@ async def check_celebrations_command(ctx):
 async def yuno_interests_command(ctx):
     """Show what Yuno has learned to be interested in"""
     personality = yuno_config.get("personality_system", {})
-    interests = personality.get("interests", [])
+    interests = topic_stats.top_interests(personality)
     
     if not interests:
         await ctx.send("🌱 I'm still learning what interests me from our conversations! Talk to me about your hobbies and passions!")
@@ -914,8 +1547,18 @@ async def yuno_interests_command(ctx):
     
     interest_msg = f"**🎨 Things I've Learned to Love:**\n\n"
     
-    for i, interest in enumerate(interests[-15:], 1):  # Show last 15 interests
-        interest_msg += f"• {interest}\n"
+    scores = personality.get("topic_scores", {})
+    for interest in interests:  # Top interests first
+        if interest in scores:
+            interest_msg += f"• {interest} ({topic_stats.decayed_count(scores[interest]):.1f} recent mentions)\n"
+        else:
+            interest_msg += f"• {interest}\n"
+    
+    # What this user talks about most
+    user_patterns = personality.get("conversation_patterns", {}).get(str(ctx.author.id), {})
+    user_topics = topic_stats.user_top_topics(user_patterns, str(ctx.author.id))
+    if user_topics:
+        interest_msg += f"\n💬 You talk to me most about: {', '.join(user_topics[:5])}\n"
     
     interest_msg += f"\n💡 I discovered these through our family conversations! The more we chat, the more I learn about what makes life interesting!"
     
@@ -925,24 +1568,58 @@ async def main():
     """Main function to start the bot"""
     # Check if required environment variables are set
     if not DISCORD_TOKEN:
-        print("ERROR: DISCORD_TOKEN not found in environment variables!")
+        logger.critical("DISCORD_TOKEN not found in environment variables!")
         return
     
     if not OPENROUTER_API_KEY:
-        print("ERROR: OPENROUTER_API_KEY not found in environment variables!")
+        logger.critical("OPENROUTER_API_KEY not found in environment variables!")
         return
     
+    # Warm restart: users are restored lazily from the last snapshot
+    settings = yuno_config.get("settings", {})
+    if settings.get("snapshot_enabled", False):
+        snapshot.open_snapshot(settings.get("snapshot_path", "yuno_state.snap"))
+        
+        spawn_background(snapshot_loop())
+        
+        # Snapshot on SIGTERM (redeploys) before disconnecting
+        async def shutdown():
+            await save_snapshot()
+            await bot.close()
+        
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: spawn_background(shutdown()))
+        except NotImplementedError:
+            pass  # Signal handlers aren't available on Windows event loops
+    
     try:
-        # Start the keep-alive server
-        keep_alive()
+        # Start the keep-alive server (one per host when running several workers)
+        if WORKER_ID == 0:
+            keep_alive()
+        
+        # Warm up the database concurrently with the gateway login
+        if getattr(storage.backend, "name", None) == "postgres":
+            spawn_background(warm_up_database())
+        
+        # Pick up edits to yuno_config.json (one watcher per host; it publishes to the rest)
+        if settings.get("config_watch_enabled", True) and (WORKER_ID == 0 or not shared_state.enabled()):
+            spawn_background(watch_config_file())
         
         # Start the Discord bot
         await bot.start(DISCORD_TOKEN)
     except discord.LoginFailure:
-        print("ERROR: Invalid Discord token!")
+        logger.critical("Invalid Discord token!")
     except Exception as e:
-        print(f"ERROR: Failed to start bot - {str(e)}")
+        logger.critical("Failed to start bot: %s", e)
+    finally:
+        await usage_ledger.flush()
+        await shared_state.stop()
+
+# Time spent importing and setting up this module (see check_import_budget.py)
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 if __name__ == "__main__":
+    logger.info("Startup imports finished", extra={"stage": "startup", "latency_ms": round(IMPORT_SECONDS * 1000, 1)})
     # Run the bot
     asyncio.run(main())
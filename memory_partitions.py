@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Optional storage mode: user_memory range-partitioned by month on "timestamp".
+# Retention is enforced by dropping whole partitions instead of deleting rows, so
+# old conversations leave no dead tuples or index bloat behind; add_message skips
+# its per-insert trim in this mode. Reads and writes in models.py are otherwise
+# unchanged; Postgres routes them to the right partitions. Rows outside every
+# monthly partition land in a DEFAULT partition instead of failing to insert.
+PARTITIONING_ENABLED = os.getenv("MEMORY_PARTITIONING", "").lower() in ("1", "true", "yes")
+RETENTION_MONTHS = int(os.getenv("MEMORY_RETENTION_MONTHS", "12"))  # including the current month
+MONTHS_AHEAD = int(os.getenv("MEMORY_PARTITIONS_AHEAD", "2"))
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MEMORY_PARTITION_CHECK_SECONDS", str(6 * 3600)))
+
+# Arbitrary key so only one worker converts or maintains partitions at a time
+PARTITION_LOCK_ID = 726412
+
+DEFAULT_PARTITION = "user_memory_default"
+
+_PARTITION_NAME = re.compile(r"^user_memory_p(\d{4})(\d{2})$")
+
+
+def month_start(moment, offset=0):
+    """First day of the month `offset` months away from moment"""
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"user_memory_p{month:%Y%m}"
+
+
+def retention_cutoff(now):
+    """Start of the oldest month kept"""
+    return month_start(now, 1 - RETENTION_MONTHS)
+
+
+def is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('user_memory')"
+    )).scalar() is True
+
+
+def list_partitions(conn):
+    """{month start: partition name} for the monthly partitions of user_memory"""
+    names = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'user_memory'::regclass"
+    )).scalars()
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(conn, month):
+    """Create a month's partition, moving any of its rows out of the default partition"""
+    bounds = {"start": month, "end": month_start(month, 1)}
+    has_default = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": DEFAULT_PARTITION}).scalar()
+    if has_default:
+        # Postgres refuses a new partition while the default one holds rows in its range
+        conn.execute(text(
+            "CREATE TEMP TABLE moved_memory ON COMMIT DROP AS SELECT id, user_id, role, content, timestamp "
+            f"FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+        ), bounds)
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"), bounds)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF user_memory "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')"
+    ))
+    if has_default:
+        conn.execute(text(
+            "INSERT INTO user_memory (id, user_id, role, content, timestamp) SELECT * FROM moved_memory"
+        ))
+        conn.execute(text("DROP TABLE moved_memory"))
+
+
+def create_default_partition(conn):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF user_memory DEFAULT"))
+
+
+def convert(conn, now):
+    """Replace a plain user_memory table with a partitioned one
+
+    Rows inside the retention window are copied across (keeping their ids); older
+    rows are dropped with the old table. Runs in the caller's transaction and holds
+    the table lock until it commits, so expect a pause proportional to table size.
+    """
+    cutoff = retention_cutoff(now)
+    conn.execute(text("ALTER TABLE user_memory RENAME TO user_memory_unpartitioned"))
+    conn.execute(text("ALTER SEQUENCE user_memory_id_seq OWNED BY NONE"))
+    conn.execute(text(
+        "CREATE TABLE user_memory ("
+        "id INTEGER NOT NULL DEFAULT nextval('user_memory_id_seq'), "
+        "user_id VARCHAR, role VARCHAR, content TEXT, "
+        "timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'), "
+        "content_tsv tsvector GENERATED ALWAYS AS "
+        f"(to_tsvector('{models.SEARCH_CONFIG}', coalesce(content, ''))) STORED"
+        ") PARTITION BY RANGE (timestamp)"
+    ))
+
+    newest = conn.execute(text("SELECT MAX(timestamp) FROM user_memory_unpartitioned")).scalar()
+    last_month = max(month_start(now, MONTHS_AHEAD), month_start(newest) if newest else cutoff)
+    month = cutoff
+    while month <= last_month:
+        create_partition(conn, month)
+        month = month_start(month, 1)
+    create_default_partition(conn)
+
+    copied = conn.execute(text(
+        "INSERT INTO user_memory (id, user_id, role, content, timestamp) "
+        "SELECT id, user_id, role, content, COALESCE(timestamp, now() AT TIME ZONE 'utc') "
+        "FROM user_memory_unpartitioned "
+        "WHERE timestamp IS NULL OR timestamp >= :cutoff"
+    ), {"cutoff": cutoff}).rowcount
+    conn.execute(text("DROP TABLE user_memory_unpartitioned"))
+    conn.execute(text("ALTER SEQUENCE user_memory_id_seq OWNED BY user_memory.id"))
+    conn.execute(text("ALTER TABLE user_memory ADD PRIMARY KEY (id, timestamp)"))
+    conn.execute(text("CREATE INDEX ix_user_memory_user_id ON user_memory (user_id, timestamp)"))
+    conn.execute(text("CREATE INDEX ix_user_memory_content_tsv ON user_memory USING GIN (content_tsv)"))
+    logger.info("Converted user_memory to monthly partitions (%d rows kept)", copied,
+                extra={"stage": "partitions", "count": copied})
+
+
+def maintain(engine=None, now=None):
+    """Convert if needed, create upcoming partitions and drop expired ones
+
+    Returns (created partition names, dropped partition names).
+    """
+    engine = engine or models.get_engine()
+    if engine.dialect.name != "postgresql":
+        logger.warning("Memory partitioning needs Postgres; skipping", extra={"stage": "partitions"})
+        return [], []
+    now = now or datetime.utcnow()
+    created, dropped = [], []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+        if not is_partitioned(conn):
+            convert(conn, now)
+        create_default_partition(conn)  # tables converted before it existed
+        existing = list_partitions(conn)
+
+        for offset in range(MONTHS_AHEAD + 1):
+            month = month_start(now, offset)
+            if month not in existing:
+                create_partition(conn, month)
+                created.append(partition_name(month))
+
+        cutoff = retention_cutoff(now)
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"), {"cutoff": cutoff})
+        for month, name in sorted(existing.items()):
+            if month < cutoff:
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+
+    if created or dropped:
+        logger.info("Memory partitions: created %s, dropped %s", created, dropped, extra={"stage": "partitions"})
+    return created, dropped
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    created, dropped = maintain()
+    print(f"Created {len(created)} and dropped {len(dropped)} user_memory partitions")
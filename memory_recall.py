@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import extractive_summarizer
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Long-term recall. Only the newest memory_limit turns (plus lossy summaries) reach
+# the prompt; with recall enabled the whole history stays in user_memory and the
+# older turns most relevant to the incoming message are searched for with Postgres
+# full-text search (content_tsv and its GIN index, migration 5) and added to the
+# prompt within a token budget. A search slower than the latency budget is dropped,
+# and the reply goes out without it. Needs the Postgres storage backend.
+
+MAX_QUERY_TERMS = 12
+MAX_TURN_CHARS = 400  # longer recalled turns are cut
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for a budget
+
+_TERM_RE = re.compile(r"[^a-z0-9]")
+
+# Set from settings by configure()
+enabled = False
+top_k = 3
+max_tokens = 300
+timeout_ms = 150
+history_limit = 5000  # messages kept per user in user_memory while recall is on
+cache = None
+stats = {"searches": 0, "cache_hits": 0, "recalled": 0, "timeouts": 0, "errors": 0}
+
+
+class RecallCache:
+    """LRU of recall results per (user, query terms, skip_recent), expiring after ttl_seconds"""
+
+    def __init__(self, max_size=1000, ttl_seconds=300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored at, result)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, result):
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def configure(settings):
+    """Apply the memory_recall_* settings; call after storage.configure()"""
+    global enabled, top_k, max_tokens, timeout_ms, history_limit, cache
+    enabled = settings.get("memory_recall_enabled", False) and getattr(storage.backend, "name", None) == "postgres"
+    top_k = settings.get("memory_recall_top_k", 3)
+    max_tokens = settings.get("memory_recall_max_tokens", 300)
+    timeout_ms = settings.get("memory_recall_timeout_ms", 150)
+    history_limit = settings.get("memory_recall_history_limit", 5000)
+    cache = RecallCache(settings.get("memory_recall_cache_size", 1000),
+                        settings.get("memory_recall_cache_seconds", 300)) if enabled else None
+
+
+def storage_limit(memory_limit):
+    """How many messages add_message keeps for a user: their whole history while recall is on"""
+    return max(memory_limit, history_limit) if enabled else memory_limit
+
+
+def health():
+    """Recall section of /health"""
+    return dict(stats, enabled=enabled, cached=len(cache) if cache is not None else 0)
+
+
+def query_terms(message_content):
+    """Distinct content words of a message, safe to join into a to_tsquery expression"""
+    terms = []
+    for word in extractive_summarizer.content_words(message_content):
+        term = _TERM_RE.sub("", word)
+        if len(term) > 2 and term not in terms:
+            terms.append(term)
+    return tuple(terms[:MAX_QUERY_TERMS])
+
+
+def format_recalled(turns):
+    """System message with recalled turns, oldest first, cut to the token budget"""
+    lines, budget = [], max_tokens * CHARS_PER_TOKEN
+    for turn in turns:  # best match first, so the budget goes to the best ones
+        content = turn["content"].strip()
+        if len(content) > MAX_TURN_CHARS:
+            content = content[:MAX_TURN_CHARS].rsplit(" ", 1)[0] + "..."
+        speaker = "They said" if turn["role"] == "user" else "You said"
+        line = f"- [{turn['timestamp']:%Y-%m-%d}] {speaker}: {content}"
+        if len(line) > budget:
+            break
+        budget -= len(line)
+        lines.append((turn["timestamp"], line))
+    if not lines:
+        return None
+    lines.sort()
+    return {
+        "role": "system",
+        "content": "Earlier moments with this user that relate to what they just said:\n"
+                   + "\n".join(line for _, line in lines)
+    }
+
+
+async def recall(user_id, message_content, skip_recent):
+    """Recall message for the prompt, or None (off, nothing relevant, or over the latency budget)
+
+    skip_recent is how many of the user's newest messages are already in the prompt.
+    """
+    if not enabled:
+        return None
+    terms = query_terms(message_content)
+    if not terms:
+        return None
+    # The recent window is part of the query: a result found with a shorter window
+    # could hold turns that are in the prompt by now
+    key = (user_id, terms, skip_recent)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        stats["cache_hits"] += 1
+        return cached[1]
+
+    import models
+    stats["searches"] += 1
+    started = time.perf_counter()
+    try:
+        turns = await asyncio.wait_for(
+            asyncio.to_thread(models.search_user_memory, user_id, " | ".join(terms), top_k, skip_recent, timeout_ms),
+            timeout_ms / 1000
+        )
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        logger.warning("Memory recall over its %dms budget", timeout_ms,
+                       extra={"user": user_id, "stage": "recall", "status": "timeout"})
+        return None
+    except Exception as e:
+        # The statement timeout also lands here when the database gives up first
+        stats["errors"] += 1
+        logger.error("Error recalling memories: %s", e, extra={"user": user_id, "stage": "recall"})
+        return None
+
+    result = format_recalled(turns)
+    if cache is not None:
+        cache.put(key, result)
+    if result is not None:
+        stats["recalled"] += 1
+    logger.info("Recalled %d older turns", len(turns), extra={
+        "user": user_id, "stage": "recall", "count": len(turns),
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+    return result
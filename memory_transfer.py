@@ -0,0 +1,210 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from itertools import islice
+
+import memory_partitions
+import models
+
+logger = logging.getLogger(__name__)
+
+# Bulk export/import of user_memory through Postgres COPY.
+#
+#   python memory_transfer.py export memory.ndjson.gz [--user ID ...]
+#   python memory_transfer.py import memory.ndjson.gz [--user ID ...] [--batch-rows N] [--restart]
+#
+# Files are NDJSON or CSV (picked by extension), gzipped when the name ends in .gz.
+# Rows stream through in fixed-size chunks, so memory use doesn't grow with the table.
+# Imports commit every --batch-rows input rows together with their position in
+# import_progress, so an interrupted import picks up where it stopped when rerun.
+
+IMPORT_COLUMNS = ("user_id", "role", "content", "timestamp")
+COPY_CHUNK_BYTES = 1 << 20
+
+_END = object()
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def _open(path, mode):
+    opener = gzip.open if path.endswith(".gz") else open
+    if "b" in mode:
+        return opener(path, mode)
+    return opener(path, mode, encoding="utf-8", newline="")
+
+
+def _raw_connection():
+    engine = models.get_engine()
+    if engine.dialect.name != "postgresql":
+        raise ValueError("Bulk transfer uses COPY and needs a Postgres DATABASE_URL")
+    return engine.raw_connection()
+
+
+def _select_query(cursor, user_ids):
+    query = "SELECT id, user_id, role, content, timestamp FROM user_memory"
+    if user_ids:
+        query += cursor.mogrify(" WHERE user_id = ANY(%s)", ([str(u) for u in user_ids],)).decode()
+    return query + " ORDER BY id"
+
+
+def export_memory(path, user_ids=None, fmt=None):
+    """Stream user_memory (optionally only some users) to path; returns the row count"""
+    fmt = fmt or detect_format(path)
+    conn = _raw_connection()
+    try:
+        cursor = conn.cursor()
+        select = _select_query(cursor, user_ids)
+        if fmt == "csv":
+            copy = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+        else:
+            # One JSON document per line; quote/delimiter bytes that never occur in JSON
+            # keep COPY from escaping anything
+            copy = (f"COPY (SELECT row_to_json(m) FROM ({select}) m) TO STDOUT "
+                    "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+        with _open(path, "wb") as f:
+            cursor.copy_expert(copy, f, size=COPY_CHUNK_BYTES)
+        count = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info("Exported %d rows to %s", count, path, extra={"stage": "export", "count": count})
+    return count
+
+
+def read_rows(path, fmt=None):
+    """Yield (user_id, role, content, timestamp) for every row of an export file"""
+    fmt = fmt or detect_format(path)
+    with _open(path, "rt") as f:
+        if fmt == "csv":
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            positions = [header.index(column) for column in IMPORT_COLUMNS]
+            for row in reader:
+                values = [row[position] for position in positions]
+                yield values[0], values[1], values[2], values[3] or None
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(column) for column in IMPORT_COLUMNS)
+
+
+def _csv_field(value):
+    if value is None:
+        return ""  # unquoted empty field is NULL to COPY
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CopyBatch:
+    """File-like object feeding COPY ... FROM STDIN from a row iterator, up to `limit` rows
+
+    Rows that are None were filtered out: they count towards the limit (they are part
+    of the input position) but aren't sent.
+    """
+
+    def __init__(self, rows, limit):
+        self.rows = rows
+        self.limit = limit
+        self.count = 0
+        self.exhausted = False
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self.count < self.limit:
+            row = next(self.rows, _END)
+            if row is _END:
+                self.exhausted = True
+                break
+            self.count += 1
+            if row is not None:
+                self._buffer += ",".join(_csv_field(value) for value in row) + "\n"
+        if size < 0 or len(self._buffer) <= size:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def import_memory(path, user_ids=None, fmt=None, batch_rows=50000, restart=False):
+    """Load an export file into user_memory, resuming a previous run of the same file
+
+    Rows get new ids; their timestamps (which order get_user_memory) are kept.
+    With partitioning on, rows older than the retention window are skipped.
+    Returns the number of rows inserted by this run.
+    """
+    source = f"{os.path.basename(path)}:{os.path.getsize(path)}"
+    wanted = {str(u) for u in user_ids} if user_ids else None
+    rows = read_rows(path, fmt)
+    if wanted is not None:
+        rows = (row if str(row[0]) in wanted else None for row in rows)
+    if memory_partitions.PARTITIONING_ENABLED:
+        # Exported timestamps start with YYYY-MM-DD, so they compare as strings
+        cutoff = f"{memory_partitions.retention_cutoff(datetime.utcnow()):%Y-%m-%d}"
+        rows = (None if row is not None and row[3] and str(row[3]) < cutoff else row for row in rows)
+
+    conn = _raw_connection()
+    imported = 0
+    try:
+        cursor = conn.cursor()
+        if restart:
+            cursor.execute("DELETE FROM import_progress WHERE source = %s", (source,))
+            conn.commit()
+        cursor.execute("SELECT rows_done FROM import_progress WHERE source = %s", (source,))
+        found = cursor.fetchone()
+        done = found[0] if found else 0
+        if done:
+            logger.info("Resuming import of %s after %d rows", path, done, extra={"stage": "import", "count": done})
+            for _ in islice(rows, done):
+                pass
+
+        copy = f"COPY user_memory ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        while True:
+            batch = CopyBatch(rows, batch_rows)
+            cursor.copy_expert(copy, batch, size=COPY_CHUNK_BYTES)
+            imported += max(cursor.rowcount, 0)
+            done += batch.count
+            cursor.execute(
+                "INSERT INTO import_progress (source, rows_done, updated_at) VALUES (%s, %s, now()) "
+                "ON CONFLICT (source) DO UPDATE SET rows_done = EXCLUDED.rows_done, updated_at = now()",
+                (source, done)
+            )
+            conn.commit()
+            logger.info("Imported %d rows from %s", imported, path, extra={"stage": "import", "count": done})
+            if batch.exhausted:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export/import of Yuno's conversation memory")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="NDJSON or CSV file, gzipped if it ends in .gz")
+    parser.add_argument("--user", action="append", dest="users", help="only this Discord user ID (repeatable)")
+    parser.add_argument("--format", choices=("ndjson", "csv"), help="override the format implied by the file name")
+    parser.add_argument("--batch-rows", type=int, default=50000, help="rows per committed import batch")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved position of a previous import")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.action == "export":
+        count = export_memory(args.path, args.users, args.format)
+        print(f"Exported {count} rows to {args.path}")
+    else:
+        count = import_memory(args.path, args.users, args.format, args.batch_rows, args.restart)
+        print(f"Imported {count} rows from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
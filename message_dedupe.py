@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import socket
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Exactly-once handling of Discord messages. A gateway RESUME can replay events,
+# and two instances overlap during a rolling deploy; either way the same message
+# must not cost two LLM calls or land in memory twice.
+#   - every process remembers the last `message_dedupe_size` message IDs it handled
+#   - with message_claims_enabled (Postgres storage), a worker must also win the
+#     message's row in message_claims; rows expire after message_claim_ttl_seconds
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SeenSet:
+    """Bounded set of recently handled message IDs (oldest forgotten first)"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+
+    def add(self, message_id):
+        """Record message_id; False if it was already there"""
+        if message_id in self._ids:
+            return False
+        self._ids[message_id] = None
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._ids)
+
+
+seen = SeenSet()
+claims_enabled = False
+claim_ttl_seconds = 3600
+stats = {"duplicates": 0, "claimed_elsewhere": 0, "claim_errors": 0}
+
+
+def configure(settings, shared_database):
+    """(Re)configure from the "settings" block; claims need the Postgres backend"""
+    global claims_enabled, claim_ttl_seconds
+    seen.max_size = settings.get("message_dedupe_size", 10000)
+    claims_enabled = settings.get("message_claims_enabled", False) and shared_database
+    claim_ttl_seconds = settings.get("message_claim_ttl_seconds", 3600)
+
+
+def health():
+    """Dedupe section of /health"""
+    return dict(stats, remembered=len(seen), claims_enabled=claims_enabled)
+
+
+async def first_time(message_id):
+    """Whether this process should handle message_id (and now owns it)"""
+    if not seen.add(message_id):
+        stats["duplicates"] += 1
+        logger.info("Skipping replayed message", extra={"stage": "dedupe", "status": "duplicate"})
+        return False
+    if not claims_enabled:
+        return True
+
+    import models
+    try:
+        claimed = await asyncio.to_thread(models.claim_message, message_id, OWNER)
+    except Exception as e:
+        # Fail open: a missed duplicate is cheaper than dropping a message
+        stats["claim_errors"] += 1
+        logger.error("Error claiming message: %s", e, extra={"stage": "dedupe"})
+        return True
+    if not claimed:
+        stats["claimed_elsewhere"] += 1
+        logger.info("Message already handled by another worker", extra={"stage": "dedupe", "status": "claimed"})
+    return claimed
+
+
+async def purge_loop():
+    """Drop expired claims every half TTL"""
+    import models
+    while True:
+        await asyncio.sleep(max(60, claim_ttl_seconds / 2))
+        if claims_enabled:
+            removed = await asyncio.to_thread(models.purge_message_claims, claim_ttl_seconds)
+            if removed:
+                logger.info("Purged %d message claims", removed, extra={"stage": "dedupe", "count": removed})
@@ -0,0 +1,109 @@
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+import memory_partitions
+import models
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema steps, applied in order and recorded in schema_migrations.
+# Tables are created from the current model definitions, so later steps that
+# alter those tables must be idempotent (IF NOT EXISTS) to work on fresh databases.
+
+def _create_core_tables(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.UserMemory.__table__])
+
+def _create_shared_state_tables(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[
+        models.UserSummary.__table__,
+        models.EmotionalRecord.__table__,
+        models.MemoryHighlight.__table__,
+        models.SharedConfig.__table__
+    ])
+
+def _create_import_progress_table(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.ImportProgress.__table__])
+
+def _create_message_claims_table(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.MessageClaim.__table__])
+
+def _add_memory_search_index(conn):
+    # Stored generated column: adding it rewrites user_memory once, so expect a pause
+    # proportional to the table size on existing databases
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(
+        "ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS "
+        f"(to_tsvector('{models.SEARCH_CONFIG}', coalesce(content, ''))) STORED"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_user_memory_content_tsv ON user_memory USING GIN (content_tsv)"
+    ))
+
+def _create_usage_table(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.UsageRecord.__table__])
+
+def _add_memory_user_timestamp_index(conn):
+    # Partitioned tables already have ix_user_memory_user_id on (user_id, timestamp).
+    # Building the index blocks writes to user_memory until it is done
+    if conn.dialect.name == "postgresql" and memory_partitions.is_partitioned(conn):
+        return
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_user_memory_user_timestamp ON user_memory (user_id, timestamp)"
+    ))
+
+MIGRATIONS = [
+    (1, "create user_memory", _create_core_tables),
+    (2, "create shared state tables", _create_shared_state_tables),
+    (3, "create import_progress", _create_import_progress_table),
+    (4, "create message_claims", _create_message_claims_table),
+    (5, "add user_memory full-text search", _add_memory_search_index),
+    (6, "create llm_usage", _create_usage_table),
+    (7, "add user_memory (user_id, timestamp) index", _add_memory_user_timestamp_index),
+]
+
+# Arbitrary key so only one worker migrates at a time
+MIGRATION_LOCK_ID = 726411
+
+def get_schema_version(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+def migrate(engine=None):
+    """Apply pending migrations; returns the list of versions applied"""
+    engine = engine or models.get_engine()
+    applied = []
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        current = get_schema_version(conn)
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+            applied.append(version)
+            logger.info("Applied migration %d: %s", version, name)
+    return applied
+
+def bootstrap():
+    """Startup step: migrate (unless AUTO_MIGRATE=0), set up partitions if enabled and warm the pool"""
+    if os.getenv("AUTO_MIGRATE", "1").lower() not in ("0", "false", "no"):
+        migrate()
+    if memory_partitions.PARTITIONING_ENABLED:
+        memory_partitions.maintain()
+    models.warm_up()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    applied = migrate()
+    print(f"Schema is at version {MIGRATIONS[-1][0]} ({len(applied)} migrations applied)")
@@ -0,0 +1,174 @@
+import logging
+import time
+from collections import Counter, defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHealth:
+    """Rolling window of request outcomes for one model
+
+    Outcomes also expire after `window_seconds`: a model judged unhealthy gets no
+    chat traffic, so without expiry its bad samples would exclude it for good.
+    """
+
+    def __init__(self, window=200, window_seconds=300):
+        self.outcomes = deque(maxlen=window)  # (time.monotonic(), latency_ms, ok)
+        self.window_seconds = window_seconds
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, latency_ms, ok):
+        self.outcomes.append((time.monotonic(), latency_ms, ok))
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+
+    def samples(self):
+        expired = time.monotonic() - self.window_seconds
+        while self.outcomes and self.outcomes[0][0] < expired:
+            self.outcomes.popleft()
+        return len(self.outcomes)
+
+    def percentile(self, q):
+        if not self.samples():
+            return None
+        latencies = sorted(latency for _, latency, _ in self.outcomes)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self):
+        if not self.samples():
+            return 0.0
+        return sum(1 for _, _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ModelRouter:
+    """Pick a chat model per request from the "model_routing" config section
+
+    Rules are checked in order; the first one whose conditions (message length,
+    tone, relationship) all match supplies the candidate models. Candidates whose
+    live p95 latency or error rate is over the limits are skipped, unless every
+    candidate is, in which case the fastest one is used. Only chat requests count
+    towards a model's health, including transport failures.
+    """
+
+    def __init__(self, routing_config, default_model):
+        self.default_model = routing_config.get("default_model", default_model)
+        self.rules = routing_config.get("rules", [])
+        health = routing_config.get("health", {})
+        self.window = health.get("window", 200)
+        self.window_seconds = health.get("window_seconds", 300)
+        self.min_samples = health.get("min_samples", 20)
+        self.max_p95_ms = health.get("max_p95_ms", 12000)
+        self.max_error_rate = health.get("max_error_rate", 0.25)
+        self.health = defaultdict(lambda: ModelHealth(self.window, self.window_seconds))
+        self.decisions = defaultdict(Counter)  # rule name -> model -> count
+
+    @staticmethod
+    def _matches(rule, message_length, tone, relationship_type):
+        if "min_length" in rule and message_length < rule["min_length"]:
+            return False
+        if "max_length" in rule and message_length > rule["max_length"]:
+            return False
+        if "tones" in rule and tone not in rule["tones"]:
+            return False
+        if "relationships" in rule and relationship_type not in rule["relationships"]:
+            return False
+        return True
+
+    def is_healthy(self, model):
+        health = self.health.get(model)
+        if health is None or health.samples() < self.min_samples:
+            return True
+        return health.percentile(0.95) <= self.max_p95_ms and health.error_rate() <= self.max_error_rate
+
+    def _p95(self, model):
+        health = self.health.get(model)
+        p95 = health.percentile(0.95) if health is not None else None
+        return p95 if p95 is not None else 0.0
+
+    def choose(self, message_length, tone="neutral", relationship_type="friend"):
+        """Return (model, rule_name) for a request"""
+        rule_name = "default"
+        candidates = [self.default_model]
+        prefer = "first"
+        for rule in self.rules:
+            if self._matches(rule, message_length, tone, relationship_type):
+                rule_name = rule.get("name", "unnamed")
+                candidates = rule.get("models") or candidates
+                prefer = rule.get("prefer", "first")
+                break
+
+        healthy = [model for model in candidates if self.is_healthy(model)]
+        if not healthy:
+            # Everything is degraded; take whichever is currently fastest
+            model = min(candidates, key=self._p95)
+        elif prefer == "fastest":
+            model = min(healthy, key=self._p95)
+        else:
+            model = healthy[0]
+
+        self.decisions[rule_name][model] += 1
+        logger.debug("Routed request by rule %s", rule_name, extra={"stage": "routing", "model": model})
+        return model, rule_name
+
+    def record(self, model, latency_ms, ok):
+        self.health[model].record(latency_ms, ok)
+
+    def export(self):
+        """Routing decisions and per-model outcomes as plain data"""
+        models = {}
+        for model, health in self.health.items():
+            p50 = health.percentile(0.50)
+            p95 = health.percentile(0.95)
+            models[model] = {
+                "requests": health.requests,
+                "errors": health.errors,
+                "window_error_rate": round(health.error_rate(), 3),
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "healthy": self.is_healthy(model)
+            }
+        return {
+            "models": models,
+            "decisions": {rule: dict(counts) for rule, counts in self.decisions.items()}
+        }
+
+
+# Active router; None unless model routing is enabled in the config
+router = None
+
+
+def configure(config, default_model):
+    """(Re)configure routing from yuno_config, keeping live stats across reloads"""
+    global router
+    routing_config = config.get("model_routing", {})
+    if not routing_config.get("enabled", False):
+        router = None
+        return None
+
+    previous = router
+    router = ModelRouter(routing_config, default_model)
+    if previous is not None:
+        router.health = previous.health
+        router.decisions = previous.decisions
+        for health in router.health.values():
+            health.window_seconds = router.window_seconds
+    return router
+
+
+def record_outcome(model, latency_ms, ok, kind="chat"):
+    """Feed a chat request's outcome into the live stats (no-op when routing is off)
+
+    Summaries and other background calls don't count: they go to other models
+    and would skew the health of the chat ones.
+    """
+    if router is not None and model and kind == "chat":
+        router.record(model, latency_ms, ok)
+
+
+def health():
+    """Model routing section of /health"""
+    if router is None:
+        return {"enabled": False}
+    return dict(router.export(), enabled=True)
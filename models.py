@@ -1,16 +1,57 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+import logging
+import select
+import time
+from sqlalchemy import create_engine, Column, BigInteger, Integer, String, Text, DateTime, Date, Float, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is required")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Database setup. Nothing here touches the database at import time: the engine is
+# created on first use and the schema is managed by migrations.py.
 Base = declarative_base()
+_engine = None
+_SessionLocal = None
+
+def get_database_url():
+    """Get the database URL from the environment"""
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable is required")
+    return database_url
+
+def get_engine():
+    """Get the shared engine, creating it on first use"""
+    global _engine, _SessionLocal
+    if _engine is None:
+        _engine = create_engine(get_database_url(), pool_pre_ping=True)
+        _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+def __getattr__(name):
+    # Keep `models.engine` / `models.SessionLocal` working without eager setup
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        get_engine()
+        return _SessionLocal
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up(connections: int = 2):
+    """Open pooled connections ahead of the first query"""
+    engine = get_engine()
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
 
 class UserMemory(Base):
     __tablename__ = "user_memory"
@@ -20,19 +61,106 @@ class UserMemory(Base):
     role = Column(String)  # 'user' or 'assistant'
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    # A user's most recent messages: get_user_memory, add_message's trim and recall
+    __table_args__ = (Index("ix_user_memory_user_timestamp", "user_id", "timestamp"),)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class UserSummary(Base):
+    __tablename__ = "user_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True)
+    content = Column(Text)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+class EmotionalRecord(Base):
+    __tablename__ = "emotional_history"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True)
+    tone = Column(String)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+class MemoryHighlight(Base):
+    __tablename__ = "memory_highlights"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True)
+    category = Column(String, index=True)
+    highlight_type = Column(String)
+    content = Column(Text)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+class SharedConfig(Base):
+    __tablename__ = "shared_config"
+    
+    id = Column(Integer, primary_key=True)  # single row, id 1
+    version = Column(Integer, default=0)
+    data = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ImportProgress(Base):
+    __tablename__ = "import_progress"
+    
+    source = Column(String, primary_key=True)  # file name and size of a bulk import
+    rows_done = Column(Integer, default=0)  # input rows committed so far
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class MessageClaim(Base):
+    __tablename__ = "message_claims"
+    
+    message_id = Column(BigInteger, primary_key=True)  # Discord message ID
+    claimed_by = Column(String)  # host:pid of the worker handling it
+    claimed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class UsageRecord(Base):
+    __tablename__ = "llm_usage"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(String, primary_key=True)  # "" for requests not made for one user
+    model = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)  # chat, summary, summary_batch
+    requests = Column(Integer, default=0)
+    prompt_tokens = Column(BigInteger, default=0)
+    completion_tokens = Column(BigInteger, default=0)
+    latency_ms = Column(Float, default=0.0)  # total over the requests
+    cost = Column(Float, default=0.0)  # credits, when OpenRouter reports it
+
+# Channel used to tell every worker process that shared_config changed
+CONFIG_CHANNEL = "yuno_config"
+
+# Text search configuration of user_memory.content_tsv (added by migration 5, not
+# mapped on UserMemory because Postgres computes it)
+SEARCH_CONFIG = "english"
 
 def get_db():
     """Get database session"""
-    db = SessionLocal()
+    get_engine()
+    db = _SessionLocal()
     try:
         return db
     finally:
         pass
 
-def add_message(user_id: str, role: str, content: str):
+# Trimming a history scans `limit` index entries, so histories longer than
+# EXACT_TRIM_LIMIT (the memory_recall limit) are only trimmed after they have grown
+# by TRIM_SLACK of their limit; these counts live per process
+EXACT_TRIM_LIMIT = 100
+TRIM_SLACK = 0.1
+_inserts_since_trim = {}
+
+def _trim_due(user_id, limit):
+    if limit <= EXACT_TRIM_LIMIT:
+        return True
+    inserts = _inserts_since_trim.pop(user_id, 0) + 1
+    if inserts >= limit * TRIM_SLACK:
+        return True
+    if len(_inserts_since_trim) >= 100000:
+        _inserts_since_trim.clear()
+    _inserts_since_trim[user_id] = inserts
+    return False
+
+def add_message(user_id: str, role: str, content: str, limit: int = 20):
     """Add a message to user's memory"""
     db = get_db()
     try:
@@ -41,38 +169,71 @@ def add_message(user_id: str, role: str, content: str):
         db.add(db_message)
         db.commit()
         
-        # Keep only last 20 messages per user
-        messages = db.query(UserMemory).filter(
+        # Keep only the last `limit` messages per user. Partitioned tables skip this:
+        # retention drops whole months instead of leaving dead rows behind
+        import memory_partitions
+        if memory_partitions.PARTITIONING_ENABLED or not _trim_due(str(user_id), limit):
+            return
+        
+        stale = db.query(UserMemory.id).filter(
             UserMemory.user_id == str(user_id)
-        ).order_by(UserMemory.timestamp.desc()).all()
+        ).order_by(UserMemory.timestamp.desc()).offset(limit).all()
         
-        if len(messages) > 20:
-            # Delete oldest messages
-            for message in messages[20:]:
-                db.delete(message)
+        if stale:
+            db.query(UserMemory).filter(
+                UserMemory.id.in_([row.id for row in stale])
+            ).delete(synchronize_session=False)
             db.commit()
             
     except Exception as e:
         db.rollback()
-        print(f"Error adding message to database: {e}")
+        logger.error("Error adding message to database: %s", e, extra={"stage": "database"})
     finally:
         db.close()
 
-def get_user_memory(user_id: str):
-    """Get user's conversation memory"""
+def get_user_memory(user_id: str, limit: int = None):
+    """Get user's conversation memory (only the most recent `limit` messages if given)"""
     db = get_db()
     try:
-        messages = db.query(UserMemory).filter(
-            UserMemory.user_id == str(user_id)
-        ).order_by(UserMemory.timestamp.asc()).all()
+        if limit is None:
+            messages = db.query(UserMemory).filter(
+                UserMemory.user_id == str(user_id)
+            ).order_by(UserMemory.timestamp.asc()).all()
+        else:
+            messages = db.query(UserMemory).filter(
+                UserMemory.user_id == str(user_id)
+            ).order_by(UserMemory.timestamp.desc()).limit(limit).all()[::-1]
         
         return [{"role": msg.role, "content": msg.content} for msg in messages]
     except Exception as e:
-        print(f"Error getting user memory: {e}")
+        logger.error("Error getting user memory: %s", e, extra={"stage": "database"})
         return []
     finally:
         db.close()
 
+def search_user_memory(user_id: str, query: str, limit: int = 3, skip_recent: int = 0, timeout_ms: int = 0):
+    """Full-text search of a user's messages, best match first
+    
+    `query` is a to_tsquery expression. The newest `skip_recent` messages are left out
+    (they're already in the prompt). Raises on errors, including the statement timeout.
+    """
+    db = get_db()
+    try:
+        if timeout_ms:
+            db.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(int(timeout_ms))})
+        rows = db.execute(text(
+            "WITH recent AS ("
+            "SELECT id FROM user_memory WHERE user_id = :user_id ORDER BY timestamp DESC LIMIT :skip) "
+            "SELECT role, content, timestamp, ts_rank(content_tsv, query, 1) AS rank "
+            "FROM user_memory, to_tsquery(CAST(:config AS regconfig), :query) AS query "
+            "WHERE user_id = :user_id AND content_tsv @@ query AND id NOT IN (SELECT id FROM recent) "
+            "ORDER BY rank DESC LIMIT :limit"
+        ), {"user_id": str(user_id), "skip": skip_recent, "config": SEARCH_CONFIG,
+            "query": query, "limit": limit}).all()
+        return [{"role": row.role, "content": row.content, "timestamp": row.timestamp} for row in rows]
+    finally:
+        db.close()
+
 def clear_user_memory(user_id: str):
     """Clear user's conversation memory"""
     db = get_db()
@@ -82,7 +243,7 @@ def clear_user_memory(user_id: str):
         return True
     except Exception as e:
         db.rollback()
-        print(f"Error clearing user memory: {e}")
+        logger.error("Error clearing user memory: %s", e, extra={"stage": "database"})
         return False
     finally:
         db.close()
@@ -94,7 +255,287 @@ def get_memory_count(user_id: str):
         count = db.query(UserMemory).filter(UserMemory.user_id == str(user_id)).count()
         return count
     except Exception as e:
-        print(f"Error getting memory count: {e}")
+        logger.error("Error getting memory count: %s", e, extra={"stage": "database"})
+        return 0
+    finally:
+        db.close()
+
+def add_summary(user_id: str, content: str):
+    """Add a compressed conversation summary for a user"""
+    db = get_db()
+    try:
+        db.add(UserSummary(user_id=str(user_id), content=content))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error adding summary to database: %s", e, extra={"stage": "database"})
+    finally:
+        db.close()
+
+def get_summaries(user_id: str):
+    """Get a user's compressed conversation summaries, oldest first"""
+    db = get_db()
+    try:
+        summaries = db.query(UserSummary).filter(
+            UserSummary.user_id == str(user_id)
+        ).order_by(UserSummary.timestamp.asc()).all()
+        
+        return [summary.content for summary in summaries]
+    except Exception as e:
+        logger.error("Error getting summaries: %s", e, extra={"stage": "database"})
+        return []
+    finally:
+        db.close()
+
+def clear_summaries(user_id: str):
+    """Clear a user's compressed conversation summaries"""
+    db = get_db()
+    try:
+        db.query(UserSummary).filter(UserSummary.user_id == str(user_id)).delete()
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error clearing summaries: %s", e, extra={"stage": "database"})
+        return False
+    finally:
+        db.close()
+
+def add_emotional_record(user_id: str, tone: str, keep: int = 50):
+    """Add an emotional tone record, keeping only the last `keep` per user"""
+    db = get_db()
+    try:
+        db.add(EmotionalRecord(user_id=str(user_id), tone=tone))
+        db.commit()
+        
+        stale = db.query(EmotionalRecord.id).filter(
+            EmotionalRecord.user_id == str(user_id)
+        ).order_by(EmotionalRecord.timestamp.desc()).offset(keep).all()
+        
+        if stale:
+            db.query(EmotionalRecord).filter(
+                EmotionalRecord.id.in_([row.id for row in stale])
+            ).delete(synchronize_session=False)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error adding emotional record: %s", e, extra={"stage": "database"})
+    finally:
+        db.close()
+
+def get_emotional_history(user_id: str, limit: int = 50):
+    """Get a user's recent emotional history, oldest first"""
+    db = get_db()
+    try:
+        records = db.query(EmotionalRecord).filter(
+            EmotionalRecord.user_id == str(user_id)
+        ).order_by(EmotionalRecord.timestamp.desc()).limit(limit).all()
+        
+        return [{"tone": r.tone, "timestamp": r.timestamp.isoformat()} for r in reversed(records)]
+    except Exception as e:
+        logger.error("Error getting emotional history: %s", e, extra={"stage": "database"})
+        return []
+    finally:
+        db.close()
+
+def add_highlight(user_id: str, category: str, highlight_type: str, content: str, keep: int = 100):
+    """Save a memory highlight, keeping only the last `keep` per category"""
+    db = get_db()
+    try:
+        db.add(MemoryHighlight(user_id=str(user_id), category=category,
+                               highlight_type=highlight_type, content=content))
+        db.commit()
+        
+        stale = db.query(MemoryHighlight.id).filter(
+            MemoryHighlight.category == category
+        ).order_by(MemoryHighlight.timestamp.desc()).offset(keep).all()
+        
+        if stale:
+            db.query(MemoryHighlight).filter(
+                MemoryHighlight.id.in_([row.id for row in stale])
+            ).delete(synchronize_session=False)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error adding highlight: %s", e, extra={"stage": "database"})
+    finally:
+        db.close()
+
+def get_highlights(user_id: str):
+    """Get a user's memory highlights, newest first"""
+    db = get_db()
+    try:
+        highlights = db.query(MemoryHighlight).filter(
+            MemoryHighlight.user_id == str(user_id)
+        ).order_by(MemoryHighlight.timestamp.desc()).all()
+        
+        return [{
+            "user_id": h.user_id,
+            "content": h.content,
+            "timestamp": h.timestamp.isoformat(),
+            "type": h.highlight_type
+        } for h in highlights]
+    except Exception as e:
+        logger.error("Error getting highlights: %s", e, extra={"stage": "database"})
+        return []
+    finally:
+        db.close()
+
+def claim_message(message_id: int, owner: str):
+    """Claim a message for this worker; False if another worker (or an earlier event) already did"""
+    db = get_db()
+    try:
+        claimed = db.execute(text(
+            "INSERT INTO message_claims (message_id, claimed_by, claimed_at) VALUES (:id, :owner, :now) "
+            "ON CONFLICT (message_id) DO NOTHING RETURNING message_id"
+        ), {"id": message_id, "owner": owner, "now": datetime.utcnow()}).first() is not None
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+def purge_message_claims(ttl_seconds: int):
+    """Delete claims older than ttl_seconds; returns how many were removed"""
+    db = get_db()
+    try:
+        removed = db.execute(text(
+            "DELETE FROM message_claims WHERE claimed_at < :cutoff"
+        ), {"cutoff": datetime.utcnow() - timedelta(seconds=ttl_seconds)}).rowcount
+        db.commit()
+        return removed
+    except Exception as e:
+        db.rollback()
+        logger.error("Error purging message claims: %s", e, extra={"stage": "database"})
         return 0
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def add_usage(rows):
+    """Add usage deltas (dicts with UsageRecord's columns) to the daily totals; False on error"""
+    db = get_db()
+    try:
+        db.execute(text(
+            "INSERT INTO llm_usage (day, user_id, model, kind, requests, prompt_tokens, completion_tokens, "
+            "latency_ms, cost) VALUES (:day, :user_id, :model, :kind, :requests, :prompt_tokens, "
+            ":completion_tokens, :latency_ms, :cost) "
+            "ON CONFLICT (day, user_id, model, kind) DO UPDATE SET "
+            "requests = llm_usage.requests + EXCLUDED.requests, "
+            "prompt_tokens = llm_usage.prompt_tokens + EXCLUDED.prompt_tokens, "
+            "completion_tokens = llm_usage.completion_tokens + EXCLUDED.completion_tokens, "
+            "latency_ms = llm_usage.latency_ms + EXCLUDED.latency_ms, "
+            "cost = llm_usage.cost + EXCLUDED.cost"
+        ), rows)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error adding usage: %s", e, extra={"stage": "database"})
+        return False
+    finally:
+        db.close()
+
+def get_usage_summary(days: int = 7, top_users: int = 5):
+    """Usage totals per model and for the heaviest users over the last `days` days, or None on error"""
+    db = get_db()
+    try:
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        sums = (func.sum(UsageRecord.requests), func.sum(UsageRecord.prompt_tokens),
+                func.sum(UsageRecord.completion_tokens), func.sum(UsageRecord.latency_ms), func.sum(UsageRecord.cost))
+        fields = ("requests", "prompt_tokens", "completion_tokens", "latency_ms", "cost")
+        
+        by_model = db.query(UsageRecord.model, *sums).filter(
+            UsageRecord.day >= since
+        ).group_by(UsageRecord.model).all()
+        by_user = db.query(UsageRecord.user_id, *sums).filter(
+            UsageRecord.day >= since, UsageRecord.user_id != ""
+        ).group_by(UsageRecord.user_id).order_by(
+            (func.sum(UsageRecord.prompt_tokens) + func.sum(UsageRecord.completion_tokens)).desc()
+        ).limit(top_users).all()
+        
+        return {
+            "models": [dict(zip(fields, row[1:]), model=row[0]) for row in by_model],
+            "users": [dict(zip(fields, row[1:]), user_id=row[0]) for row in by_user]
+        }
+    except Exception as e:
+        logger.error("Error getting usage summary: %s", e, extra={"stage": "database"})
+        return None
+    finally:
+        db.close()
+
+def get_shared_config():
+    """Get the shared configuration as (version, json_text), or None if never published"""
+    db = get_db()
+    try:
+        row = db.query(SharedConfig).filter(SharedConfig.id == 1).first()
+        if row is None:
+            return None
+        return row.version, row.data
+    except Exception as e:
+        logger.error("Error getting shared config: %s", e, extra={"stage": "database"})
+        return None
+    finally:
+        db.close()
+
+def save_shared_config(data: str, only_if_missing: bool = False):
+    """Store the shared configuration, bump its version and notify every worker
+    
+    Returns the new version, or None if nothing was written.
+    """
+    db = get_db()
+    try:
+        row = db.query(SharedConfig).filter(SharedConfig.id == 1).with_for_update().first()
+        if row is None:
+            row = SharedConfig(id=1, version=0)
+            db.add(row)
+        elif only_if_missing:
+            db.rollback()
+            return None
+        
+        row.version += 1
+        row.data = data
+        row.updated_at = datetime.utcnow()
+        db.flush()
+        # Delivered to listeners when the transaction commits
+        db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                   {"channel": CONFIG_CHANNEL, "payload": str(row.version)})
+        db.commit()
+        return row.version
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving shared config: %s", e, extra={"stage": "database"})
+        return None
+    finally:
+        db.close()
+
+def listen_for_config_changes(callback, stop_event, poll_interval: float = 5.0):
+    """Block on LISTEN for shared config changes, calling callback(payload) for each
+    
+    Runs until stop_event is set, reconnecting on errors. callback(None) is called after
+    every (re)connect so the caller can catch up on notifications it may have missed.
+    """
+    while not stop_event.is_set():
+        conn = None
+        try:
+            conn = get_engine().raw_connection()
+            dbapi_conn = conn.dbapi_connection
+            dbapi_conn.autocommit = True
+            cursor = dbapi_conn.cursor()
+            cursor.execute(f"LISTEN {CONFIG_CHANNEL}")
+            callback(None)
+            
+            while not stop_event.is_set():
+                if select.select([dbapi_conn], [], [], poll_interval) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    callback(notify.payload)
+        except Exception as e:
+            logger.error("Config listener error: %s", e, extra={"stage": "database"})
+            time.sleep(poll_interval)
+        finally:
+            if conn is not None:
+                try:
+                    conn.invalidate()
+                except Exception:
+                    pass
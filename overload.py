@@ -0,0 +1,170 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, each including the ones before it
+NORMAL, SKIP_COMPRESSION, SHRINK_CONTEXT, FASTEST_MODEL, BUSY_REPLY = range(5)
+LEVEL_NAMES = ("normal", "skip_compression", "shrink_context", "fastest_model", "busy_reply")
+
+# Load at which each level (1-4) kicks in; any one signal reaching its threshold is enough
+DEFAULT_THRESHOLDS = [
+    {"pending": 8, "in_flight": 6, "p95_ms": 8000},
+    {"pending": 15, "in_flight": 10, "p95_ms": 12000},
+    {"pending": 25, "in_flight": 16, "p95_ms": 18000},
+    {"pending": 40, "in_flight": 24, "p95_ms": 25000},
+]
+
+
+class OverloadController:
+    """Track load on the reply pipeline and pick a degradation level
+
+    Signals are replies in progress (pending), OpenRouter requests in flight and the
+    p95 latency of chat requests from the last `latency_window_seconds`. Samples
+    expire by age because at BUSY_REPLY no chat requests are made, so an old, slow
+    window would otherwise keep the level there for good. The level rises as soon as a threshold is
+    reached but only falls one step at a time, after `min_dwell_seconds` at the
+    current level with every signal below `recover_ratio` of that level's thresholds.
+    """
+
+    def __init__(self, overload_config):
+        self.thresholds = overload_config.get("thresholds", DEFAULT_THRESHOLDS)
+        self.recover_ratio = overload_config.get("recover_ratio", 0.7)
+        self.min_dwell_seconds = overload_config.get("min_dwell_seconds", 15)
+        self.context_fraction = overload_config.get("context_fraction", 0.5)
+        self.fastest_model = overload_config.get("fastest_model", "mistralai/mistral-small-3.1")
+        self.busy_reply = overload_config.get(
+            "busy_reply", "*is a little overwhelmed right now* Give me a moment and ask me again? 💦")
+        self.latency_window_seconds = overload_config.get("latency_window_seconds", 60)
+        self.latencies = deque(maxlen=overload_config.get("latency_window", 50))  # (time.monotonic(), ms)
+        self.pending = 0
+        self.in_flight = 0
+        self.level = NORMAL
+        self.changed_at = time.monotonic()
+        self.time_at_level = [0.0] * len(LEVEL_NAMES)
+        self.shed = 0  # replies answered with the busy reply
+
+    def p95_ms(self):
+        expired = time.monotonic() - self.latency_window_seconds
+        while self.latencies and self.latencies[0][0] < expired:
+            self.latencies.popleft()
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(latency for _, latency in self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def _reached(self, thresholds, scale=1.0):
+        return (self.pending >= thresholds.get("pending", float("inf")) * scale
+                or self.in_flight >= thresholds.get("in_flight", float("inf")) * scale
+                or self.p95_ms() >= thresholds.get("p95_ms", float("inf")) * scale)
+
+    def update(self):
+        """Re-evaluate the level from the current signals; returns it"""
+        target = NORMAL
+        for level, thresholds in enumerate(self.thresholds, start=1):
+            if self._reached(thresholds):
+                target = level
+
+        now = time.monotonic()
+        new_level = self.level
+        if target > self.level:
+            new_level = target
+        elif (target < self.level and now - self.changed_at >= self.min_dwell_seconds
+              and not self._reached(self.thresholds[self.level - 1], self.recover_ratio)):
+            new_level = self.level - 1
+
+        if new_level != self.level:
+            self.time_at_level[self.level] += now - self.changed_at
+            log = logger.warning if new_level > self.level else logger.info
+            log("Overload level %s -> %s", LEVEL_NAMES[self.level], LEVEL_NAMES[new_level], extra={
+                "stage": "overload", "count": new_level, "latency_ms": round(self.p95_ms(), 1)})
+            self.level = new_level
+            self.changed_at = now
+        return self.level
+
+    def reply_started(self):
+        self.pending += 1
+        return self.update()
+
+    def reply_finished(self):
+        self.pending = max(0, self.pending - 1)
+        self.update()
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self, latency_ms, kind="chat"):
+        self.in_flight = max(0, self.in_flight - 1)
+        if kind == "chat":
+            self.latencies.append((time.monotonic(), latency_ms))
+        self.update()
+
+    def export(self):
+        """Current level and signals as plain data (for /health and commands)"""
+        time_at_level = list(self.time_at_level)
+        time_at_level[self.level] += time.monotonic() - self.changed_at
+        return {
+            "level": self.level,
+            "level_name": LEVEL_NAMES[self.level],
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "p95_ms": round(self.p95_ms(), 1),
+            "shed_replies": self.shed,
+            "seconds_at_level": {name: round(seconds, 1) for name, seconds in zip(LEVEL_NAMES, time_at_level)}
+        }
+
+
+# Active controller; None unless the "overload" section is enabled in the config
+controller = None
+
+
+def configure(config):
+    """(Re)configure from yuno_config, keeping live counters across reloads"""
+    global controller
+    overload_config = config.get("overload", {})
+    if not overload_config.get("enabled", False):
+        controller = None
+        return None
+
+    previous = controller
+    controller = OverloadController(overload_config)
+    if previous is not None:
+        controller.latencies.extend(previous.latencies)
+        controller.pending, controller.in_flight = previous.pending, previous.in_flight
+        controller.level, controller.changed_at = previous.level, previous.changed_at
+        controller.time_at_level, controller.shed = previous.time_at_level, previous.shed
+    return controller
+
+
+def level():
+    return controller.level if controller is not None else NORMAL
+
+
+# The helpers below look the controller up on every call, so a reload in between
+# still settles the counters on the controller that took them over
+
+def reply_started():
+    return controller.reply_started() if controller is not None else NORMAL
+
+
+def reply_finished():
+    if controller is not None:
+        controller.reply_finished()
+
+
+def request_started():
+    if controller is not None:
+        controller.request_started()
+
+
+def request_finished(latency_ms, kind="chat"):
+    if controller is not None:
+        controller.request_finished(latency_ms, kind)
+
+
+def health():
+    """Overload section of /health"""
+    if controller is None:
+        return {"enabled": False, "level": NORMAL, "level_name": LEVEL_NAMES[NORMAL]}
+    return dict(controller.export(), enabled=True)
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import resource
+import statistics
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+
+import httpx
+
+import traffic_recorder
+
+# Recorded user key of the message currently being replayed (set per replay task)
+current_user = contextvars.ContextVar("current_user", default=None)
+
+
+def percentiles(values):
+    """p50/p95/p99/max/mean summary of a list of numbers"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 1),
+        "mean": round(statistics.fmean(ordered), 1)
+    }
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """httpx transport that answers OpenRouter calls from recorded exchanges
+
+    Calls are matched per recorded user and kind (chat or summary) in original order.
+    When the build under test makes a call production never made, a response is
+    synthesized with the median recorded latency for that kind.
+    """
+
+    def __init__(self, llm_records, speed, request_kind):
+        self.speed = speed
+        self.request_kind = request_kind
+        self.queues = defaultdict(deque)
+        latencies = defaultdict(list)
+        for record in llm_records:
+            self.queues[(record.get("u"), record.get("k"))].append(record)
+            latencies[record.get("k")].append(record.get("ms", 0))
+        self.median_ms = {kind: statistics.median(values) for kind, values in latencies.items()}
+        self.served = 0
+        self.synthesized = 0
+
+    async def handle_async_request(self, request):
+        kind = self.request_kind.get() or "chat"
+        queue = self.queues.get((current_user.get(), kind))
+
+        if queue:
+            record = queue.popleft()
+            self.served += 1
+        else:
+            record = {"ms": self.median_ms.get(kind, 0), "st": 200, "c": "Okay!"}
+            self.synthesized += 1
+
+        if self.speed:
+            await asyncio.sleep(record.get("ms", 0) / 1000 / self.speed)
+
+        status = record.get("st", 200)
+        if status == "timeout":
+            raise httpx.ReadTimeout("Replayed timeout", request=request)
+        if status == 200:
+            body = {
+                "choices": [{"message": {"role": "assistant", "content": record.get("c") or ""}}],
+                "usage": record.get("usage", {})
+            }
+        else:
+            body = {"error": {"code": status, "message": "Replayed error"}}
+        return httpx.Response(status, json=body, request=request)
+
+
+def assign_user_ids(inputs, parent_ids):
+    """Map recorded user keys to synthetic Discord IDs, keeping parents as parents"""
+    parent_ids = [pid for pid in parent_ids if pid]
+    user_ids = {}
+    next_id = 900000000000000000
+    for record in inputs:
+        key = record.get("u")
+        if key in user_ids:
+            continue
+        if record.get("rel") == "parent" and parent_ids:
+            user_ids[key] = parent_ids.pop(0)
+        else:
+            user_ids[key] = next_id
+            next_id += 1
+    return user_ids
+
+
+async def replay(path, speed=1.0):
+    """Drive main.generate_reply with recorded inputs and return a report dict"""
+    import main as bot_module
+
+    records = list(traffic_recorder.iter_records(path))
+    inputs = [r for r in records if r.get("t") == "in"]
+    llm_records = [r for r in records if r.get("t") == "llm"]
+    if not inputs:
+        raise ValueError(f"No recorded inputs in {path}")
+
+    # Never record the replay itself
+    traffic_recorder.configure({})
+    transport = ReplayTransport(llm_records, speed, bot_module.request_kind)
+    bot_module.HTTP_TRANSPORT = transport
+    bot_module._http_client = None
+
+    user_ids = assign_user_ids(inputs, [bot_module.active_config.mother_id, bot_module.active_config.father_id])
+    latencies = []
+    previous_task = {}
+    loop = asyncio.get_running_loop()
+    first_ts = inputs[0]["ts"]
+
+    tracemalloc.start()
+    started = loop.time()
+
+    async def run_one(record, after):
+        if speed:
+            delay = (record["ts"] - first_ts) / speed - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # Keep each user's messages in their original order
+        if after is not None:
+            await after
+        current_user.set(record.get("u"))
+        began = time.perf_counter()
+        await bot_module.generate_reply(user_ids[record.get("u")], record.get("c") or "Hello!")
+        latencies.append((time.perf_counter() - began) * 1000)
+
+    tasks = []
+    for record in inputs:
+        task = asyncio.create_task(run_one(record, previous_task.get(record.get("u"))))
+        previous_task[record.get("u")] = task
+        tasks.append(task)
+    await asyncio.gather(*tasks)
+    # Let post-reply bookkeeping finish so it's included in the memory profile
+    if bot_module.background_tasks:
+        await asyncio.gather(*list(bot_module.background_tasks), return_exceptions=True)
+
+    wall_s = loop.time() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await bot_module.get_http_client().aclose()
+
+    return {
+        "file": path,
+        "speed": speed,
+        "messages": len(inputs),
+        "users": len(user_ids),
+        "wall_s": round(wall_s, 3),
+        "latency_ms": percentiles(latencies),
+        "pre_dispatch_ms": percentiles([t["pre_dispatch_ms"] for t in bot_module.pipeline_timings]),
+        "overload_levels": dict(Counter(t.get("overload_level", 0) for t in bot_module.pipeline_timings)),
+        "recorded_llm_latency_ms": percentiles([r.get("ms", 0) for r in llm_records if r.get("k") == "chat"]),
+        "llm_calls": {"served": transport.served, "synthesized": transport.synthesized},
+        "tracemalloc_peak_kb": round(peak_bytes / 1024, 1),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def compare(report, baseline):
+    """Print the change of key metrics against a baseline report"""
+    rows = [
+        ("latency p50 (ms)", report["latency_ms"].get("p50"), baseline["latency_ms"].get("p50")),
+        ("latency p95 (ms)", report["latency_ms"].get("p95"), baseline["latency_ms"].get("p95")),
+        ("pre-dispatch p95 (ms)", report.get("pre_dispatch_ms", {}).get("p95"), baseline.get("pre_dispatch_ms", {}).get("p95")),
+        ("latency p99 (ms)", report["latency_ms"].get("p99"), baseline["latency_ms"].get("p99")),
+        ("llm calls", report["llm_calls"]["served"] + report["llm_calls"]["synthesized"],
+         baseline["llm_calls"]["served"] + baseline["llm_calls"]["synthesized"]),
+        ("tracemalloc peak (KB)", report["tracemalloc_peak_kb"], baseline["tracemalloc_peak_kb"]),
+        ("max RSS (KB)", report["max_rss_kb"], baseline["max_rss_kb"])
+    ]
+    for label, current, previous in rows:
+        if current is None or previous is None:
+            continue
+        change = f"{(current - previous) / previous * 100:+.1f}%" if previous else "n/a"
+        print(f"{label:<24} {previous:>12} -> {current:<12} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Yuno traffic against the current build")
+    parser.add_argument("path", help="traffic file written by traffic_recorder")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="time acceleration factor; 0 replays as fast as possible")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.path, args.speed))
+    print(json.dumps(report, indent=2))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import re
+import time
+from collections import Counter, OrderedDict
+
+# Context-free openers that get the same answer no matter who asks.
+# The intents that may be served from cache are chosen in settings.
+INTENT_PATTERNS = {
+    "greeting": re.compile(
+        r'^(?:hi|hii+|hello|hey|heya|hiya|howdy|yo|sup|good (?:morning|afternoon|evening))(?: (?:yuno|there|everyone))?$'),
+    "parents": re.compile(
+        r'^(?:who|what) (?:are|is|were|was) your (?:parents?|mom|mother|dad|father|creators?|family)$'
+        r'|^who (?:made|created|built|coded|programmed) you$'),
+    "identity": re.compile(
+        r'^(?:who are you|what are you|whats your name|what is your name|introduce yourself|tell me about yourself)$'),
+    "probe": re.compile(r'^(?:ping|test|testing|are you there|you there|are you alive|are you awake)$'),
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    """Lowercase, drop punctuation/emoji and collapse whitespace"""
+    text = _PUNCTUATION_RE.sub("", text.lower().replace("'", ""))
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def classify_intent(normalized):
+    """Name of the cacheable intent a normalized message matches, or None"""
+    for intent, pattern in INTENT_PATTERNS.items():
+        if pattern.match(normalized):
+            return intent
+    return None
+
+
+def digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def context_digest(messages):
+    """Hash of the conversation turns that precede the current message"""
+    return digest("\n".join(f"{msg['role']}:{msg['content']}" for msg in messages))
+
+
+class ReplyCache:
+    """LRU cache of replies with a per-entry TTL and hit-rate counters"""
+
+    def __init__(self, max_entries=500, ttl_seconds=600, intents=("greeting", "parents", "identity", "probe"),
+                 context_turns=0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.intents = set(intents)
+        self.context_turns = context_turns
+        self._entries = OrderedDict()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup_key(self, message_content, system_prompt, context):
+        """(key, intent) for a message, or (None, None) when it isn't cacheable"""
+        normalized = normalize_message(message_content)
+        intent = classify_intent(normalized)
+        if intent not in self.intents:
+            return None, None
+        recent = context[-self.context_turns:] if self.context_turns else []
+        return (normalized, digest(system_prompt), context_digest(recent)), intent
+
+    def get(self, key, intent):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, reply = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits[intent] += 1
+                return reply
+            del self._entries[key]
+            self.expirations += 1
+        self.misses[intent] += 1
+        return None
+
+    def put(self, key, reply):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        return {
+            "entries": len(self._entries),
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "by_intent": {
+                intent: {"hits": self.hits[intent], "misses": self.misses[intent]}
+                for intent in sorted(set(self.hits) | set(self.misses))
+            }
+        }
+
+
+# Active cache; None unless reply caching is enabled in settings
+cache = None
+
+
+def configure(settings):
+    """(Re)configure the cache from the "settings" block of yuno_config"""
+    global cache
+    if not settings.get("reply_cache_enabled", False):
+        cache = None
+        return None
+
+    max_entries = settings.get("reply_cache_max_entries", 500)
+    ttl_seconds = settings.get("reply_cache_ttl_seconds", 600)
+    intents = settings.get("reply_cache_intents", ["greeting", "parents", "identity", "probe"])
+    context_turns = settings.get("reply_cache_context_turns", 0)
+
+    if cache is None:
+        cache = ReplyCache(max_entries, ttl_seconds, intents, context_turns)
+    else:
+        # Keep entries and counters across reloads
+        cache.max_entries = max_entries
+        cache.ttl_seconds = ttl_seconds
+        cache.intents = set(intents)
+        cache.context_turns = context_turns
+    return cache
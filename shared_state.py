@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Shared state lets several worker processes (one per shard range) serve the same users.
+# Postgres (models.py) is the source of truth; the dicts in main.py become per-process caches.
+# Conversation state is written through to the storage backend (storage.py), which is
+# Postgres in that case and may be SQLite or nothing for a single process.
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE", "").lower() in ("1", "true", "yes")
+
+# Parts of yuno_config that are runtime state rather than configuration.
+# They live in their own tables and are never broadcast with the config.
+RUNTIME_SECTIONS = ("memory_highlights",)
+RUNTIME_PERSONALITY_KEYS = ("conversation_patterns", "current_mood", "topic_scores", "interests")
+
+# Version of the shared config this process has applied
+config_version = 0
+
+_models = None
+_executor = None
+_pending = set()
+_listener_stop = threading.Event()
+
+
+def enabled():
+    return SHARED_STATE_ENABLED
+
+
+def persistent():
+    """Whether conversation state is written through to a storage backend"""
+    return storage.backend is not None
+
+
+def _db():
+    """Import models lazily so single-process deployments never need DATABASE_URL"""
+    global _models
+    if _models is None:
+        import models
+        _models = models
+    return _models
+
+
+def _get_executor():
+    # A single writer thread keeps storage writes in the order they were issued
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+    return _executor
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+def persist(func_name, *args):
+    """Fire-and-forget write of runtime state to the storage backend"""
+    if storage.backend is None:
+        return
+    func = getattr(storage.backend, func_name)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        func(*args)
+        return
+    future = loop.run_in_executor(_get_executor(), func, *args)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+
+async def flush():
+    """Wait for all queued writes to finish"""
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
+
+
+def _load_user(backend, user_id, limit):
+    return backend.get_user_memory(user_id, limit), backend.get_summaries(user_id), backend.get_emotional_history(user_id)
+
+
+async def hydrate_user(user_id, memory, compressed_memory, conversation_patterns, limit=None):
+    """Refresh this process's cached state for a user from the storage backend
+
+    With several workers, another one may have answered this user since we last saw
+    them, so this always reloads; a single process only loads users it doesn't have.
+    Empty results leave the local cache alone so a database blip doesn't wipe context.
+    """
+    backend = storage.backend
+    if backend is None or (not SHARED_STATE_ENABLED and user_id in memory):
+        return
+    messages, summaries, emotions = await _run(_load_user, backend, user_id, limit)
+
+    if messages:
+        memory[user_id] = messages
+    if summaries:
+        compressed_memory[user_id] = [
+            {"role": "system", "content": f"Earlier conversation summary: {summary}"}
+            for summary in summaries
+        ]
+    if emotions:
+        patterns = conversation_patterns.setdefault(str(user_id), {"topics": {}, "emotional_history": []})
+        patterns["emotional_history"] = emotions
+
+
+async def load_highlights(user_id):
+    return await _run(storage.backend.get_highlights, user_id)
+
+
+def shareable_config(config):
+    """Copy of yuno_config without the runtime sections"""
+    shared = {key: value for key, value in config.items() if key not in RUNTIME_SECTIONS}
+    if "personality_system" in shared:
+        shared["personality_system"] = {
+            key: value for key, value in shared["personality_system"].items()
+            if key not in RUNTIME_PERSONALITY_KEYS
+        }
+    return shared
+
+
+def merge_runtime_state(shared, current):
+    """Combine a received shared config with this process's runtime sections"""
+    merged = dict(shared)
+    for key in RUNTIME_SECTIONS:
+        if key in current:
+            merged[key] = current[key]
+    personality = dict(merged.get("personality_system", {}))
+    for key in RUNTIME_PERSONALITY_KEYS:
+        if key in current.get("personality_system", {}):
+            personality[key] = current["personality_system"][key]
+    merged["personality_system"] = personality
+    return merged
+
+
+async def publish_config(config, only_if_missing=False):
+    """Store the config for every worker and notify them; returns the new version"""
+    global config_version
+    if not SHARED_STATE_ENABLED:
+        return None
+    data = json.dumps(shareable_config(config))
+    version = await _run(_db().save_shared_config, data, only_if_missing)
+    if version:
+        config_version = version
+    return version
+
+
+async def _apply_latest(on_config):
+    global config_version
+    row = await _run(_db().get_shared_config)
+    if row is None:
+        return
+    version, data = row
+    if version <= config_version:
+        return
+    config_version = version
+    on_config(json.loads(data))
+    logger.info("Applied shared config version %d", version, extra={"stage": "config"})
+
+
+async def start(config, on_config):
+    """Seed or load the shared config and listen for changes made by other workers
+
+    on_config(shared_config) is called on the event loop whenever a newer version arrives.
+    """
+    if not SHARED_STATE_ENABLED:
+        return
+    loop = asyncio.get_running_loop()
+
+    await publish_config(config, only_if_missing=True)
+    await _apply_latest(on_config)
+
+    def on_notify(payload):
+        if payload is not None:
+            try:
+                if int(payload) <= config_version:
+                    return
+            except ValueError:
+                return
+        task = asyncio.ensure_future(_apply_latest(on_config))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+    listener = threading.Thread(
+        target=_db().listen_for_config_changes,
+        args=(lambda payload: loop.call_soon_threadsafe(on_notify, payload), _listener_stop),
+        name="config-listener",
+        daemon=True
+    )
+    listener.start()
+    logger.info("Shared state enabled: listening for config changes")
+
+
+async def stop():
+    _listener_stop.set()
+    await flush()
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Warm-restart snapshot of per-user runtime state.
+#
+# File layout (little endian):
+#   header   magic(8) version(u16) flags(u16) created_at(f64) index_offset(u64) count(u32)
+#   records  one zlib-compressed JSON blob per user
+#   index    count x (user_id u64, offset u64, length u32), sorted by user_id
+#
+# The file is mmap'd and users are decoded only when they are first seen again,
+# so opening a snapshot costs the same whether it holds ten users or a million.
+
+SNAPSHOT_MAGIC = b"YUNOSNAP"
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct("<8sHHdQI")
+_ENTRY = struct.Struct("<QQI")
+
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def encode_user_state(state):
+    """Compress one user's state dict into a snapshot record"""
+    record = {}
+    if state.get("memory"):
+        record["m"] = [[_ROLE_CODES.get(msg["role"], msg["role"]), msg["content"]] for msg in state["memory"]]
+    if state.get("summaries"):
+        record["c"] = [summary["content"] for summary in state["summaries"]]
+    if state.get("emotional_state") is not None:
+        record["e"] = state["emotional_state"]
+    last = state.get("last_interaction")
+    if last is not None:
+        record["l"] = {"dt": last.isoformat()} if isinstance(last, datetime) else last
+    if state.get("patterns"):
+        record["p"] = state["patterns"]
+    return zlib.compress(json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode(), 6)
+
+
+def decode_user_state(blob):
+    """Inverse of encode_user_state"""
+    record = json.loads(zlib.decompress(blob))
+    last = record.get("l")
+    if isinstance(last, dict) and "dt" in last:
+        last = datetime.fromisoformat(last["dt"])
+    return {
+        "memory": [{"role": _ROLE_NAMES.get(role, role), "content": content} for role, content in record.get("m", [])],
+        "summaries": [{"role": "system", "content": content} for content in record.get("c", [])],
+        "emotional_state": record.get("e"),
+        "last_interaction": last,
+        "patterns": record.get("p")
+    }
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, self.created_at, self._index_offset, self.count = _HEADER.unpack_from(self._mm, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+
+    def _entry(self, position):
+        return _ENTRY.unpack_from(self._mm, self._index_offset + position * _ENTRY.size)
+
+    def find(self, user_id):
+        """Binary search the index; returns (offset, length) or None"""
+        low, high = 0, self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            entry_id, offset, length = self._entry(middle)
+            if entry_id == user_id:
+                return offset, length
+            if entry_id < user_id:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def get(self, user_id):
+        found = self.find(user_id)
+        if found is None:
+            return None
+        offset, length = found
+        return decode_user_state(self._mm[offset:offset + length])
+
+    def entries(self):
+        for position in range(self.count):
+            yield self._entry(position)
+
+    def raw(self, offset, length):
+        return self._mm[offset:offset + length]
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def write_snapshot(path, states, previous=None, consumed=frozenset()):
+    """Atomically write a snapshot of states ({user_id: state dict})
+
+    Users still waiting in `previous` (never restored since the last start) are
+    copied across without being decoded. Returns the number of users written.
+    """
+    tmp_path = path + ".tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        for user_id, state in states.items():
+            blob = encode_user_state(state)
+            index.append((user_id, f.tell(), len(blob)))
+            f.write(blob)
+        if previous is not None:
+            for user_id, offset, length in previous.entries():
+                if user_id in states or user_id in consumed:
+                    continue
+                index.append((user_id, f.tell(), length))
+                f.write(previous.raw(offset, length))
+
+        index.sort()
+        index_offset = f.tell()
+        for entry in index:
+            f.write(_ENTRY.pack(*entry))
+        f.seek(0)
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, time.time(), index_offset, len(index)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(index)
+
+
+# Snapshot users are lazily restored from, and the users already taken from it
+_current = None
+_consumed = set()
+# Saves share path + ".tmp" and _current, so a periodic save and the shutdown save take turns
+_save_lock = asyncio.Lock()
+
+
+def open_snapshot(path):
+    """Map the snapshot at path (if any) for lazy restores"""
+    global _current
+    if not os.path.exists(path):
+        return None
+    try:
+        _current = Snapshot(path)
+        logger.info("Opened state snapshot with %d users from %s", _current.count, path,
+                    extra={"stage": "snapshot", "count": _current.count})
+    except (OSError, ValueError) as e:
+        logger.error("Error opening state snapshot: %s", e, extra={"stage": "snapshot"})
+        _current = None
+    return _current
+
+
+def take_user(user_id):
+    """Get a user's snapshot state the first time they are seen, else None"""
+    if _current is None or user_id in _consumed:
+        return None
+    _consumed.add(user_id)
+    try:
+        return _current.get(int(user_id))
+    except (ValueError, TypeError, zlib.error) as e:
+        logger.error("Error restoring snapshot state: %s", e, extra={"stage": "snapshot", "user": user_id})
+        return None
+
+
+async def save(path, states):
+    """Write a snapshot in a worker thread, then restore from it from now on"""
+    global _current
+    async with _save_lock:
+        started = time.perf_counter()
+        count = await asyncio.to_thread(write_snapshot, path, states, _current, frozenset(_consumed))
+        previous = _current
+        _current = Snapshot(path)
+        if previous is not None:
+            previous.close()
+    logger.info("Saved state snapshot of %d users", count, extra={
+        "stage": "snapshot", "count": count, "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+    return count
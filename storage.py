@@ -0,0 +1,254 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Storage backends for conversation state. Every backend offers the same calls as
+# the functions in models.py, so shared_state.persist("add_message", ...) and friends
+# work against whichever one is selected by settings["storage_backend"]:
+#   "none"      state lives only in main.py's dicts (default)
+#   "memory"    in-process, for tests and benchmarks
+#   "sqlite"    a local SQLite file in WAL mode, for single-node deployments
+#   "postgres"  the SQLAlchemy models (DATABASE_URL); required for several workers
+STORAGE_METHODS = (
+    "add_message", "get_user_memory", "clear_user_memory", "get_memory_count",
+    "add_summary", "get_summaries", "clear_summaries",
+    "add_emotional_record", "get_emotional_history",
+    "add_highlight", "get_highlights",
+)
+
+
+def _recent(items, limit):
+    items = list(items)
+    return items if limit is None else items[-limit:] if limit else []
+
+
+class InProcessStorage:
+    """Backend keeping everything in dicts of this process"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.messages = defaultdict(deque)
+        self.summaries = defaultdict(list)
+        self.emotions = defaultdict(deque)
+        self.highlights = defaultdict(deque)  # category -> highlights, oldest first
+
+    def add_message(self, user_id, role, content, limit=20):
+        messages = self.messages[str(user_id)]
+        messages.append({"role": role, "content": content})
+        while len(messages) > limit:
+            messages.popleft()
+
+    def get_user_memory(self, user_id, limit=None):
+        return [dict(message) for message in _recent(self.messages.get(str(user_id), ()), limit)]
+
+    def clear_user_memory(self, user_id):
+        self.messages.pop(str(user_id), None)
+        return True
+
+    def get_memory_count(self, user_id):
+        return len(self.messages.get(str(user_id), ()))
+
+    def add_summary(self, user_id, content):
+        self.summaries[str(user_id)].append(content)
+
+    def get_summaries(self, user_id):
+        return list(self.summaries.get(str(user_id), ()))
+
+    def clear_summaries(self, user_id):
+        self.summaries.pop(str(user_id), None)
+        return True
+
+    def add_emotional_record(self, user_id, tone, keep=50):
+        records = self.emotions[str(user_id)]
+        records.append({"tone": tone, "timestamp": datetime.utcnow().isoformat()})
+        while len(records) > keep:
+            records.popleft()
+
+    def get_emotional_history(self, user_id, limit=50):
+        return [dict(record) for record in _recent(self.emotions.get(str(user_id), ()), limit)]
+
+    def add_highlight(self, user_id, category, highlight_type, content, keep=100):
+        highlights = self.highlights[category]
+        highlights.append({"user_id": str(user_id), "content": content,
+                           "timestamp": datetime.utcnow().isoformat(), "type": highlight_type})
+        while len(highlights) > keep:
+            highlights.popleft()
+
+    def get_highlights(self, user_id):
+        found = [h for highlights in self.highlights.values() for h in highlights if h["user_id"] == str(user_id)]
+        return sorted(found, key=lambda h: h["timestamp"], reverse=True)
+
+
+class SQLiteStorage:
+    """Backend on a local SQLite database in WAL mode (one writer, concurrent readers)"""
+
+    name = "sqlite"
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS user_memory (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, "
+        "role TEXT, content TEXT, timestamp TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_user_memory_user ON user_memory (user_id, id)",
+        "CREATE TABLE IF NOT EXISTS user_summaries (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, "
+        "content TEXT, timestamp TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_user_summaries_user ON user_summaries (user_id, id)",
+        "CREATE TABLE IF NOT EXISTS emotional_history (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, "
+        "tone TEXT, timestamp TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_emotional_history_user ON emotional_history (user_id, id)",
+        "CREATE TABLE IF NOT EXISTS memory_highlights (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, "
+        "category TEXT, highlight_type TEXT, content TEXT, timestamp TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_memory_highlights_user ON memory_highlights (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_memory_highlights_category ON memory_highlights (category, id)",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._conn.execute(statement)
+
+    def _write(self, *statements):
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                logger.error("Error writing to SQLite storage: %s", e, extra={"stage": "database"})
+                return False
+        return True
+
+    def _read(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_message(self, user_id, role, content, limit=20):
+        self._write(
+            ("INSERT INTO user_memory (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+             (str(user_id), role, content, datetime.utcnow().isoformat())),
+            ("DELETE FROM user_memory WHERE user_id = ? AND id NOT IN "
+             "(SELECT id FROM user_memory WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+             (str(user_id), str(user_id), limit)),
+        )
+
+    def get_user_memory(self, user_id, limit=None):
+        rows = self._read("SELECT role, content FROM user_memory WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                          (str(user_id), -1 if limit is None else limit))
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def clear_user_memory(self, user_id):
+        return self._write(("DELETE FROM user_memory WHERE user_id = ?", (str(user_id),)))
+
+    def get_memory_count(self, user_id):
+        return self._read("SELECT COUNT(*) FROM user_memory WHERE user_id = ?", (str(user_id),))[0][0]
+
+    def add_summary(self, user_id, content):
+        self._write(("INSERT INTO user_summaries (user_id, content, timestamp) VALUES (?, ?, ?)",
+                     (str(user_id), content, datetime.utcnow().isoformat())))
+
+    def get_summaries(self, user_id):
+        rows = self._read("SELECT content FROM user_summaries WHERE user_id = ? ORDER BY id", (str(user_id),))
+        return [content for content, in rows]
+
+    def clear_summaries(self, user_id):
+        return self._write(("DELETE FROM user_summaries WHERE user_id = ?", (str(user_id),)))
+
+    def add_emotional_record(self, user_id, tone, keep=50):
+        self._write(
+            ("INSERT INTO emotional_history (user_id, tone, timestamp) VALUES (?, ?, ?)",
+             (str(user_id), tone, datetime.utcnow().isoformat())),
+            ("DELETE FROM emotional_history WHERE user_id = ? AND id NOT IN "
+             "(SELECT id FROM emotional_history WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+             (str(user_id), str(user_id), keep)),
+        )
+
+    def get_emotional_history(self, user_id, limit=50):
+        rows = self._read("SELECT tone, timestamp FROM emotional_history WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                          (str(user_id), limit))
+        return [{"tone": tone, "timestamp": timestamp} for tone, timestamp in reversed(rows)]
+
+    def add_highlight(self, user_id, category, highlight_type, content, keep=100):
+        self._write(
+            ("INSERT INTO memory_highlights (user_id, category, highlight_type, content, timestamp) "
+             "VALUES (?, ?, ?, ?, ?)",
+             (str(user_id), category, highlight_type, content, datetime.utcnow().isoformat())),
+            ("DELETE FROM memory_highlights WHERE category = ? AND id NOT IN "
+             "(SELECT id FROM memory_highlights WHERE category = ? ORDER BY id DESC LIMIT ?)",
+             (category, category, keep)),
+        )
+
+    def get_highlights(self, user_id):
+        rows = self._read("SELECT user_id, content, timestamp, highlight_type FROM memory_highlights "
+                          "WHERE user_id = ? ORDER BY id DESC", (str(user_id),))
+        return [{"user_id": uid, "content": content, "timestamp": timestamp, "type": highlight_type}
+                for uid, content, timestamp, highlight_type in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLAlchemyStorage:
+    """Backend on the SQLAlchemy models (Postgres via DATABASE_URL)"""
+
+    name = "postgres"
+
+    def __init__(self):
+        import models
+        self._models = models
+
+    def __getattr__(self, name):
+        if name in STORAGE_METHODS:
+            return getattr(self._models, name)
+        raise AttributeError(name)
+
+
+def create_backend(kind, sqlite_path="yuno_state.db"):
+    if kind == "memory":
+        return InProcessStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    if kind == "postgres":
+        return SQLAlchemyStorage()
+    if kind in (None, "none"):
+        return None
+    raise ValueError(f"Unknown storage backend {kind!r}")
+
+
+# Active backend; None when state only lives in main.py's dicts
+backend = None
+
+
+def configure(settings):
+    """(Re)select the backend from the "settings" block of yuno_config
+
+    Several workers (SHARED_STATE=1) always use Postgres, whatever the config says.
+    """
+    global backend
+    kind = settings.get("storage_backend", "none")
+    if os.getenv("SHARED_STATE", "").lower() in ("1", "true", "yes"):
+        kind = "postgres"
+    sqlite_path = settings.get("storage_sqlite_path", "yuno_state.db")
+
+    current = getattr(backend, "name", "none")
+    if current == kind and (kind != "sqlite" or backend.path == sqlite_path):
+        return backend
+    if isinstance(backend, SQLiteStorage):
+        backend.close()
+    started = time.perf_counter()
+    backend = create_backend(kind, sqlite_path)
+    if backend is not None:
+        logger.info("Using %s storage backend", kind, extra={
+            "stage": "storage", "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+    return backend
@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import storage
+
+# Throughput/latency benchmark shared by every storage backend. The conformance
+# checks live in tests/test_storage.py.
+#
+#   python storage_benchmark.py --backends memory sqlite postgres --users 50 --messages 40
+#
+# The postgres backend needs DATABASE_URL and an up-to-date schema (python migrations.py).
+# Every run uses fresh user IDs and clears them afterwards.
+
+
+def timed(samples, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "ops": len(samples),
+        "ops_per_s": round(len(samples) / (sum(samples) / 1000), 1) if sum(samples) else None,
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3)
+    }
+
+
+def benchmark(backend, users, messages, limit=20):
+    """Time appends, recent-N reads and counts over `users` x `messages` messages"""
+    run = uuid.uuid4().hex[:8]
+    user_ids = [f"bench-{run}-{i}" for i in range(users)]
+    appends, reads, counts = [], [], []
+    try:
+        for i in range(messages):
+            for user_id in user_ids:
+                timed(appends, backend.add_message, user_id, "user", f"benchmark message {i} " * 8, limit)
+        for user_id in user_ids:
+            timed(reads, backend.get_user_memory, user_id, limit)
+            timed(counts, backend.get_memory_count, user_id)
+    finally:
+        for user_id in user_ids:
+            backend.clear_user_memory(user_id)
+    return {"append": summarize(appends), "recent": summarize(reads), "count": summarize(counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Yuno's storage backends")
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"], choices=("memory", "sqlite", "postgres"))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40, help="messages appended per user")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in args.backends:
+            backend = storage.create_backend(kind, os.path.join(tmp, "bench.db"))
+            results = benchmark(backend, args.users, args.messages)
+            for operation, stats in results.items():
+                print(f"{kind:<10} {operation:<7} {stats['ops']:>7} ops  {stats['ops_per_s']:>10} ops/s  "
+                      f"p50 {stats['p50_ms']:.3f}ms  p95 {stats['p95_ms']:.3f}ms")
+            if hasattr(backend, "close"):
+                backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import statistics
+import time
+from collections import defaultdict
+
+import extractive_summarizer
+import traffic_recorder
+
+# Compare the local extractive summarizer with the LLM summaries in a traffic recording.
+#
+#   python summarizer_benchmark.py traffic.ndjson.gz [--window 20]
+#
+# For every recorded summary call, the user's last --window messages before it stand
+# in for the compressed messages (recordings don't say exactly which ones were
+# compressed). Quality is measured against the recorded LLM summary (content-word
+# recall, ROUGE-1 style) and by how many of the user's preference/feeling statements
+# survive; latency is measured locally vs. the recorded LLM latency.
+
+
+def conversations_from_traffic(path, window=20):
+    """Yield (messages, recorded summary record) for each recorded summary call"""
+    history = defaultdict(list)
+    for record in traffic_recorder.iter_records(path):
+        user = record.get("u")
+        if record.get("t") == "in":
+            history[user].append({"role": "user", "content": record.get("c") or ""})
+        elif record.get("t") == "llm" and record.get("k") == "chat" and record.get("st") == 200 and record.get("c"):
+            history[user].append({"role": "assistant", "content": record["c"]})
+        elif record.get("t") == "llm" and record.get("k") == "summary" and history[user]:
+            yield history[user][-window:], record
+
+
+def word_recall(reference, candidate):
+    reference_words = set(extractive_summarizer.content_words(reference))
+    if not reference_words:
+        return None
+    return len(reference_words & set(extractive_summarizer.content_words(candidate))) / len(reference_words)
+
+
+def key_statement_coverage(messages, summary):
+    """Share of the user's preference/feeling sentences that made it into the summary"""
+    patterns = extractive_summarizer.PREFERENCE_PATTERNS + extractive_summarizer.EMOTION_PATTERNS
+    key_sentences = [
+        sentence
+        for message in messages if message["role"] == "user"
+        for sentence in extractive_summarizer.split_sentences(message["content"])
+        if any(pattern.search(sentence.lower()) for pattern in patterns)
+    ]
+    if not key_sentences:
+        return None
+    return sum(1 for sentence in key_sentences if sentence in summary) / len(key_sentences)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        "p50": round(statistics.median(ordered), 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 2),
+        "mean": round(statistics.fmean(ordered), 3)
+    }
+
+
+def run(path, window=20):
+    local_ms, llm_ms, recalls, coverage, ratios = [], [], [], [], []
+    llm_failures = 0
+    for messages, record in conversations_from_traffic(path, window):
+        started = time.perf_counter()
+        summary = extractive_summarizer.summarize(messages)
+        local_ms.append((time.perf_counter() - started) * 1000)
+
+        original = sum(len(message["content"]) for message in messages)
+        if original:
+            ratios.append(len(summary) / original)
+        statement_share = key_statement_coverage(messages, summary)
+        if statement_share is not None:
+            coverage.append(statement_share)
+
+        if record.get("st") == 200:
+            llm_ms.append(record.get("ms", 0))
+            if record.get("c"):
+                recall = word_recall(record["c"], summary)
+                if recall is not None:
+                    recalls.append(recall)
+        else:
+            llm_failures += 1
+
+    return {
+        "summaries": len(local_ms),
+        "extractive_latency_ms": percentiles(local_ms),
+        "llm_latency_ms": percentiles(llm_ms),
+        "llm_failures": llm_failures,
+        "recall_of_llm_summary_words": percentiles(recalls),
+        "key_statement_coverage": percentiles(coverage),
+        "compression_ratio": percentiles(ratios)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extractive summarizer against recorded LLM summaries")
+    parser.add_argument("path", help="traffic file written by traffic_recorder")
+    parser.add_argument("--window", type=int, default=20, help="messages assumed compressed per summary")
+    args = parser.parse_args()
+    print(json.dumps(run(args.path, args.window), indent=2))
+
+
+if __name__ == "__main__":
+    main()
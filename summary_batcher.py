@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Batched memory compression. Under load many users cross the compression threshold
+# together, and each summary request repeats the same instructions. The batcher
+# holds compression jobs for a short window and sends several users' transcripts to
+# SUMMARY_MODEL in one request, asking for a JSON object keyed by user ID. Summaries
+# missing from or malformed in the answer fall back to the usual per-user request.
+
+MAX_SUMMARY_CHARS = 1000  # longer "summaries" are treated as malformed
+TOKENS_PER_SUMMARY = 150  # same budget as a single summary request
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def transcript(messages):
+    return "".join(f"{'User' if msg['role'] == 'user' else 'Yuno'}: {msg['content']}\n" for msg in messages)
+
+
+def build_batch_prompt(jobs):
+    """One prompt covering every (user_id, messages) job"""
+    sections = "\n".join(f'### Conversation "{user_id}"\n{transcript(messages)}' for user_id, messages in jobs)
+    keys = ", ".join(f'"{user_id}"' for user_id, _ in jobs)
+    return f"""Summarize each of the conversations below separately into 2-3 concise sentences, focusing on:
+1. Key topics discussed
+2. Important user preferences or information revealed
+3. Emotional context or relationship details
+
+Never mix details between conversations. Answer with only a JSON object that maps each
+conversation's key ({keys}) to its summary string.
+
+{sections}"""
+
+
+def parse_batch_reply(text, user_ids):
+    """{user_id: summary} for the users whose summary in the reply is valid"""
+    if not isinstance(text, str):  # content can come back null
+        return {}
+    try:
+        data = json.loads(_FENCE_RE.sub("", text.strip()))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    summaries = {}
+    for user_id in user_ids:
+        summary = data.get(str(user_id))
+        if isinstance(summary, str) and summary.strip() and len(summary) <= MAX_SUMMARY_CHARS:
+            summaries[user_id] = summary.strip()
+    return summaries
+
+
+class SummaryBatcher:
+    """Collect compression jobs for `window_ms` and summarize them in one request
+
+    post(payload, user_id, kind) sends a request (main.post_openrouter, which puts the
+    parsed body on response.data) and summarize_one(user_id, messages) is the per-user
+    fallback (main.summarize_with_llm).
+    """
+
+    def __init__(self, post, summarize_one, model, window_ms=2000, max_users=8, max_chars=24000):
+        self.post = post
+        self.summarize_one = summarize_one
+        self.model = model
+        self.window_ms = window_ms
+        self.max_users = max_users
+        self.max_chars = max_chars
+        self.pending = []  # (user_id, messages, future)
+        self.pending_chars = 0
+        self._timer = None
+        self._tasks = set()  # batches in flight; the loop only keeps weak references to tasks
+        self.stats = {"jobs": 0, "batches": 0, "batched_summaries": 0, "fallbacks": 0,
+                      "failed_batches": 0, "llm_calls": 0, "llm_calls_saved": 0}
+
+    async def summarize(self, user_id, messages):
+        """Summary of messages (possibly from a batch), or None"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((user_id, messages, future))
+        self.pending_chars += sum(len(msg["content"]) for msg in messages)
+        self.stats["jobs"] += 1
+        if len(self.pending) >= self.max_users or self.pending_chars >= self.max_chars:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window_ms / 1000)
+        self._timer = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        jobs, self.pending, self.pending_chars = self.pending, [], 0
+        if jobs:
+            task = asyncio.create_task(self._run(jobs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, jobs):
+        try:
+            results = await self._summarize_jobs(jobs)
+        except Exception as e:
+            logger.error("Error in batched summarization: %s", e, extra={"stage": "compression"})
+            results = {}
+        for user_id, _, future in jobs:
+            if not future.done():
+                future.set_result(results.get(user_id))
+
+    async def _summarize_jobs(self, jobs):
+        if len(jobs) == 1:
+            user_id, messages, _ = jobs[0]
+            self.stats["llm_calls"] += 1
+            return {user_id: await self.summarize_one(user_id, messages)}
+
+        user_ids = [user_id for user_id, _, _ in jobs]
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": build_batch_prompt([(u, m) for u, m, _ in jobs])}],
+            "max_tokens": TOKENS_PER_SUMMARY * len(jobs),
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"}
+        }
+        self.stats["batches"] += 1
+        self.stats["llm_calls"] += 1
+        summaries = {}
+        try:
+            response = await self.post(payload, None, kind="summary_batch")
+            if response.status_code == 200:
+                summaries = parse_batch_reply(response.data["choices"][0]["message"]["content"], user_ids)
+            else:
+                logger.error("Batched compression API error", extra={
+                    "stage": "compression", "status": response.status_code, "count": len(jobs)})
+        except Exception as e:
+            logger.error("Error in batched compression request: %s", e, extra={"stage": "compression"})
+        if not summaries:
+            self.stats["failed_batches"] += 1
+
+        # Per-user requests for whatever the batch didn't cover
+        missing = [(user_id, messages) for user_id, messages, _ in jobs if user_id not in summaries]
+        if missing:
+            self.stats["fallbacks"] += len(missing)
+            self.stats["llm_calls"] += len(missing)
+            fallback = await asyncio.gather(*(self.summarize_one(user_id, messages) for user_id, messages in missing))
+            summaries.update((user_id, summary) for (user_id, _), summary in zip(missing, fallback))
+
+        batched = len(jobs) - len(missing)
+        self.stats["batched_summaries"] += batched
+        # One call instead of `batched` calls, minus the wasted call if nothing came back
+        self.stats["llm_calls_saved"] += batched - 1
+        logger.info("Batched summaries for %d of %d users", batched, len(jobs), extra={
+            "stage": "compression", "count": batched, "model": self.model})
+        return summaries
+
+
+# Active batcher; None unless settings.summary_batching_enabled
+batcher = None
+
+
+def configure(settings, summary_model, post, summarize_one):
+    """(Re)create the batcher from the summary_batch_* settings"""
+    global batcher
+    if not settings.get("summary_batching_enabled", False):
+        batcher = None
+        return None
+    previous = batcher
+    batcher = SummaryBatcher(post, summarize_one, summary_model,
+                             window_ms=settings.get("summary_batch_window_ms", 2000),
+                             max_users=max(2, settings.get("summary_batch_max_users", 8)),
+                             max_chars=settings.get("summary_batch_max_chars", 24000))
+    if previous is not None:
+        batcher.stats = previous.stats  # jobs still pending there are flushed by its own timer
+    return batcher
+
+
+def health():
+    """Summary batching section of /health"""
+    if batcher is None:
+        return {"enabled": False}
+    return dict(batcher.stats, enabled=True, pending=len(batcher.pending))
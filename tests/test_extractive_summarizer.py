@@ -0,0 +1,42 @@
+import extractive_summarizer
+
+
+def conversation(*turns):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": text} for i, text in enumerate(turns)]
+
+
+def test_key_statements_take_the_slots_first():
+    # Yuno's replies repeat the frequent words, so they outscore plain user sentences
+    messages = conversation(
+        "I love hiking in the mountains.",
+        "Mountains mountains trails trails views views are great great.",
+        "I feel stressed about exams.",
+        "Mountains trails views great great mountains trails views.",
+        "My favorite food is ramen.",
+        "Trails views mountains great trails views mountains great.",
+    )
+    summary = extractive_summarizer.summarize(messages, max_sentences=3)
+    assert "I love hiking in the mountains." in summary
+    assert "I feel stressed about exams." in summary
+    assert "My favorite food is ramen." in summary
+    assert "Yuno:" not in summary
+
+
+def test_key_statements_fill_at_most_max_sentences():
+    messages = conversation(*[f"I love topic number {i}." if i % 2 == 0 else "Nice." for i in range(12)])
+    summary = extractive_summarizer.summarize(messages, max_sentences=2)
+    assert summary.count("User:") == 2
+
+
+def test_oversized_first_sentence_is_cut_to_max_chars():
+    long_sentence = "I love " + "very " * 200 + "long walks."
+    summary = extractive_summarizer.summarize(conversation(long_sentence), max_chars=100)
+    kept = summary.split("User: ", 1)[1]
+    assert len(kept) <= 100 and kept.endswith("…")
+
+
+def test_sentences_that_no_longer_fit_are_skipped():
+    messages = conversation("I love tea.", "Okay.", "I like " + "green " * 50 + "hills.", "Sure.", "I enjoy chess.")
+    summary = extractive_summarizer.summarize(messages, max_chars=40)
+    assert "User: I love tea." in summary and "User: I enjoy chess." in summary
+    assert "User: I like green" not in summary
@@ -0,0 +1,39 @@
+import asyncio
+import sys
+import types
+from datetime import datetime
+
+import pytest
+
+import memory_recall
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    calls = []
+
+    def search_user_memory(user_id, query, limit, skip_recent, timeout_ms):
+        calls.append(skip_recent)
+        return [{"role": "user", "content": f"turn outside the newest {skip_recent}",
+                 "timestamp": datetime(2025, 1, 1)}]
+
+    monkeypatch.setitem(sys.modules, "models", types.SimpleNamespace(search_user_memory=search_user_memory))
+    monkeypatch.setattr(memory_recall, "enabled", True)
+    monkeypatch.setattr(memory_recall, "cache", memory_recall.RecallCache())
+    monkeypatch.setattr(memory_recall, "stats", dict.fromkeys(memory_recall.stats, 0))
+    return calls
+
+
+def test_cache_hit_for_the_same_recent_window(searches):
+    first = asyncio.run(memory_recall.recall("1", "tell me about the garden again", 4))
+    second = asyncio.run(memory_recall.recall("1", "tell me about the garden again", 4))
+    assert first == second
+    assert searches == [4]
+    assert memory_recall.stats["cache_hits"] == 1
+
+
+def test_longer_recent_window_searches_again(searches):
+    asyncio.run(memory_recall.recall("1", "tell me about the garden again", 4))
+    result = asyncio.run(memory_recall.recall("1", "tell me about the garden again", 6))
+    assert searches == [4, 6]
+    assert "newest 6" in result["content"]
@@ -0,0 +1,63 @@
+import pytest
+
+import model_router
+
+ROUTING = {
+    "rules": [{"name": "casual", "models": ["fast", "slow"]}],
+    "health": {"min_samples": 5, "max_p95_ms": 5000, "max_error_rate": 0.25, "window_seconds": 300},
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_router.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(model_router, "router", None)
+    return model_router.configure({"model_routing": dict(ROUTING, enabled=True)}, "fast")
+
+
+def test_failing_model_is_skipped(clock, router):
+    for _ in range(10):
+        model_router.record_outcome("fast", 30000, False)
+    assert router.choose(10) == ("slow", "casual")
+
+
+def test_excluded_model_recovers_once_its_samples_expire(clock, router):
+    for _ in range(10):
+        model_router.record_outcome("fast", 30000, False)
+    assert not router.is_healthy("fast")
+
+    # Excluded, it gets no chat traffic and so no new samples
+    for _ in range(50):
+        assert router.choose(10)[0] == "slow"
+
+    clock.now += 301
+    assert router.is_healthy("fast")
+    assert router.choose(10) == ("fast", "casual")
+
+
+def test_only_chat_outcomes_count(clock, router):
+    for _ in range(10):
+        model_router.record_outcome("fast", 30000, False, kind="summary")
+    assert "fast" not in router.health
+    assert router.choose(10) == ("fast", "casual")
+
+
+def test_health_reports_routing(clock, router):
+    model_router.record_outcome("fast", 800, True)
+    health = model_router.health()
+    assert health["enabled"] is True
+    assert health["models"]["fast"]["requests"] == 1
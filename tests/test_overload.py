@@ -0,0 +1,70 @@
+import pytest
+
+import overload
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(overload.time, "monotonic", clock)
+    return clock
+
+
+def slow_requests(controller, count, latency_ms):
+    for _ in range(count):
+        controller.request_started()
+        controller.request_finished(latency_ms)
+
+
+def test_slow_requests_raise_the_level(clock):
+    controller = overload.OverloadController({"min_dwell_seconds": 0})
+    slow_requests(controller, 10, 30000)
+    assert controller.level == overload.BUSY_REPLY
+
+
+def test_level_recovers_after_busy_replies_stop_chat_requests(clock):
+    controller = overload.OverloadController({"min_dwell_seconds": 0, "latency_window_seconds": 60})
+    slow_requests(controller, 10, 30000)
+    assert controller.level == overload.BUSY_REPLY
+
+    # At BUSY_REPLY every message gets the canned reply, so no new latency samples arrive
+    for _ in range(100):
+        controller.reply_started()
+        controller.reply_finished()
+    assert controller.level == overload.BUSY_REPLY  # the slow samples are still fresh
+
+    clock.now += 61
+    for _ in range(overload.BUSY_REPLY):
+        controller.reply_started()
+        controller.reply_finished()
+    assert controller.level == overload.NORMAL
+    assert controller.p95_ms() == 0.0
+
+
+def test_recovery_steps_down_one_level_per_dwell(clock):
+    controller = overload.OverloadController({"min_dwell_seconds": 15, "latency_window_seconds": 60})
+    slow_requests(controller, 10, 30000)
+    clock.now += 61
+
+    levels = []
+    for _ in range(overload.BUSY_REPLY):
+        clock.now += 15
+        levels.append(controller.update())
+    assert levels == [overload.FASTEST_MODEL, overload.SHRINK_CONTEXT, overload.SKIP_COMPRESSION, overload.NORMAL]
+
+
+def test_fresh_fast_samples_outweigh_expired_slow_ones(clock):
+    controller = overload.OverloadController({"min_dwell_seconds": 0, "latency_window_seconds": 60})
+    slow_requests(controller, 10, 30000)
+    clock.now += 61
+    slow_requests(controller, 5, 900)
+    assert controller.p95_ms() == 900
+    assert controller.level == overload.NORMAL
@@ -0,0 +1,82 @@
+import copy
+import json
+
+import pytest
+
+import config_loader
+
+MODEL = "anthropic/claude-sonnet-4"
+USER_ID = "111"
+
+
+def make_config():
+    config = config_loader.get_default_config()
+    config["settings"]["prompt_cache_control_models"] = ["anthropic/"]
+    config["user_specific_memories"] = {"mother_user_id": USER_ID, "mother_memories": ["Loves gardening"]}
+    config["family_tree"] = {"relationship_styles": {"parent": "warm and affectionate"}}
+    config["personality_system"] = {"current_mood": "cheerful", "learned_traits": ["Curious"],
+                                    "interests": ["astronomy"]}
+    return config
+
+
+def build(config, emotional_tone="neutral", recalled=None, history=None):
+    history = history or [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hey!"},
+                          {"role": "user", "content": "how are you?"}]
+    return config_loader.build_prompt_messages(config, USER_ID, [], history, "parent", emotional_tone,
+                                               model=MODEL, recalled=recalled)
+
+
+def cached_prefix(messages):
+    """The static system block and the user-context block, serialized as they are sent"""
+    prefix = messages[:2]
+    assert all(block["content"][0]["cache_control"] == {"type": "ephemeral"} for block in prefix)
+    return [json.dumps(block, ensure_ascii=False).encode() for block in prefix]
+
+
+@pytest.fixture(autouse=True)
+def clear_prompt_caches():
+    config_loader._static_prompt_cache = None
+    config_loader._user_context_cache.clear()
+
+
+def test_prefix_stable_across_mood_tone_and_volatile_hints():
+    config = make_config()
+    first = build(config)
+    config["personality_system"]["current_mood"] = "sleepy"
+    second = build(config, emotional_tone="negative",
+                   recalled={"role": "system", "content": "Earlier: talked about the garden"})
+
+    assert cached_prefix(first) == cached_prefix(second)
+    assert first[-2]["content"] != second[-2]["content"]  # the volatile hints did change
+
+
+def test_prefix_stable_as_history_grows():
+    config = make_config()
+    first = build(config)
+    longer = build(config, history=[{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hey!"},
+                                    {"role": "user", "content": "how are you?"},
+                                    {"role": "assistant", "content": "great"},
+                                    {"role": "user", "content": "nice"}])
+    assert cached_prefix(first) == cached_prefix(longer)
+    assert first[2:4] == longer[2:4]
+
+
+def test_static_block_changes_with_config():
+    config = make_config()
+    first = build(config)
+    changed = copy.deepcopy(config)
+    changed["personality"]["traits"].append("Playful")
+    second = build(changed)
+
+    assert cached_prefix(first)[0] != cached_prefix(second)[0]
+
+
+def test_user_context_block_changes_with_user_facts():
+    config = make_config()
+    first = build(config)
+    changed = copy.deepcopy(config)
+    changed["user_specific_memories"]["mother_memories"].append("Has a cat named Miso")
+    second = build(changed)
+
+    assert cached_prefix(first)[0] == cached_prefix(second)[0]
+    assert cached_prefix(first)[1] != cached_prefix(second)[1]
@@ -0,0 +1,75 @@
+import os
+import uuid
+
+import pytest
+
+import storage
+
+# The contract every storage backend shares with the functions in models.py.
+# Postgres runs too when DATABASE_URL points at a migrated database (python migrations.py).
+
+
+@pytest.fixture(params=["memory", "sqlite", "postgres"])
+def backend(request, tmp_path):
+    if request.param == "postgres" and not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
+    backend = storage.create_backend(request.param, str(tmp_path / "state.db"))
+    yield backend
+    if hasattr(backend, "close"):
+        backend.close()
+
+
+@pytest.fixture
+def users(backend):
+    run = uuid.uuid4().hex[:8]
+    user, other = f"conf-{run}-a", f"conf-{run}-b"
+    yield user, other
+    for user_id in (user, other):
+        backend.clear_user_memory(user_id)
+        backend.clear_summaries(user_id)
+
+
+def test_messages(backend, users):
+    user, other = users
+    for i in range(25):
+        backend.add_message(user, "user" if i % 2 == 0 else "assistant", f"message {i}", 20)
+    backend.add_message(other, "user", "someone else", 20)
+    messages = backend.get_user_memory(user)
+
+    assert backend.get_memory_count(user) == 20, "add_message keeps only the last `limit` messages"
+    assert [m["content"] for m in messages] == [f"message {i}" for i in range(5, 25)], "oldest first"
+    assert messages[0] == {"role": "assistant", "content": "message 5"}
+    assert [m["content"] for m in backend.get_user_memory(user, 3)] == ["message 22", "message 23", "message 24"]
+
+    assert backend.clear_user_memory(user) is True
+    assert backend.get_user_memory(user) == [] and backend.get_memory_count(user) == 0
+    assert backend.get_memory_count(other) == 1, "clearing one user leaves the others alone"
+
+
+def test_summaries(backend, users):
+    user, _ = users
+    backend.add_summary(user, "first")
+    backend.add_summary(user, "second")
+    assert backend.get_summaries(user) == ["first", "second"], "summaries come back oldest first"
+    backend.clear_summaries(user)
+    assert backend.get_summaries(user) == []
+
+
+def test_emotional_history(backend, users):
+    user, _ = users
+    for tone in ("positive", "neutral", "negative", "positive"):
+        backend.add_emotional_record(user, tone, 3)
+    history = backend.get_emotional_history(user)
+    assert [r["tone"] for r in history] == ["neutral", "negative", "positive"], "keeps the last `keep`"
+    assert all(r.get("timestamp") for r in history)
+    assert [r["tone"] for r in backend.get_emotional_history(user, 1)] == ["positive"]
+
+
+def test_highlights(backend, users):
+    user, other = users
+    category = f"favorite_memories_{uuid.uuid4().hex[:8]}"
+    for i in range(4):
+        backend.add_highlight(user if i < 3 else other, category, "memory", f"highlight {i}", 3)
+    highlights = backend.get_highlights(user)
+    assert [h["content"] for h in highlights] == ["highlight 2", "highlight 1"], "newest first, trimmed per category"
+    assert highlights[0]["user_id"] == user and highlights[0]["type"] == "memory"
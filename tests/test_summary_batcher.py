@@ -0,0 +1,128 @@
+import asyncio
+import gc
+import json
+
+import summary_batcher
+from summary_batcher import SummaryBatcher, parse_batch_reply
+
+
+def test_parse_valid_reply():
+    reply = json.dumps({"1": " They like tea. ", "2": "They moved to Osaka."})
+    assert parse_batch_reply(reply, ["1", "2"]) == {"1": "They like tea.", "2": "They moved to Osaka."}
+
+
+def test_parse_fenced_reply():
+    reply = '```json\n{"1": "They like tea."}\n```'
+    assert parse_batch_reply(reply, ["1"]) == {"1": "They like tea."}
+
+
+def test_parse_malformed_reply():
+    assert parse_batch_reply('{"1": "They like tea."', ["1"]) == {}
+    assert parse_batch_reply("Sure! Here are the summaries:", ["1"]) == {}
+    assert parse_batch_reply(None, ["1"]) == {}
+
+
+def test_parse_non_object_reply():
+    assert parse_batch_reply('["They like tea."]', ["1"]) == {}
+    assert parse_batch_reply('"They like tea."', ["1"]) == {}
+
+
+def test_parse_partial_reply_keeps_the_valid_summaries():
+    reply = json.dumps({"1": "They like tea.", "2": "", "3": 42, "4": "x" * (summary_batcher.MAX_SUMMARY_CHARS + 1)})
+    assert parse_batch_reply(reply, ["1", "2", "3", "4", "5"]) == {"1": "They like tea."}
+
+
+def test_parse_out_of_order_and_unknown_keys():
+    reply = json.dumps({"9": "Someone else.", "2": "They moved to Osaka.", "1": "They like tea."})
+    assert parse_batch_reply(reply, ["1", "2"]) == {"1": "They like tea.", "2": "They moved to Osaka."}
+
+
+def test_parse_integer_user_ids():
+    assert parse_batch_reply('{"7": "They like tea."}', [7]) == {7: "They like tea."}
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.status_code = status_code
+        self.data = {"choices": [{"message": {"content": content}}]}
+
+
+class FakeApi:
+    """post() answers a batch with `reply(user_ids)` after `delay`; summarize_one is the fallback"""
+
+    def __init__(self, reply, delay=0.01):
+        self.reply = reply
+        self.delay = delay
+        self.posts = []
+        self.singles = []
+
+    async def post(self, payload, user_id, kind):
+        self.posts.append(kind)
+        await asyncio.sleep(self.delay)
+        return FakeResponse(self.reply(payload["messages"][0]["content"]))
+
+    async def summarize_one(self, user_id, messages):
+        self.singles.append(user_id)
+        return f"single {user_id}"
+
+
+def messages(text):
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": "ok"}]
+
+
+def test_full_batch_is_flushed_and_referenced_while_in_flight():
+    api = FakeApi(lambda prompt: json.dumps({"1": "batched 1", "2": "batched 2"}))
+    batcher = SummaryBatcher(api.post, api.summarize_one, "model", window_ms=60000, max_users=2)
+
+    async def run():
+        first = asyncio.create_task(batcher.summarize("1", messages("hello")))
+        second = asyncio.create_task(batcher.summarize("2", messages("hi")))
+        await asyncio.sleep(0)
+        # Flushed at max_users without waiting out the window; only the batcher holds the task
+        assert batcher.pending == [] and batcher._timer is None
+        assert len(batcher._tasks) == 1
+        gc.collect()
+        results = await asyncio.gather(first, second)
+        assert batcher._tasks == set()
+        return results
+
+    assert asyncio.run(run()) == ["batched 1", "batched 2"]
+    assert api.posts == ["summary_batch"]
+    assert api.singles == []
+    assert batcher.stats["llm_calls_saved"] == 1
+
+
+def test_window_flushes_a_partial_batch():
+    api = FakeApi(lambda prompt: "{}")
+    batcher = SummaryBatcher(api.post, api.summarize_one, "model", window_ms=10, max_users=8)
+
+    async def run():
+        return await asyncio.wait_for(batcher.summarize("1", messages("hello")), 1)
+
+    # A lone job goes out as a plain per-user request
+    assert asyncio.run(run()) == "single 1"
+    assert api.posts == []
+    assert api.singles == ["1"]
+
+
+def test_missing_summaries_fall_back_per_user():
+    api = FakeApi(lambda prompt: json.dumps({"2": "batched 2", "1": ""}))
+    batcher = SummaryBatcher(api.post, api.summarize_one, "model", window_ms=60000, max_users=3)
+
+    async def run():
+        return await asyncio.gather(*(batcher.summarize(user_id, messages("hello")) for user_id in ("1", "2", "3")))
+
+    assert asyncio.run(run()) == ["single 1", "batched 2", "single 3"]
+    assert sorted(api.singles) == ["1", "3"]
+    assert batcher.stats["fallbacks"] == 2
+
+
+def test_malformed_batch_reply_falls_back_for_everyone():
+    api = FakeApi(lambda prompt: "not json")
+    batcher = SummaryBatcher(api.post, api.summarize_one, "model", window_ms=60000, max_users=2)
+
+    async def run():
+        return await asyncio.gather(batcher.summarize("1", messages("a")), batcher.summarize("2", messages("b")))
+
+    assert asyncio.run(run()) == ["single 1", "single 2"]
+    assert batcher.stats["failed_batches"] == 1
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+import topic_stats
+from topic_stats import TopicIndex
+
+DAY = 86400
+NOW = topic_stats.EPOCH + 400 * DAY
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(topic_stats, "half_life_seconds", 30 * DAY)
+    monkeypatch.setattr(topic_stats, "top_k", 3)
+    monkeypatch.setattr(topic_stats, "max_user_topics", 8)
+    monkeypatch.setattr(topic_stats, "max_global_topics", 20)
+    monkeypatch.setattr(topic_stats, "_indexes", {})
+
+
+def brute_force_top(scores, k):
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+@pytest.mark.parametrize("k, max_topics, vocabulary", [(3, 1000, 40), (5, 12, 60), (1, 4, 30)])
+def test_top_k_matches_a_full_sort(k, max_topics, vocabulary):
+    rng = random.Random(k * 1000 + max_topics)
+    scores = {}
+    index = TopicIndex(scores, k, max_topics)
+    now = NOW
+    for _ in range(2000):
+        now += rng.uniform(0, DAY)
+        top_before = list(index.top)
+        changed = index.add(f"topic {rng.randrange(vocabulary)}", topic_stats.log_weight(now) + rng.uniform(-3, 3))
+        assert len(scores) <= max_topics * 5 // 4
+        assert index.top == brute_force_top(scores, k)
+        assert changed or index.top == top_before
+
+
+def test_prune_keeps_the_top_k():
+    scores = {}
+    index = TopicIndex(scores, 3, 4)
+    for score, topic in enumerate("abcde"):
+        index.add(topic, float(score))
+    assert len(scores) == 5  # pruning waits for max_topics * 5 // 4 to be passed
+    index.add("f", 5.0)
+    assert sorted(scores) == ["c", "d", "e", "f"]
+    assert index.top == ["f", "e", "d"]
+
+
+def test_index_built_from_existing_scores():
+    scores = {"a": 1.0, "b": 3.0, "c": 2.0, "d": 0.5}
+    assert TopicIndex(scores, 2, 10).top == ["b", "c"]
+
+
+def test_decayed_count_halves_every_half_life():
+    score = topic_stats.log_weight(NOW)
+    assert topic_stats.decayed_count(score, NOW) == pytest.approx(1)
+    assert topic_stats.decayed_count(score, NOW + 30 * DAY) == pytest.approx(0.5)
+    assert topic_stats.decayed_count(score, NOW + 90 * DAY) == pytest.approx(0.125)
+
+
+def test_later_mentions_outweigh_older_ones():
+    scores = {}
+    index = TopicIndex(scores, 2, 10)
+    for _ in range(3):
+        index.add("old", topic_stats.log_weight(NOW))
+    index.add("new", topic_stats.log_weight(NOW + 30 * DAY))
+    assert index.top == ["old", "new"]  # 3 mentions a half-life ago are worth 1.5 now
+    index.add("new", topic_stats.log_weight(NOW + 30 * DAY))
+    assert index.top == ["new", "old"]
+    assert topic_stats.decayed_count(scores["old"], NOW + 30 * DAY) == pytest.approx(1.5)
+    assert topic_stats.decayed_count(scores["new"], NOW + 30 * DAY) == pytest.approx(2)
+
+
+def test_scores_stay_finite_far_from_the_epoch(monkeypatch):
+    monkeypatch.setattr(topic_stats, "half_life_seconds", 60)
+    far = topic_stats.EPOCH + 1000 * 365 * DAY  # 2**(elapsed / half_life) would overflow a float
+    score = topic_stats.add_log(topic_stats.log_weight(far), topic_stats.log_weight(far))
+    assert topic_stats.decayed_count(score, far) == pytest.approx(2)
+
+
+def test_record_updates_user_and_global_top_topics():
+    personality, alice, bob = {}, {}, {}
+    topic_stats.record(personality, alice, 1, "I love chess. I enjoy hiking!", now=NOW)
+    topic_stats.record(personality, bob, 2, "I really like hiking", now=NOW + DAY)
+    assert sorted(topic_stats.user_top_topics(alice, 1)) == ["chess", "hiking"]
+    assert topic_stats.user_top_topics(bob, 2) == ["hiking"]
+    assert topic_stats.top_interests(personality)[0] == "hiking"
+    assert topic_stats.user_top_topics({}, 3) == []
+
+
+def test_index_eviction_keeps_the_global_index(monkeypatch):
+    monkeypatch.setattr(topic_stats, "MAX_INDEXES", 3)
+    personality = {}
+    users = [{} for _ in range(4)]
+    for user_id, patterns in enumerate(users[:2]):
+        topic_stats.record(personality, patterns, user_id, "I love chess", now=NOW)
+    global_index = topic_stats._indexes[None]
+    assert len(topic_stats._indexes) == 3
+
+    topic_stats.record(personality, users[2], 2, "I love tennis", now=NOW)
+    # Per-user indexes dropped, the global one (and its top-k) kept
+    assert topic_stats._indexes[None] is global_index
+    assert set(topic_stats._indexes) == {None, 2}
+    assert personality["interests"] == ["chess", "tennis"]
+
+    # A dropped index is rebuilt from the scores it left behind
+    assert topic_stats.user_top_topics(users[0], 0) == ["chess"]
+    assert 0 in topic_stats._indexes
@@ -0,0 +1,59 @@
+import usage_ledger
+from usage_ledger import OutputLimits
+
+SHORT, LONG = 10, 500  # incoming message lengths in the short and long buckets
+
+
+def observe(limits, completions, message_length=SHORT, finish_reason="stop"):
+    for tokens in completions:
+        limits.observe(message_length, tokens, finish_reason)
+
+
+def test_default_until_enough_samples():
+    limits = OutputLimits(floor=50, headroom=1.5, min_samples=10)
+    observe(limits, [20] * 9)
+    assert limits.max_tokens(SHORT, 500) == 500
+    observe(limits, [20])
+    assert limits.max_tokens(SHORT, 500) != 500
+
+
+def test_p95_times_headroom():
+    limits = OutputLimits(floor=10, headroom=1.5, min_samples=20)
+    observe(limits, range(1, 101))  # p95 of 1..100 is 96
+    assert limits.max_tokens(SHORT, 500) == int(96 * 1.5)
+
+
+def test_clamped_to_floor():
+    limits = OutputLimits(floor=120, headroom=1.5, min_samples=10)
+    observe(limits, [5] * 50)
+    assert limits.max_tokens(SHORT, 500) == 120
+
+
+def test_clamped_to_default():
+    limits = OutputLimits(floor=120, headroom=1.5, min_samples=10)
+    observe(limits, [450] * 50)
+    assert limits.max_tokens(SHORT, 500) == 500
+
+
+def test_truncated_replies_restore_the_default():
+    limits = OutputLimits(floor=50, headroom=1.5, min_samples=10)
+    observe(limits, [100] * 90)
+    observe(limits, [150] * 4, finish_reason="length")
+    assert limits.max_tokens(SHORT, 500) == 150  # 4 of 94 cut off is within the 5% limit
+    observe(limits, [150], finish_reason="length")
+    assert limits.max_tokens(SHORT, 500) == 500
+
+
+def test_buckets_are_independent():
+    limits = OutputLimits(floor=50, headroom=1.0, min_samples=10)
+    observe(limits, [80] * 20, message_length=SHORT)
+    assert limits.max_tokens(SHORT, 500) == 80
+    assert limits.max_tokens(LONG, 500) == 500
+    assert usage_ledger.length_bucket(SHORT) == "short" and usage_ledger.length_bucket(LONG) == "long"
+
+
+def test_window_forgets_old_completions():
+    limits = OutputLimits(floor=10, headroom=1.0, min_samples=10, window=20)
+    observe(limits, [400] * 20)
+    observe(limits, [60] * 20)
+    assert limits.max_tokens(SHORT, 500) == 60
@@ -0,0 +1,182 @@
+import heapq
+import math
+import re
+import time
+
+# Topic statistics behind Yuno's interests. Each owner (a user, or everyone together)
+# has a hash index of topic -> decayed count, bounded in size, and a top-k list that
+# is kept up to date on every update, so readers get the best topics in O(k).
+#
+# Counts decay with a half-life using forward decay: a mention at time t adds
+# 2**((t - EPOCH) / half_life) to its topic, stored as a log2 so it never overflows.
+# Later mentions weigh more, and since every stored score is relative to the same
+# epoch, scores compare correctly without being decayed first; decayed_count()
+# turns one back into "mentions, decayed to now".
+#
+# Scores live in the config document: conversation_patterns[user]["topics"] per user
+# and personality_system["topic_scores"] for everyone, with personality_system
+# ["interests"] holding the global top-k (best first) for the prompt and commands.
+
+EPOCH = 1704067200  # 2024-01-01 UTC
+
+# Set from settings by configure()
+half_life_seconds = 30 * 86400
+top_k = 10
+max_user_topics = 50
+max_global_topics = 500
+
+INTEREST_RE = re.compile(
+    r"\b(?:love|loves|enjoy|enjoys|like|likes|interested in|fascinated by|hobby is|hobbies are|passion is|"
+    r"favorite \w+ is|favourite \w+ is)\s+([^.!?,;:\n]+)")
+EDGE_WORDS = {
+    "a", "an", "the", "to", "my", "your", "his", "her", "our", "their", "some", "about", "of", "in", "on",
+    "with", "it", "that", "this", "is", "are", "was", "you", "me", "him", "them", "us", "so", "very", "really",
+    "and", "or", "but", "when", "too", "much", "lot", "lots", "just", "all", "i",
+}
+
+
+def extract_topics(message_content, max_words=3):
+    """Interest phrases in a message ("I love playing chess" -> ["playing chess"])
+
+    A phrase is cut after `max_words` words that aren't EDGE_WORDS, so "the lord of
+    the rings" survives whole; edge words are trimmed from both ends.
+    """
+    topics = []
+    for match in INTEREST_RE.finditer(message_content.lower()):
+        words = re.findall(r"[a-z0-9][a-z0-9'-]*", match.group(1))
+        while words and words[0] in EDGE_WORDS:
+            words.pop(0)
+        content_words = 0
+        for end, word in enumerate(words):
+            content_words += word not in EDGE_WORDS
+            if content_words == max_words or end == 2 * max_words - 1:
+                words = words[:end + 1]
+                break
+        while words and words[-1] in EDGE_WORDS:
+            words.pop()
+        topic = " ".join(words)
+        if len(topic) > 2 and topic not in topics:
+            topics.append(topic)
+    return topics
+
+
+def log_weight(now=None):
+    """log2 of the forward-decay weight of a mention at `now`"""
+    return ((now if now is not None else time.time()) - EPOCH) / half_life_seconds
+
+
+def add_log(a, b):
+    """log2(2**a + 2**b) without overflow"""
+    if a < b:
+        a, b = b, a
+    return a + math.log2(1 + 2 ** (b - a))
+
+
+def decayed_count(score, now=None):
+    """Mentions behind a stored score, decayed to `now`"""
+    return 2 ** (score - log_weight(now))
+
+
+class TopicIndex:
+    """Bounded topic -> score index over a dict it updates in place, with an O(k) top-k"""
+
+    def __init__(self, scores, k, max_topics):
+        self.scores = scores
+        self.k = k
+        self.max_topics = max_topics
+        self.top = heapq.nlargest(k, scores, key=scores.__getitem__)  # best first
+
+    def add(self, topic, weight):
+        """Count a mention; returns True if the top-k changed"""
+        score = add_log(self.scores[topic], weight) if topic in self.scores else weight
+        self.scores[topic] = score
+        if len(self.scores) > self.max_topics * 5 // 4:
+            self._prune()
+
+        if topic in self.top:
+            self.top.remove(topic)
+        elif len(self.top) >= self.k and score <= self.scores[self.top[-1]]:
+            return False
+        position = len(self.top)
+        while position > 0 and self.scores[self.top[position - 1]] < score:
+            position -= 1
+        self.top.insert(position, topic)
+        del self.top[self.k:]
+        return True
+
+    def _prune(self):
+        # Drop the weakest topics in one go so pruning is amortised over many adds;
+        # the top-k is never among them
+        keep = set(heapq.nlargest(self.max_topics, self.scores, key=self.scores.__getitem__)) | set(self.top)
+        for topic in [topic for topic in self.scores if topic not in keep]:
+            del self.scores[topic]
+
+
+# Indexes over the score dicts of the current config document, rebuilt when a
+# reload or restore replaces one of those dicts. Bounded like config_loader's
+# user-context cache: past MAX_INDEXES the per-user ones are dropped and rebuilt
+# from their scores on next use.
+_indexes = {}
+MAX_INDEXES = 5000
+
+
+def _index(owner, scores, k, max_topics):
+    index = _indexes.get(owner)
+    if index is None or index.scores is not scores or index.k != k or index.max_topics != max_topics:
+        if index is None and len(_indexes) >= MAX_INDEXES:
+            global_index = _indexes.get(None)
+            _indexes.clear()
+            if global_index is not None:
+                _indexes[None] = global_index
+        index = _indexes[owner] = TopicIndex(scores, k, max_topics)
+    return index
+
+
+def configure(settings):
+    """Apply the topic_* settings"""
+    global half_life_seconds, top_k, max_user_topics, max_global_topics
+    half_life_seconds = max(1, settings.get("topic_half_life_days", 30)) * 86400
+    top_k = settings.get("topic_top_k", 10)
+    max_user_topics = max(top_k, settings.get("topic_max_per_user", 50))
+    max_global_topics = max(top_k, settings.get("topic_max_global", 500))
+
+
+def record(personality, user_patterns, user_id, message_content, now=None):
+    """Count the interest phrases of a message for its user and globally"""
+    topics = extract_topics(message_content)
+    if not topics:
+        return
+    weight = log_weight(now)
+    user_index = _index(user_id, user_patterns.setdefault("topics", {}), top_k, max_user_topics)
+    global_index = _index(None, personality.setdefault("topic_scores", {}), top_k, max_global_topics)
+    changed = False
+    for topic in topics:
+        user_index.add(topic, weight)
+        changed = global_index.add(topic, weight) or changed
+    if changed or personality.get("interests") != global_index.top:
+        personality["interests"] = list(global_index.top)
+
+
+def top_interests(personality):
+    """Global top-k interests, best first"""
+    return personality.get("interests", [])
+
+
+def user_top_topics(user_patterns, user_id):
+    """A user's top-k topics, best first"""
+    scores = user_patterns.get("topics")
+    if not scores:
+        return []
+    return list(_index(user_id, scores, top_k, max_user_topics).top)
+
+
+def seed_interests(personality):
+    """Give interests saved as a plain list (before topic stats) scores, oldest weakest"""
+    scores = personality.setdefault("topic_scores", {})
+    interests = personality.get("interests", [])
+    if scores or not interests:
+        return
+    weight = log_weight()
+    for age, interest in enumerate(reversed(interests)):
+        scores[interest] = weight - age / 1000
+    personality["interests"] = list(_index(None, scores, top_k, max_global_topics).top)
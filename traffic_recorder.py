@@ -0,0 +1,175 @@
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bump when the record layout changes so replays can refuse files they don't understand
+RECORD_VERSION = 1
+
+_MENTION_RE = re.compile(r'<[@#][!&]?\d+>')
+_URL_RE = re.compile(r'https?://\S+')
+_EMAIL_RE = re.compile(r'\b[\w.+-]+@[\w-]+\.[\w.-]+\b')
+_DIGITS_RE = re.compile(r'\d')
+_WORD_RE = re.compile(r'\w+')
+
+
+def anonymize_text(text, mode="scrub"):
+    """Strip identifying details from message text before it is recorded
+
+    - "scrub" keeps the words (tone, parent-ping and interest detection still behave the
+      same on replay) but removes mentions, URLs, emails and digits.
+    - "shape" keeps only the length and word boundaries of the text.
+    - "none" records the text as-is.
+    """
+    if not text or mode == "none":
+        return text
+    if mode == "shape":
+        return _WORD_RE.sub(lambda m: "x" * len(m.group(0)), text)
+    text = _MENTION_RE.sub("<@user>", text)
+    text = _URL_RE.sub("<url>", text)
+    text = _EMAIL_RE.sub("<email>", text)
+    return _DIGITS_RE.sub("0", text)
+
+
+class TrafficRecorder:
+    """Append-only recorder of anonymized bot inputs and OpenRouter exchanges
+
+    Each record is one compact JSON line. Paths ending in .gz are written as
+    concatenated gzip members, which gzip readers treat as a single stream.
+    """
+
+    def __init__(self, path, content_mode="scrub", salt=None, flush_every=20):
+        self.path = path
+        self.content_mode = content_mode
+        self.salt = (salt or os.getenv("YUNO_TRAFFIC_SALT") or os.urandom(16).hex()).encode()
+        self.flush_every = flush_every
+        self._file = None
+        self._pending = 0
+
+    def user_key(self, user_id):
+        """Stable, non-reversible key for a user within this salt"""
+        if user_id is None:
+            return None
+        return hmac.new(self.salt, str(user_id).encode(), hashlib.sha256).hexdigest()[:12]
+
+    def _write(self, record):
+        if self._file is None:
+            if self.path.endswith(".gz"):
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+            else:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps({"t": "hdr", "v": RECORD_VERSION, "ts": round(time.time(), 3)}) + "\n")
+        self._file.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._pending = 0
+
+    def record_input(self, user_id, content, relationship_type):
+        """Record an incoming message the bot is about to answer"""
+        self._write({
+            "t": "in",
+            "ts": round(time.time(), 3),
+            "u": self.user_key(user_id),
+            "rel": relationship_type,
+            "n": len(content),
+            "c": anonymize_text(content, self.content_mode)
+        })
+
+    def record_llm(self, user_id, kind, payload, status, latency_ms, response_bytes=0, data=None):
+        """Record one OpenRouter request/response pair"""
+        record = {
+            "t": "llm",
+            "ts": round(time.time(), 3),
+            "u": self.user_key(user_id),
+            "k": kind,
+            "m": payload.get("model"),
+            "msgs": len(payload.get("messages", [])),
+            "req": len(json.dumps(payload)),
+            "resp": response_bytes,
+            "ms": round(latency_ms, 1),
+            "st": status
+        }
+        if data:
+            if data.get("usage"):
+                record["usage"] = data["usage"]
+            try:
+                record["c"] = anonymize_text(data["choices"][0]["message"]["content"], self.content_mode)
+            except (KeyError, IndexError, TypeError):
+                pass
+        self._write(record)
+
+
+# Active recorder; None unless traffic recording is enabled in settings
+recorder = None
+
+
+def configure(settings):
+    """(Re)configure recording from the "settings" block of yuno_config"""
+    global recorder
+    enabled = settings.get("traffic_recording_enabled", False)
+    path = settings.get("traffic_record_path", "traffic.ndjson.gz")
+    content_mode = settings.get("traffic_record_content", "scrub")
+
+    if recorder is not None and (not enabled or recorder.path != path or recorder.content_mode != content_mode):
+        recorder.close()
+        recorder = None
+    if enabled and recorder is None:
+        recorder = TrafficRecorder(path, content_mode)
+        logger.info("Traffic recording enabled -> %s", path)
+    return recorder
+
+
+def record_input(user_id, content, relationship_type):
+    if recorder is not None:
+        try:
+            recorder.record_input(user_id, content, relationship_type)
+        except Exception as e:
+            logger.error("Error recording traffic: %s", e, extra={"user": user_id, "stage": "recording"})
+
+
+def record_llm(user_id, kind, payload, status, latency_ms, response_bytes=0, data=None):
+    if recorder is not None:
+        try:
+            recorder.record_llm(user_id, kind, payload, status, latency_ms, response_bytes, data)
+        except Exception as e:
+            logger.error("Error recording traffic: %s", e, extra={"user": user_id, "stage": "recording"})
+
+
+def iter_records(path):
+    """Yield records from a traffic file, skipping headers"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("t") == "hdr":
+                if record.get("v", 0) > RECORD_VERSION:
+                    raise ValueError(f"Traffic file version {record['v']} is newer than supported ({RECORD_VERSION})")
+                continue
+            yield record
+
+
+@atexit.register
+def _close_recorder():
+    if recorder is not None:
+        recorder.close()
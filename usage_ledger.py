@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Token usage ledger. Every OpenRouter response carries a `usage` block (prompt and
+# completion tokens, and the cost when OpenRouter reports it); post_openrouter adds
+# it here per user, model and kind together with the latency. Totals since start
+# stay in memory; with the Postgres backend the per-day deltas are also added to
+# llm_usage every usage_flush_seconds, so !usage can report across workers.
+#
+# The same data drives adaptive output limits: recent completion sizes are tracked
+# per message-length bucket, and short casual turns get a max_tokens just above what
+# replies to them actually use instead of the static max_response_tokens.
+
+FIELDS = ("requests", "prompt_tokens", "completion_tokens", "latency_ms", "cost")
+LENGTH_BUCKETS = ((40, "short"), (200, "medium"), (None, "long"))  # by incoming message chars
+TRUNCATION_LIMIT = 0.05  # above this share of replies cut off at max_tokens, adaptation stops
+
+
+def _empty():
+    return [0, 0, 0, 0.0, 0.0]
+
+
+def length_bucket(message_length):
+    for limit, name in LENGTH_BUCKETS:
+        if limit is None or message_length <= limit:
+            return name
+
+
+class UsageLedger:
+    """Per (user, model, kind) usage totals plus the deltas not yet written to the database"""
+
+    def __init__(self):
+        self.totals = defaultdict(_empty)  # (user_id, model, kind) -> FIELDS
+        self.pending = defaultdict(_empty)  # (day, user_id, model, kind) -> FIELDS
+
+    def record(self, user_id, model, kind, usage, latency_ms, keep_pending=True):
+        values = (1, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+                  latency_ms, usage.get("cost") or 0.0)
+        user = str(user_id) if user_id is not None else ""
+        rows = [self.totals[(user, model, kind)]]
+        if keep_pending:
+            rows.append(self.pending[(datetime.utcnow().date(), user, model, kind)])
+        for row in rows:
+            for i, value in enumerate(values):
+                row[i] += value
+
+    def take_pending(self):
+        """Rows for models.add_usage; the deltas are cleared"""
+        pending, self.pending = self.pending, defaultdict(_empty)
+        return [dict(zip(("day", "user_id", "model", "kind") + FIELDS, key + tuple(values)))
+                for key, values in pending.items()]
+
+    def restore_pending(self, rows):
+        """Put back rows whose flush failed"""
+        for row in rows:
+            target = self.pending[(row["day"], row["user_id"], row["model"], row["kind"])]
+            for i, field in enumerate(FIELDS):
+                target[i] += row[field]
+
+    def summary(self, top_users=5):
+        """Totals per model and the heaviest users, in the shape of models.get_usage_summary"""
+        by_model, by_user = defaultdict(_empty), defaultdict(_empty)
+        for (user, model, _), values in self.totals.items():
+            for target in (by_model[model], by_user[user]):
+                for i, value in enumerate(values):
+                    target[i] += value
+        users = sorted(((user, values) for user, values in by_user.items() if user),
+                       key=lambda item: item[1][1] + item[1][2], reverse=True)[:top_users]
+        return {
+            "models": [dict(zip(FIELDS, values), model=model) for model, values in by_model.items()],
+            "users": [dict(zip(FIELDS, values), user_id=user) for user, values in users]
+        }
+
+
+class OutputLimits:
+    """Adaptive max_tokens per message-length bucket from recent completion sizes"""
+
+    def __init__(self, floor=120, headroom=1.5, min_samples=50, window=200):
+        self.floor = floor
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.completions = {name: deque(maxlen=window) for _, name in LENGTH_BUCKETS}
+        self.truncated = {name: deque(maxlen=window) for _, name in LENGTH_BUCKETS}
+
+    def observe(self, message_length, completion_tokens, finish_reason):
+        bucket = length_bucket(message_length)
+        self.completions[bucket].append(completion_tokens)
+        self.truncated[bucket].append(finish_reason == "length")
+
+    def max_tokens(self, message_length, default):
+        bucket = length_bucket(message_length)
+        completions = self.completions[bucket]
+        if len(completions) < self.min_samples:
+            return default
+        truncated = self.truncated[bucket]
+        if sum(truncated) / len(truncated) > TRUNCATION_LIMIT:
+            return default  # the lowered limit is cutting replies off
+        ordered = sorted(completions)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return max(self.floor, min(default, int(p95 * self.headroom)))
+
+    def export(self, default):
+        return {name: {"samples": len(self.completions[name]), "max_tokens": self.max_tokens(limit or 10 ** 6, default),
+                       "truncated": sum(self.truncated[name])}
+                for limit, name in LENGTH_BUCKETS}
+
+
+# Active ledger and output limits; None when disabled in settings
+ledger = None
+limits = None
+flush_seconds = 60
+_shared_database = False
+
+
+def configure(settings, shared_database):
+    """(Re)configure from the usage_* settings, keeping what was recorded so far"""
+    global ledger, limits, flush_seconds, _shared_database
+    ledger = (ledger or UsageLedger()) if settings.get("usage_ledger_enabled", True) else None
+    flush_seconds = settings.get("usage_flush_seconds", 60)
+    _shared_database = shared_database
+    if ledger is not None and settings.get("usage_adaptive_max_tokens", False):
+        previous = limits
+        limits = OutputLimits(settings.get("usage_max_tokens_floor", 120),
+                              settings.get("usage_max_tokens_headroom", 1.5),
+                              settings.get("usage_min_samples", 50))
+        if previous is not None:
+            limits.completions, limits.truncated = previous.completions, previous.truncated
+    else:
+        limits = None
+
+
+def record(user_id, model, kind, data, latency_ms):
+    """Add an OpenRouter response's usage block to the ledger"""
+    if ledger is not None and data:
+        ledger.record(user_id, data.get("model") or model, kind, data.get("usage") or {}, latency_ms,
+                      keep_pending=_shared_database)
+
+
+def observe_reply(message_content, data):
+    """Feed a chat reply's size into the adaptive output limits"""
+    if limits is not None and data and data.get("usage"):
+        choice = (data.get("choices") or [{}])[0]
+        limits.observe(len(message_content), data["usage"].get("completion_tokens") or 0, choice.get("finish_reason"))
+
+
+def max_tokens_for(message_content, default):
+    """max_tokens for a reply to message_content"""
+    return limits.max_tokens(len(message_content), default) if limits is not None else default
+
+
+async def flush():
+    """Add the pending deltas to llm_usage (Postgres backend only)"""
+    if ledger is None or not _shared_database:
+        return 0
+    rows = ledger.take_pending()
+    if not rows:
+        return 0
+    import models
+    if not await asyncio.to_thread(models.add_usage, rows):
+        ledger.restore_pending(rows)
+        return 0
+    return len(rows)
+
+
+async def flush_loop():
+    while True:
+        await asyncio.sleep(flush_seconds)
+        flushed = await flush()
+        if flushed:
+            logger.debug("Flushed %d usage rows", flushed, extra={"stage": "usage", "count": flushed})
+
+
+async def summary(days=None, top_users=5):
+    """Usage report data: from llm_usage for the last `days` days, else this process since start
+
+    "days" in the result says which one it is (None for this process).
+    """
+    if days and _shared_database:
+        await flush()
+        import models
+        found = await asyncio.to_thread(models.get_usage_summary, days, top_users)
+        if found is not None:
+            return dict(found, days=days)
+    found = ledger.summary(top_users) if ledger is not None else {"models": [], "users": []}
+    return dict(found, days=None)